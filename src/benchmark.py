@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+"""
+Latency benchmark and CPU tuner of the policy-value net evaluation
+
+Reports the per-call latency of policy_value_fn (batch 1, as called by MCTS)
+and of policy_value on a batch, with and without the inference fast path.
+With --tune, measures inference throughput over a grid of thread counts and
+batch sizes and saves the best setting to CPU_CONFIG_FILE, which
+PolicyValueNet applies when it is built.
+
+"""
+
+from __future__ import print_function
+import json
+import multiprocessing
+import time
+import numpy as np
+import torch
+from game import Board
+from policy_value_net_pytorch import PolicyValueNet, CPU_CONFIG_FILE
+
+
+def sample_boards(width, height, n_in_row, n_boards, n_moves=20):
+    """Random mid-game positions to evaluate."""
+    boards = []
+    for i in range(n_boards):
+        board = Board(width=width, height=height, n_in_row=n_in_row)
+        board.init_board()
+        for move in np.random.permutation(board.availables)[:n_moves]:
+            board.do_move(move)
+        boards.append(board)
+    return boards
+
+
+def time_per_call(fn, args, n_calls, repeat=3):
+    """Mean wall time of fn(arg) in milliseconds, cycling through args.
+    The best of repeat runs is kept to filter out noise from other processes.
+    """
+    fn(args[0])  # warm up
+    best = None
+    for r in range(repeat):
+        start = time.time()
+        for i in range(n_calls):
+            fn(args[i % len(args)])
+        elapsed = 1000.0 * (time.time() - start) / n_calls
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def benchmark_inference(policy_value_net, batch_size=64, n_calls=200):
+    """Return {(mode, batch): ms per call} for the legacy and the inference
+    path of policy_value_net.
+    """
+    boards = sample_boards(policy_value_net.board_width,
+                           policy_value_net.board_height, 6, 16)
+    states = [board.current_state() for board in boards]
+    batches = [[states[(i + j) % len(states)] for j in range(batch_size)]
+               for i in range(len(states))]
+    inference = policy_value_net.inference
+    results = {}
+    for mode in [False, True]:
+        policy_value_net.set_inference(mode)
+        name = "inference" if mode else "legacy"
+        results[(name, 1)] = time_per_call(
+            lambda board: list(policy_value_net.policy_value_fn(board)[0]),
+            boards, n_calls)
+        results[(name, batch_size)] = time_per_call(
+            policy_value_net.policy_value, batches, max(1, n_calls // 10))
+    policy_value_net.set_inference(inference)
+    return results
+
+
+def _measure_threads(args):
+    """Throughput of every batch size under one thread setting, measured
+    in a fresh process since the inter-op thread count can only be set once.
+    Return: [(batch size, positions per second)]
+    """
+    (model_file, width, height, num_threads, num_interop_threads,
+     batch_sizes, n_calls) = args
+    torch.set_num_interop_threads(num_interop_threads)
+    torch.set_num_threads(num_threads)
+    torch.set_flush_denormal(True)
+    net = PolicyValueNet(width, height, model_file=model_file,
+                         inference=True, cpu_config=None)
+    states = [board.current_state()
+              for board in sample_boards(width, height, 6, 16)]
+    results = []
+    for batch in batch_sizes:
+        batches = [[states[(i + j) % len(states)] for j in range(batch)]
+                   for i in range(len(states))]
+        ms = time_per_call(net.policy_value, batches,
+                           max(2, n_calls // batch))
+        results.append((batch, 1000.0 * batch / ms))
+    return results
+
+
+def tune(model_file, width, height, n_workers=1, batch_size=1,
+         batch_sizes=(1, 8, 16, 32, 64, 128), n_calls=256,
+         config_file=CPU_CONFIG_FILE):
+    """Benchmark the model over thread counts (up to the cores available to
+    each of n_workers processes) and batch sizes, save the setting to
+    config_file and return it.
+    batch_size: the batch size the player evaluates with (1 for MCTS, which
+        calls policy_value_fn one position at a time). The thread counts are
+        the fastest at this batch size, and the batch size saved for large
+        policy_value calls is the fastest under those thread counts. The
+        fastest thread counts of every batch size are saved as well.
+    """
+    batch_sizes = sorted(set(batch_sizes) | {batch_size})
+    cores = max(1, multiprocessing.cpu_count() // n_workers)
+    thread_grid = sorted(set([1, 2, 4, 8, 16, cores]) & set(range(1, cores + 1)))
+    configs = [(model_file, width, height, threads, interop,
+                list(batch_sizes), n_calls)
+               for threads in thread_grid for interop in (1, 2)]
+    ctx = multiprocessing.get_context("spawn")
+    workers = ctx.Pool(1, maxtasksperchild=1)
+    try:
+        measurements = workers.map(_measure_threads, configs, chunksize=1)
+    finally:
+        workers.terminate()
+    table = []
+    per_batch = {}
+    for config, results in zip(configs, measurements):
+        for batch, rate in results:
+            table.append({"num_threads": config[3],
+                          "num_interop_threads": config[4],
+                          "batch_size": batch, "positions_per_sec": rate})
+            if (batch not in per_batch or
+                    rate > per_batch[batch]["positions_per_sec"]):
+                per_batch[batch] = table[-1]
+    threads = (per_batch[batch_size]["num_threads"],
+               per_batch[batch_size]["num_interop_threads"])
+    best = max((row for row in table
+                if (row["num_threads"], row["num_interop_threads"]) == threads),
+               key=lambda row: row["positions_per_sec"])
+    config = dict(best, flush_denormal=True, n_workers=n_workers,
+                  tuned_batch_size=batch_size,
+                  best_per_batch=[per_batch[batch] for batch in batch_sizes],
+                  measurements=table)
+    with open(config_file, "w") as f:
+        json.dump(config, f, indent=2)
+    return config
+
+
+def usage():
+    print("-s Thiết lập kích thước bàn cờ, mặc định là 10")
+    print("-i File mô hình cần đo, mặc định là model/10_10_6_best_policy_3.model")
+    print("-b Kích thước batch lớn, mặc định là 64")
+    print("-n Số lần gọi cho mỗi phép đo, mặc định là 200")
+    print("--tune Dò số luồng CPU và kích thước batch tốt nhất, lưu vào " + CPU_CONFIG_FILE)
+    print("--workers Số tiến trình sẽ chạy song song trên máy khi dò, mặc định là 1")
+    print("--tune_batch Kích thước batch mà người chơi dùng khi dò số luồng, mặc định là 1 (MCTS)")
+
+
+if __name__ == '__main__':
+    import sys, getopt
+
+    width = height = 10
+    model_file = "model/10_10_6_best_policy_3.model"
+    batch_size = 64
+    n_calls = 200
+    tune_cpu = False
+    n_workers = 1
+    tune_batch = 1
+
+    opts, args = getopt.getopt(sys.argv[1:], "hs:i:b:n:",
+                               ["tune", "workers=", "tune_batch="])
+    for op, value in opts:
+        if op == "-h":
+            usage()
+            sys.exit()
+        elif op == "-s":
+            height = width = int(value)
+        elif op == "-i":
+            model_file = value
+        elif op == "-b":
+            batch_size = int(value)
+        elif op == "-n":
+            n_calls = int(value)
+        elif op == "--tune":
+            tune_cpu = True
+        elif op == "--workers":
+            n_workers = int(value)
+        elif op == "--tune_batch":
+            tune_batch = int(value)
+
+    if tune_cpu:
+        config = tune(model_file, width, height, n_workers, tune_batch)
+        for row in config["measurements"]:
+            print("threads {num_threads:2d} interop {num_interop_threads} "
+                  "batch {batch_size:3d}: {positions_per_sec:.0f} "
+                  "positions/s".format(**row))
+        for row in config["best_per_batch"]:
+            print("best for batch {batch_size:3d}: threads {num_threads}, "
+                  "interop {num_interop_threads}".format(**row))
+        print("Saved to {}: threads {}, interop {} (for batch {}), "
+              "batch {}".format(
+                  CPU_CONFIG_FILE, config["num_threads"],
+                  config["num_interop_threads"], tune_batch,
+                  config["batch_size"]))
+        sys.exit()
+
+    net = PolicyValueNet(width, height, model_file=model_file)
+    results = benchmark_inference(net, batch_size, n_calls)
+    for batch in [1, batch_size]:
+        legacy = results[("legacy", batch)]
+        fast = results[("inference", batch)]
+        print("batch {:3d}: legacy {:.3f} ms, inference {:.3f} ms "
+              "({:.2f}x)".format(batch, legacy, fast, legacy / fast))
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+Distillation of the policy-value net into a 3x3 pattern rollout policy
+
+Every empty point of the training positions is reduced to its 3x3 pattern
+(see mcts_rollout.PatternPolicy), and each pattern is weighted by how much
+more probability the teacher gives such points than a uniform policy would.
+The teacher is either the PolicyValueNet priors or the MCTS visit
+distributions stored with the replay data.
+
+"""
+
+from __future__ import print_function
+import time
+import numpy as np
+from game import Board, Game
+from mcts_pure import MCTSPlayer as MCTS_Pure
+from mcts_rollout import OFF_BOARD, PatternPolicy, neighbour_table
+
+
+def distill(states, teacher_probs, board_width, board_height, alpha=1.0):
+    """Fit a PatternPolicy to the teacher.
+    states: (n, 4, width, height) network inputs (Board.current_state())
+    teacher_probs: (n, width*height) move distributions for those states,
+        e.g. PolicyValueNet.policy_value(states)[0] or the mcts_probs of the
+        replay data
+    alpha: pseudo-count pulling rare patterns towards the uniform weight 1
+    """
+    states = np.asarray(states)
+    teacher_probs = np.asarray(teacher_probs, dtype=np.float64)
+    size = board_width * board_height
+    # planes 0/1 hold the current player's and the opponent's stones,
+    # flipped vertically
+    stones = states[:, 0, ::-1, :] + 2 * states[:, 1, ::-1, :]
+    cells = np.full((len(states), size + 1), OFF_BOARD, dtype=np.int8)
+    cells[:, :size] = stones.reshape(len(states), size)
+    codes = PatternPolicy.codes(cells, 1,
+                                neighbour_table(board_width, board_height))
+    empty = cells[:, :size] == 0
+    # teacher probability relative to uniform over the empty points
+    n_empty = empty.sum(axis=1, keepdims=True)
+    ratio = teacher_probs * n_empty
+    total = np.bincount(codes[empty], weights=ratio[empty],
+                        minlength=PatternPolicy.n_patterns)
+    count = np.bincount(codes[empty], minlength=PatternPolicy.n_patterns)
+    return PatternPolicy((total + alpha) / (count + alpha))
+
+
+def playout_rate(player, board_width, board_height, n_in_row, n_playout=200):
+    """Playouts per second of a pure MCTS player from the empty board."""
+    board = Board(width=board_width, height=board_height, n_in_row=n_in_row)
+    board.init_board()
+    player.mcts._n_playout = n_playout
+    start = time.time()
+    player.mcts.get_move(board)
+    player.reset_player()
+    return n_playout / (time.time() - start)
+
+
+def compare(policy, board_width, board_height, n_in_row,
+            seconds_per_move=1.0, n_games=4):
+    """Play pure MCTS with pattern rollouts against pure MCTS with random
+    rollouts, both given the same CPU time per move (converted to a number
+    of playouts from their measured playout rates).
+    Return: the win ratio of the pattern player (a tie counts half), its
+    standard error over the games, and both playout rates
+    """
+    pattern_player = MCTS_Pure(n_rollout=1, rollout_policy=policy)
+    random_player = MCTS_Pure(n_rollout=1)
+    rates = []
+    for player in (pattern_player, random_player):
+        rate = playout_rate(player, board_width, board_height, n_in_row)
+        player.mcts._n_playout = max(1, int(rate * seconds_per_move))
+        rates.append(rate)
+    game = Game(Board(width=board_width, height=board_height,
+                      n_in_row=n_in_row))
+    scores = np.zeros(n_games)
+    for i in range(n_games):
+        winner = game.start_play(pattern_player, random_player,
+                                 start_player=i % 2, is_shown=0)
+        scores[i] = {1: 1.0, -1: 0.5}.get(winner, 0.0)
+    std_err = scores.std(ddof=1) / np.sqrt(n_games) if n_games > 1 else 0.0
+    return scores.mean(), std_err, rates[0], rates[1]
+
+
+def usage():
+    print("-s Thiết lập kích thước bàn cờ, mặc định là 10")
+    print("-r Thiết lập số quân liên tiếp để thắng, mặc định là 6")
+    print("-i Mô hình thầy (.model), mặc định là model/10_10_6_best_policy_3.model")
+    print("-o File bảng mẫu đầu ra (.npy), mặc định là model/10_10_6_rollout_patterns.npy")
+    print("-g Số ván tự chơi dùng để lấy dữ liệu, mặc định là 20")
+    print("-c Số ván so sánh với rollout ngẫu nhiên (cùng thời gian CPU mỗi nước), mặc định là 0")
+    print("-t Số giây CPU mỗi nước khi so sánh, mặc định là 1.0")
+
+
+if __name__ == '__main__':
+    import sys, getopt
+    from policy_value_net_pytorch import PolicyValueNet
+    from policy_value_engine import collect_states
+
+    width = height = 10
+    n_in_row = 6
+    model_file = "model/10_10_6_best_policy_3.model"
+    output_file = "model/10_10_6_rollout_patterns.npy"
+    n_games = 20
+    n_compare = 0
+    seconds_per_move = 1.0
+
+    opts, args = getopt.getopt(sys.argv[1:], "hs:r:i:o:g:c:t:")
+    for op, value in opts:
+        if op == "-h":
+            usage()
+            sys.exit()
+        elif op == "-s":
+            height = width = int(value)
+        elif op == "-r":
+            n_in_row = int(value)
+        elif op == "-i":
+            model_file = value
+        elif op == "-o":
+            output_file = value
+        elif op == "-g":
+            n_games = int(value)
+        elif op == "-c":
+            n_compare = int(value)
+        elif op == "-t":
+            seconds_per_move = float(value)
+
+    teacher = PolicyValueNet(width, height, model_file=model_file,
+                             inference=True)
+    states = collect_states(teacher.policy_value_fn, width, height, n_in_row,
+                            n_games=n_games)
+    teacher_probs, _ = teacher.policy_value(states)
+    policy = distill(states, teacher_probs, width, height)
+    policy.save(output_file)
+    print("Distilled {} positions into {}".format(len(states), output_file))
+    if n_compare:
+        win_ratio, std_err, pattern_rate, random_rate = compare(
+            policy, width, height, n_in_row, seconds_per_move, n_compare)
+        print("pattern rollouts: {:.0f} playouts/s, random rollouts: {:.0f} "
+              "playouts/s, pattern win ratio at equal time: {:.2f} +- {:.2f} "
+              "over {} games".format(pattern_rate, random_rate, win_ratio,
+                                     std_err, n_compare))
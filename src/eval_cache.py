@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""
+A bounded LRU cache of policy-value network evaluations
+
+Positions are keyed by their canonical form under the symmetries of the
+board (the 8 rotations and reflections of a square board, 4 otherwise), so
+that transposed move orders and symmetric openings share one entry. The
+priors are stored in the canonical orientation and mapped back to the
+orientation of the queried board on a hit.
+
+"""
+
+from collections import OrderedDict
+import numpy as np
+
+
+class EvalCache(object):
+    """LRU cache from canonical positions to (move priors, value)."""
+
+    def __init__(self, capacity=100000):
+        self.capacity = capacity
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _symmetries(width, height):
+        """(k, flip) pairs: rotate by k*90 degrees after an optional
+        left-right flip. Only rotations by 180 degrees keep the shape of a
+        non-square board.
+        """
+        ks = [0, 1, 2, 3] if width == height else [0, 2]
+        return [(k, flip) for k in ks for flip in (False, True)]
+
+    @staticmethod
+    def _transform(x, k, flip):
+        if flip:
+            x = x[..., ::-1]
+        return np.rot90(x, k, axes=(-2, -1))
+
+    @staticmethod
+    def _inverse(x, k, flip):
+        x = np.rot90(x, -k, axes=(-2, -1))
+        if flip:
+            x = x[..., ::-1]
+        return x
+
+    @staticmethod
+    def planes(board):
+        """The board features fed to the net (see Board.current_state), as
+        int8 planes indexed by [h, w] of the move h*width+w.
+        """
+        planes = np.zeros((4, board.height, board.width), dtype=np.int8)
+        for move, player in board.states.items():
+            h, w = divmod(move, board.width)
+            planes[0 if player == board.current_player else 1, h, w] = 1
+        for move in board.last_moves:
+            planes[2][divmod(move, board.width)] = 1
+        for move in board.curr_moves:
+            planes[3][divmod(move, board.width)] = 1
+        return planes
+
+    @classmethod
+    def canonical(cls, board):
+        """Return the canonical key of the board and the symmetry that maps
+        the board onto it.
+        """
+        planes = cls.planes(board)
+        best = None
+        for k, flip in cls._symmetries(board.width, board.height):
+            key = cls._transform(planes, k, flip).tobytes()
+            if best is None or key < best[0]:
+                best = (key, (k, flip))
+        return best
+
+    def lookup(self, board):
+        """Return (hit, key, sym). hit is (move priors over the whole board,
+        value) for the board, or None on a miss; key and sym are passed to
+        store() after a miss.
+        """
+        key, sym = self.canonical(board)
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None, key, sym
+        self.hits += 1
+        self._entries.move_to_end(key)
+        priors, value = entry
+        priors = self._inverse(priors, *sym).reshape(-1)
+        return (priors, value), key, sym
+
+    def store(self, board, key, sym, act_probs, value):
+        """Cache the evaluation act_probs (over all moves) and value of the
+        board, whose canonical key and symmetry came from lookup().
+        """
+        priors = act_probs.reshape(board.height, board.width)
+        priors = np.ascontiguousarray(self._transform(priors, *sym))
+        self._entries[key] = (priors, value)
+        if len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every entry, e.g. when the network weights change."""
+        self._entries.clear()
+
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return 1.0 * self.hits / lookups if lookups else 0.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __str__(self):
+        return "eval cache: {} entries, hit ratio {:.3f} ({}/{})".format(
+            len(self), self.hit_ratio(), self.hits, self.hits + self.misses)
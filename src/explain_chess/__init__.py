@@ -1,3 +1,33 @@
-from .fen_to_features import extract_features, parse_connect6_fen
-from .init_data import process_fen_file, process_connect6_fen_file
-from .shap_explain import explain
\ No newline at end of file
+import importlib
+
+# Các hàm công khai và module chứa chúng. Module chỉ được import khi tên được
+# dùng lần đầu, để các phần nhẹ (feature_store, feature_sink) không kéo theo
+# shap, sklearn, imblearn hay chess.
+_EXPORTS = {
+    "extract_features": "fen_to_features",
+    "extract_features_batch": "fen_to_features",
+    "parse_connect6_fen": "fen_to_features",
+    "parse_connect6_fens": "fen_to_features",
+    "parse_connect6_boards": "fen_to_features",
+    "parse_connect6_fens_incremental": "fen_to_features",
+    "Connect6GameFeatures": "fen_to_features",
+    "save_features": "feature_store",
+    "load_features": "feature_store",
+    "SelfPlayFeatureSink": "feature_sink",
+    "EnginePool": "engine_pool",
+    "make_limit": "engine_pool",
+    "Connect6Dedup": "dedup",
+    "process_fen_file": "init_data",
+    "process_connect6_fen_file": "init_data",
+    "explain": "shap_explain",
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+    value = getattr(importlib.import_module("." + _EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import os
+import pickle
+import shutil
+
+ARTIFACT_CACHE_DIR = "data/cache"
+
+
+def file_digest(path):
+    """SHA-256 của nội dung một file, hoặc của mọi file trong một thư mục (ví dụ feature store)."""
+    digest = hashlib.sha256()
+    if os.path.isdir(path):
+        files = sorted(os.path.join(root, name) for root, _, names in os.walk(path) for name in names)
+    else:
+        files = [path]
+    for file_name in files:
+        digest.update(os.path.relpath(file_name, path).encode("utf-8"))
+        with open(file_name, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def artifact_key(*parts):
+    """Khóa của một bước: hash của khóa bước trước và các tham số của bước này."""
+    text = json.dumps(parts, sort_keys=True, default=str)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class ArtifactCache(object):
+    """
+    Cache trên đĩa cho kết quả từng bước của pipeline giải thích, định danh bằng
+    hash của dữ liệu vào và tham số (artifact_key). Mỗi bước dùng khóa của bước
+    trước làm một phần khóa của mình, nên đổi một bước chỉ tính lại các bước sau.
+    """
+
+    def __init__(self, root=ARTIFACT_CACHE_DIR):
+        self.root = root
+
+    def path(self, stage, key, suffix=".pkl"):
+        return os.path.join(self.root, stage, key + suffix)
+
+    def _write(self, path, write):
+        # ghi ra file tạm rồi đổi tên để không bao giờ đọc phải artifact ghi dở
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        write(tmp_path)
+        os.replace(tmp_path, path)
+
+    def cached(self, stage, key, compute, outputs=()):
+        """
+        Trả về kết quả của compute() cho bước stage với khóa key, lấy từ cache nếu có.
+        outputs: các file do compute() ghi ra, được lưu cùng artifact và chép lại
+        đúng chỗ khi lấy từ cache.
+        """
+        path = self.path(stage, key)
+        saved_outputs = [self.path(stage, key, "." + os.path.basename(output)) for output in outputs]
+        if os.path.exists(path) and all(os.path.exists(saved) for saved in saved_outputs):
+            print(f"{stage}: cache hit ({key[:12]})")
+            for output, saved in zip(outputs, saved_outputs):
+                shutil.copyfile(saved, output)
+            with open(path, "rb") as f:
+                return pickle.load(f)
+
+        value = compute()
+        for output, saved in zip(outputs, saved_outputs):
+            self._write(saved, lambda tmp_path: shutil.copyfile(output, tmp_path))
+
+        def dump(tmp_path):
+            with open(tmp_path, "wb") as f:
+                pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        self._write(path, dump)
+        return value
+
+    def clear(self, stage=None):
+        shutil.rmtree(self.root if stage is None else os.path.join(self.root, stage), ignore_errors=True)
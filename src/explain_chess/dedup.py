@@ -0,0 +1,44 @@
+import numpy as np
+
+from .feature_store import CONNECT6_SCHEMA, cast_columns
+
+
+class Connect6Dedup(object):
+    """
+    Loại các dòng đặc trưng trùng nhau trong các khối liên tiếp, chỉ giữ lần xuất
+    hiện đầu tiên và đếm số lần xuất hiện làm trọng số mẫu.
+
+    Hai dòng chỉ được gộp khi mọi cột (kể cả nhãn next_move) đều bằng nhau. Các
+    thế cờ đối xứng qua phép xoay/lật không được gộp: last_move_position và các
+    cột đếm đường theo thứ tự quét đổi theo hướng bàn cờ, nên gộp chúng sẽ gán
+    trọng số của cả nhóm cho đặc trưng của một hướng duy nhất.
+    """
+
+    def __init__(self, schema=CONNECT6_SCHEMA):
+        self.schema = schema
+        self._index = {}
+        self.counts = []
+        self.n_seen = 0
+
+    def filter(self, columns):
+        """Trả về các dòng của columns (dict tên cột: mảng) chưa gặp trước đó, đã ép kiểu theo schema."""
+        typed = cast_columns(columns, self.schema)
+        rows = np.ascontiguousarray(np.stack(
+            [typed[name].astype(np.int64) for name, _ in self.schema], axis=1))
+        keep = np.ones(len(rows), dtype=bool)
+        for i, row in enumerate(rows):
+            key = row.tobytes()
+            j = self._index.get(key)
+            if j is None:
+                self._index[key] = len(self.counts)
+                self.counts.append(1)
+            else:
+                self.counts[j] += 1
+                keep[i] = False
+        self.n_seen += len(rows)
+        return {name: values[keep] for name, values in typed.items()}
+
+    @property
+    def weights(self):
+        """Số lần xuất hiện của từng dòng được giữ lại, theo thứ tự giữ lại."""
+        return np.array(self.counts, dtype=np.int32)
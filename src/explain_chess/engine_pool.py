@@ -0,0 +1,139 @@
+import json
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import chess
+import chess.engine
+
+ENGINE_PATH = "engine/lc0.exe"
+MATE_SCORE = 10000
+
+
+def make_limit(depth=None, nodes=None, time=None):
+    """Giới hạn phân tích của engine; mặc định 5 giây mỗi thế cờ như get_best_move cũ."""
+    if depth is None and nodes is None and time is None:
+        time = 5
+    return chess.engine.Limit(time=time, depth=depth, nodes=nodes)
+
+
+def _limit_key(limit):
+    return json.dumps({"time": limit.time, "depth": limit.depth, "nodes": limit.nodes}, sort_keys=True)
+
+
+class EnginePool(object):
+    """
+    Một nhóm n_engines tiến trình UCI chạy suốt quá trình gán nhãn, thay vì mở
+    một tiến trình mới cho mỗi FEN. Các thế cờ được phân tích song song (mỗi
+    engine chỉ phục vụ một thế cờ tại một thời điểm) và điểm số được lưu trong
+    cache theo FEN, có thể ghi ra cache_path để dùng lại ở lần chạy sau với
+    cùng giới hạn phân tích.
+    """
+
+    def __init__(self, engine_path=ENGINE_PATH, n_engines=1, limit=None, cache_path=None):
+        self.engine_path = engine_path
+        self.limit = limit if limit is not None else make_limit()
+        self.cache_path = cache_path
+        self.cache = self._load_cache()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._idle = queue.Queue()
+        self._engines = []
+        try:
+            for _ in range(n_engines):
+                engine = chess.engine.SimpleEngine.popen_uci(engine_path)
+                self._engines.append(engine)
+                self._idle.put(engine)
+        except Exception:
+            self.close()
+            raise
+        self._executor = ThreadPoolExecutor(n_engines)
+
+    def _load_cache(self):
+        if self.cache_path is None or not os.path.exists(self.cache_path):
+            return {}
+        with open(self.cache_path) as f:
+            saved = json.load(f)
+        # điểm số tính với giới hạn khác không dùng lại được
+        if saved.get("limit") != _limit_key(self.limit):
+            return {}
+        return saved["scores"]
+
+    def save_cache(self):
+        if self.cache_path is None:
+            return
+        tmp_path = self.cache_path + ".tmp"
+        with self._lock:
+            data = {"limit": _limit_key(self.limit), "scores": dict(self.cache)}
+        with open(tmp_path, "w") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.cache_path)
+
+    def _restart(self, engine):
+        """Thay một engine đã chết bằng một tiến trình mới."""
+        try:
+            engine.quit()
+        except Exception:
+            pass
+        new_engine = chess.engine.SimpleEngine.popen_uci(self.engine_path)
+        with self._lock:
+            self._engines[self._engines.index(engine)] = new_engine
+        return new_engine
+
+    def score(self, fen):
+        """
+        Điểm đánh giá (centipawn) của thế cờ theo góc nhìn bên đang đi, chiếu hết
+        tính là +-MATE_SCORE. Thế cờ đã kết thúc được chấm trực tiếp, không cần engine.
+        """
+        with self._lock:
+            if fen in self.cache:
+                self.hits += 1
+                return self.cache[fen]
+            self.misses += 1
+        board = chess.Board(fen)
+        if board.is_game_over():
+            result = board.result()
+            score = 0 if result == "1/2-1/2" else -MATE_SCORE
+        else:
+            engine = self._idle.get()
+            try:
+                try:
+                    analysis = engine.analyse(board, self.limit)
+                except chess.engine.EngineTerminatedError:
+                    engine = self._restart(engine)
+                    analysis = engine.analyse(board, self.limit)
+            finally:
+                self._idle.put(engine)
+            score = analysis["score"].relative.score(mate_score=MATE_SCORE)
+        with self._lock:
+            self.cache[fen] = score
+        return score
+
+    def scores(self, fens):
+        """Điểm của các FEN (theo đúng thứ tự), phân tích song song trên các engine."""
+        return list(self._executor.map(self.score, fens))
+
+    def close(self):
+        executor = getattr(self, "_executor", None)
+        if executor is not None:
+            executor.shutdown(wait=True)
+            self._executor = None
+        for engine in self._engines:
+            try:
+                engine.quit()
+            except Exception:
+                pass
+        self._engines = []
+        self.save_cache()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __str__(self):
+        total = self.hits + self.misses
+        return "engine cache: {} positions, {} hits / {} lookups".format(len(self.cache), self.hits, total)
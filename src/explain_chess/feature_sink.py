@@ -0,0 +1,66 @@
+import numpy as np
+import pandas as pd
+
+from .feature_store import CONNECT6_SCHEMA, FEATURE_STORE_PATH, FeatureStoreWriter
+from .fen_to_features import CONNECT6_COLUMNS, Connect6GameFeatures
+
+
+class SelfPlayFeatureSink(object):
+    """
+    Nhận đặc trưng giải thích trực tiếp từ Board trong lúc tự chơi (xem
+    Game.start_self_play), thay cho việc ghi FEN ra fen.csv rồi phân tích lại.
+    Mỗi dòng giống hệt dòng mà process_connect6_fen_file tạo từ FEN tương ứng.
+    Các dòng được giữ trong bộ đệm và ghi theo khối buffer_size dòng vào
+    feature store, hoặc vào CSV nếu output_path có đuôi .csv.
+    """
+
+    def __init__(self, output_path=FEATURE_STORE_PATH, buffer_size=10000):
+        self.output_path = output_path
+        self.buffer_size = buffer_size
+        self.n_rows = 0
+        self.n_games = 0
+        self._extractor = Connect6GameFeatures()
+        self._rows = []
+        self._as_csv = output_path.endswith(".csv")
+        if self._as_csv:
+            self._file = open(output_path, mode='w', newline='')
+        else:
+            self._file = FeatureStoreWriter(output_path, CONNECT6_SCHEMA)
+
+    def add(self, board, move):
+        """Ghi nhận thế cờ board ngay trước khi đi move (board đã có ít nhất một quân)."""
+        self._rows.append(self._extractor.update_board(board, move))
+        if len(self._rows) >= self.buffer_size:
+            self.flush()
+
+    def end_game(self):
+        """Kết thúc một ván (tương ứng dòng '======' của fen.csv)."""
+        self._extractor.reset()
+        self.n_games += 1
+
+    def flush(self):
+        if not self._rows:
+            return
+        columns = {name: [row[name] for row in self._rows] for name in CONNECT6_COLUMNS}
+        if self._as_csv:
+            # cùng định dạng với process_connect6_fen_file: chỉ số 0 cho mọi dòng
+            features_df = pd.DataFrame(columns, index=np.zeros(len(self._rows), dtype=np.int64))
+            self._file.write(features_df.to_csv(header=self.n_rows == 0, index=True))
+        else:
+            self._file.append(columns)
+        self.n_rows += len(self._rows)
+        self._rows = []
+
+    def close(self):
+        if self._file is None:
+            return
+        self.flush()
+        self._file.close()
+        self._file = None
+        print(f"Saved {self.n_rows} rows from {self.n_games} games to {self.output_path}.")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,128 @@
+import json
+import os
+
+import numpy as np
+
+# Kiểu dữ liệu của từng cột đặc trưng Connect6 (theo thứ tự CONNECT6_COLUMNS)
+CONNECT6_SCHEMA = [
+    ("next_turn", "int8"),
+    ("move_count", "int16"),
+    ("last_move_player", "int8"),
+    ("last_move_position", "int8"),
+    ("line_counts_competitor_2", "int8"),
+    ("line_counts_competitor_3", "int8"),
+    ("line_counts_competitor_4", "int8"),
+    ("line_counts_competitor_5", "int8"),
+    ("line_counts_player_2", "int8"),
+    ("line_counts_player_3", "int8"),
+    ("line_counts_player_4", "int8"),
+    ("line_counts_player_5", "int8"),
+    ("next_move", "int8"),
+]
+SCHEMA_FILE = "schema.json"
+FEATURE_STORE_PATH = "data/connect6_features"
+
+
+def cast_columns(columns, schema=CONNECT6_SCHEMA):
+    """
+    Ép các cột (dict tên cột: mảng) về kiểu trong schema.
+    Báo lỗi nếu có giá trị vượt khỏi miền của kiểu đó thay vì để bị tràn số.
+    """
+    typed = {}
+    for name, dtype in schema:
+        values = np.asarray(columns[name])
+        if values.dtype == object or values.dtype.kind in "US":
+            # last_move_position của parse_connect6_fen là chuỗi
+            values = values.astype(np.int64)
+        info = np.iinfo(dtype)
+        if len(values) and (values.min() < info.min or values.max() > info.max):
+            raise ValueError("column {} does not fit in {}".format(name, dtype))
+        typed[name] = values.astype(dtype, copy=False)
+    return typed
+
+
+class FeatureStoreWriter(object):
+    """
+    Ghi bảng đặc trưng dạng cột vào thư mục path: mỗi cột là một file nhị phân
+    thô <tên cột>.bin, cùng schema.json (tên, kiểu, số dòng) được ghi khi đóng.
+    Các khối được nối thêm vào cuối nên có thể ghi theo luồng.
+    """
+
+    def __init__(self, path, schema=CONNECT6_SCHEMA):
+        self.path = path
+        self.schema = schema
+        self.n_rows = 0
+        os.makedirs(path, exist_ok=True)
+        # xóa schema cũ trước để một store ghi dở không bị đọc nhầm
+        if os.path.exists(os.path.join(path, SCHEMA_FILE)):
+            os.remove(os.path.join(path, SCHEMA_FILE))
+        self._files = {name: open(os.path.join(path, name + ".bin"), "wb")
+                       for name, _ in schema}
+
+    def append(self, columns):
+        typed = cast_columns(columns, self.schema)
+        n_rows = {len(values) for values in typed.values()}
+        if len(n_rows) > 1:
+            raise ValueError("columns have different lengths")
+        for name, values in typed.items():
+            self._files[name].write(np.ascontiguousarray(values).tobytes())
+        self.n_rows += n_rows.pop() if n_rows else 0
+
+    def add_column(self, name, values, dtype):
+        """Ghi thêm một cột đầy đủ (ví dụ trọng số mẫu chỉ biết khi đã đọc hết dữ liệu)."""
+        values = cast_columns({name: values}, [(name, dtype)])[name]
+        if len(values) != self.n_rows:
+            raise ValueError("column {} has {} rows, expected {}".format(name, len(values), self.n_rows))
+        with open(os.path.join(self.path, name + ".bin"), "wb") as f:
+            f.write(np.ascontiguousarray(values).tobytes())
+        self.schema = list(self.schema) + [(name, dtype)]
+
+    def close(self, complete=True):
+        """Đóng các file cột; schema.json chỉ được ghi nếu complete."""
+        if self._files is None:
+            return
+        for f in self._files.values():
+            f.close()
+        self._files = None
+        if not complete:
+            return
+        with open(os.path.join(self.path, SCHEMA_FILE), "w") as f:
+            json.dump({"n_rows": self.n_rows,
+                       "columns": [[name, dtype] for name, dtype in self.schema]}, f)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        # store ghi dở do lỗi thì không có schema.json, nên không được đọc
+        self.close(complete=exc_type is None)
+
+
+def save_features(path, columns, schema=CONNECT6_SCHEMA):
+    """Ghi một lần toàn bộ các cột (ví dụ kết quả của parse_connect6_fens) vào path."""
+    with FeatureStoreWriter(path, schema) as writer:
+        writer.append(columns)
+    return path
+
+
+def load_features(path):
+    """
+    Đọc store do FeatureStoreWriter ghi, trả về dict tên cột: mảng np.memmap chỉ
+    đọc (không sao chép dữ liệu), theo thứ tự trong schema.
+    """
+    with open(os.path.join(path, SCHEMA_FILE)) as f:
+        schema = json.load(f)
+    n_rows = schema["n_rows"]
+    columns = {}
+    for name, dtype in schema["columns"]:
+        file_name = os.path.join(path, name + ".bin")
+        if n_rows == 0:
+            # np.memmap không ánh xạ được file rỗng
+            columns[name] = np.zeros(0, dtype=dtype)
+        else:
+            columns[name] = np.memmap(file_name, dtype=dtype, mode="r", shape=(n_rows,))
+    return columns
+
+
+def is_feature_store(path):
+    return os.path.isfile(os.path.join(path, SCHEMA_FILE))
@@ -1,5 +1,8 @@
-import chess
-import chess.engine
+try:
+    import chess
+except ImportError:
+    # chess chỉ cần cho các đặc trưng cờ vua; phần Connect6 (và feature_sink) không dùng đến
+    chess = None
 
 
 def get_material_score(board):
@@ -33,6 +36,78 @@ def get_attack_info(board):
     return white_attackers, black_attackers
 
 
+CHESS_COLUMNS = [
+    "material_score_white", "material_score_black", "material_difference",
+    "white_castle_kingside", "white_castle_queenside", "black_castle_kingside", "black_castle_queenside",
+    "pawns_white", "pawns_black", "rook_difference", "queen_difference",
+    "king_attackers_white", "king_attackers_black", "legal_moves_white", "legal_moves_black",
+    "check_moves_white", "check_moves_black", "advantage",
+]
+
+
+def extract_board_features(board):
+    """
+    Giống extract_features nhưng nhận chess.Board đã dựng sẵn và tính mọi đặc
+    trưng trong một lượt: vật chất và số quân đếm trực tiếp trên bitboard, các
+    nước đi hợp lệ chỉ sinh một lần.
+    """
+    piece_values = [(chess.PAWN, 1), (chess.KNIGHT, 3), (chess.BISHOP, 3), (chess.ROOK, 5), (chess.QUEEN, 9)]
+    counts = {(piece_type, color): chess.popcount(board.pieces_mask(piece_type, color))
+              for piece_type in chess.PIECE_TYPES[:-1] for color in chess.COLORS}
+    material_white = sum(value * counts[piece_type, chess.WHITE] for piece_type, value in piece_values)
+    material_black = sum(value * counts[piece_type, chess.BLACK] for piece_type, value in piece_values)
+    n_legal_moves = board.legal_moves.count()
+    is_check = board.is_check()
+    w_attackers, b_attackers = get_attack_info(board)
+
+    return {
+        "material_score_white": material_white,
+        "material_score_black": material_black,
+        "material_difference": material_white - material_black,
+        "white_castle_kingside": int(board.has_kingside_castling_rights(chess.WHITE)),
+        "white_castle_queenside": int(board.has_queenside_castling_rights(chess.WHITE)),
+        "black_castle_kingside": int(board.has_kingside_castling_rights(chess.BLACK)),
+        "black_castle_queenside": int(board.has_queenside_castling_rights(chess.BLACK)),
+        "pawns_white": counts[chess.PAWN, chess.WHITE],
+        "pawns_black": counts[chess.PAWN, chess.BLACK],
+        "rook_difference": counts[chess.ROOK, chess.WHITE] - counts[chess.ROOK, chess.BLACK],
+        "queen_difference": counts[chess.QUEEN, chess.WHITE] - counts[chess.QUEEN, chess.BLACK],
+        "king_attackers_white": w_attackers,
+        "king_attackers_black": b_attackers,
+        "legal_moves_white": n_legal_moves if board.turn else 0,
+        "legal_moves_black": n_legal_moves if not board.turn else 0,
+        "check_moves_white": int(is_check and board.turn),
+        "check_moves_black": int(is_check and not board.turn),
+        "advantage": 0
+    }
+
+
+def extract_features_batch(fens, skip_checkmate=True):
+    """
+    Phiên bản theo lô của extract_features, mỗi FEN chỉ được dựng chess.Board một lần.
+
+    Parameters:
+    - fens: danh sách FEN cờ vua
+    - skip_checkmate: bỏ các thế cờ đã bị chiếu hết (như process_fen_file)
+
+    Returns:
+    - (các FEN được giữ lại, dict {tên cột: list} theo thứ tự CHESS_COLUMNS)
+    """
+    kept = []
+    columns = {name: [] for name in CHESS_COLUMNS}
+    for fen in fens:
+        features = extract_board_features(chess.Board(fen))
+        # chiếu hết: đang bị chiếu và không còn nước đi hợp lệ (như board.is_checkmate(),
+        # nhưng không sinh lại các nước đi)
+        in_check = features["check_moves_white"] or features["check_moves_black"]
+        if skip_checkmate and in_check and not (features["legal_moves_white"] or features["legal_moves_black"]):
+            continue
+        kept.append(fen)
+        for name, value in features.items():
+            columns[name].append(value)
+    return kept, columns
+
+
 def extract_features(fen):
     board = chess.Board(fen)
 
@@ -221,6 +296,365 @@ def check_move(board, move, player):
         return 2
     return 0
 
+# Phiên bản theo lô của parse_connect6_fen: phân tích N chuỗi FEN cùng lúc
+# thành một mảng (N, 10, 10) và tính mọi đặc trưng bằng NumPy, kết quả
+# giống hệt từng dict của parse_connect6_fen.
+CONNECT6_SIZE = 10
+CONNECT6_COLUMNS = [
+    "next_turn", "move_count", "last_move_player", "last_move_position",
+    "line_counts_competitor_2", "line_counts_competitor_3",
+    "line_counts_competitor_4", "line_counts_competitor_5",
+    "line_counts_player_2", "line_counts_player_3",
+    "line_counts_player_4", "line_counts_player_5",
+    "next_move",
+]
+# Mỗi chữ số được đọc riêng lẻ như trong parse_connect6_fen
+_EXPAND_DIGITS = str.maketrans({str(d): '.' * d for d in range(10)})
+_CELL_VALUES = np.zeros(256, dtype=np.int8)
+_CELL_VALUES[ord('b')] = 1
+_CELL_VALUES[ord('w')] = 2
+_VALID_CELLS = np.frombuffer(b'.bw', dtype=np.uint8)
+_DIRECTIONS = [(1, 0), (0, 1), (1, 1), (1, -1)]  # cùng thứ tự với count_lines
+
+
+def _parse_board_slow(board_state):
+    """Phân tích từng ký tự như parse_connect6_fen (dùng cho các FEN không chuẩn)."""
+    board = np.zeros((CONNECT6_SIZE, CONNECT6_SIZE), dtype=np.int8)
+    piece_map = {'w': 2, 'b': 1}
+    for i, row in enumerate(board_state.split('/')):
+        col_idx = 0
+        for char in row:
+            if char.isdigit():
+                col_idx += int(char)
+            elif char in piece_map:
+                board[i, col_idx] = piece_map[char]
+                col_idx += 1
+    return board
+
+
+def parse_connect6_boards(board_states):
+    """
+    Chuyển danh sách phần bàn cờ của FEN (trường đầu tiên) thành mảng (N, 10, 10)
+    với 0: trống, 1: đen, 2: trắng.
+    """
+    n = len(board_states)
+    row_len = CONNECT6_SIZE + 1
+    # Vòng lặp gốc đọc "10" thành 1 ô trống rồi để trống phần còn lại của hàng,
+    # nên một hàng "10" là 10 ô trống. Hàng nào sau khi mở rộng không đủ đúng
+    # 10 ô thì được đọc lại bằng _parse_board_slow.
+    expanded = [(state.replace('10', '.' * CONNECT6_SIZE) + '/').translate(_EXPAND_DIGITS)
+                for state in board_states]
+    fast = np.array([len(e) == CONNECT6_SIZE * row_len for e in expanded], dtype=bool)
+    raw = np.frombuffer(''.join(e for e, ok in zip(expanded, fast) if ok).encode('ascii'),
+                        dtype=np.uint8).reshape(-1, CONNECT6_SIZE, row_len)
+    # Mỗi hàng phải đúng 10 ô '.', 'b', 'w' rồi tới '/', nếu không thì đọc chậm
+    valid = (raw[:, :, -1] == ord('/')).all(axis=1) & \
+        np.isin(raw[:, :, :-1], _VALID_CELLS).all(axis=(1, 2))
+    boards = np.zeros((n, CONNECT6_SIZE, CONNECT6_SIZE), dtype=np.int8)
+    fast_idx = np.flatnonzero(fast)
+    boards[fast_idx[valid]] = _CELL_VALUES[raw[valid, :, :-1]]
+    fast[fast_idx[~valid]] = False
+    for i in np.flatnonzero(~fast):
+        boards[i] = _parse_board_slow(board_states[i])
+    return boards
+
+
+def _shift(mask, dr, dc):
+    """out[:, r, c] = mask[:, r + dr, c + dc], False khi ra ngoài bàn cờ."""
+    out = np.zeros_like(mask)
+    h, w = mask.shape[1:]
+    out[:, max(0, -dr):h - max(0, dr), max(0, -dc):w - max(0, dc)] = \
+        mask[:, max(0, dr):h - max(0, -dr), max(0, dc):w - max(0, -dc)]
+    return out
+
+
+def count_lines_batch(boards, players):
+    """
+    Cờ 0/1 của line_counts 2, 3, 4, 5 trong count_lines cho từng bàn cờ.
+
+    count_lines duyệt quân theo thứ tự (hàng, cột, hướng) và đo độ dài đoạn thẳng
+    bắt đầu từ quân đó theo hướng đang xét. Độ dài >= 5 luôn được đếm, còn độ dài
+    k (2..4) chỉ được đếm khi chưa gặp đoạn nào dài hơn k, nên cờ k bằng 1 khi
+    và chỉ khi đoạn đầu tiên có độ dài >= k dài đúng k.
+
+    Parameters:
+    - boards: mảng (N, 10, 10)
+    - players: người chơi cần đếm của từng bàn cờ, mảng (N,)
+
+    Returns:
+    - dict {2, 3, 4, 5: mảng (N,) gồm 0/1}
+    """
+    n = len(boards)
+    mask = boards == np.asarray(players).reshape(-1, 1, 1)
+    runs = []
+    for dr, dc in _DIRECTIONS:
+        run = mask.astype(np.int8)
+        cur = mask
+        for k in range(1, CONNECT6_SIZE):
+            cur = cur & _shift(mask, k * dr, k * dc)
+            if not cur.any():
+                break
+            run += cur
+        runs.append(run)
+    # thứ tự các đoạn giống vòng lặp của count_lines: hàng, cột rồi hướng
+    runs = np.stack(runs, axis=-1).reshape(n, -1)
+    flags = {5: (runs >= 5).any(axis=1).astype(np.int64)}
+    for k in (2, 3, 4):
+        longer = runs >= k
+        first = runs[np.arange(n), longer.argmax(axis=1)]
+        flags[k] = (longer.any(axis=1) & (first == k)).astype(np.int64)
+    return flags
+
+
+def check_move_batch(boards, moves, players):
+    """Phiên bản theo lô của check_move (không thay đổi boards)."""
+    moves = np.asarray(moves)
+    players = np.asarray(players)
+    if ((moves < 0) | (moves >= CONNECT6_SIZE * CONNECT6_SIZE)).any():
+        raise IndexError("move out of the board")
+    n = len(boards)
+    idx = np.arange(n)
+    row, col = np.divmod(moves, CONNECT6_SIZE)
+    creates_4 = np.zeros(n, dtype=bool)
+    blocks_4 = np.zeros(n, dtype=bool)
+    for dr, dc in _DIRECTIONS:
+        for check_player, result in ((players, creates_4), (3 - players, blocks_4)):
+            count = np.ones(n, dtype=np.int64)
+            for d in (-1, 1):
+                running = np.ones(n, dtype=bool)
+                for k in range(1, CONNECT6_SIZE):
+                    r, c = row + dr * d * k, col + dc * d * k
+                    inside = (r >= 0) & (r < CONNECT6_SIZE) & (c >= 0) & (c < CONNECT6_SIZE)
+                    running &= inside
+                    running &= boards[idx, np.where(inside, r, 0), np.where(inside, c, 0)] == check_player
+                    if not running.any():
+                        break
+                    count += running
+            result |= count >= 4
+    return np.where(creates_4, 1, np.where(blocks_4, 2, 0)).astype(np.int64)
+
+
+def parse_connect6_fens(fens):
+    """
+    Phiên bản theo lô của parse_connect6_fen.
+
+    Parameters:
+    - fens: danh sách chuỗi FEN Connect6
+
+    Returns:
+    - dict {tên cột: mảng (N,)} theo thứ tự CONNECT6_COLUMNS, dòng thứ i giống hệt
+      parse_connect6_fen(fens[i]); pd.DataFrame(...) cho bảng đặc trưng
+    """
+    fields = [fen.split() for fen in fens]
+    for parts in fields:
+        if len(parts) != 7:
+            raise ValueError("expected 7 fields in a Connect6 FEN, got {}".format(len(parts)))
+    if not fields:
+        return {name: np.zeros(0, dtype=object if name == "last_move_position" else np.int64)
+                for name in CONNECT6_COLUMNS}
+    board_state, turn, move_count, _, last_move, _, next_move = zip(*fields)
+
+    boards = parse_connect6_boards(board_state)
+    black_next = np.array(turn) == '[b]'
+    move_count = np.array(move_count, dtype=np.int64)
+
+    # count_lines luôn đếm cho quân đen (người chơi 1) ở phía "player"
+    competitor = count_lines_batch(boards, np.where(black_next, 2, 1))
+    player = count_lines_batch(boards, np.ones(len(boards), dtype=np.int8))
+    next_move = np.array([int(m[1:]) for m in next_move], dtype=np.int64)
+
+    columns = {
+        "next_turn": np.where(black_next, 0, 1),
+        "move_count": move_count,
+        "last_move_player": np.where(move_count % 2 == 1, 0, 1),
+        "last_move_position": np.array([m[1:] for m in last_move], dtype=object),
+    }
+    for k in (2, 3, 4, 5):
+        columns["line_counts_competitor_%d" % k] = competitor[k]
+    for k in (2, 3, 4, 5):
+        columns["line_counts_player_%d" % k] = player[k]
+    columns["next_move"] = check_move_batch(boards, next_move, np.where(black_next, 1, 2))
+    return columns
+
+
+def _step_table():
+    """Ô kế tiếp của mỗi ô theo từng hướng trong _DIRECTIONS, -1 nếu ra ngoài bàn cờ."""
+    table = []
+    for dr, dc in _DIRECTIONS:
+        steps = []
+        for move in range(CONNECT6_SIZE * CONNECT6_SIZE):
+            r, c = divmod(move, CONNECT6_SIZE)
+            r, c = r + dr, c + dc
+            inside = 0 <= r < CONNECT6_SIZE and 0 <= c < CONNECT6_SIZE
+            steps.append(r * CONNECT6_SIZE + c if inside else -1)
+        table.append(steps)
+    return table
+
+
+class Connect6GameFeatures(object):
+    """
+    Trích xuất đặc trưng tăng dần cho các FEN liên tiếp của cùng một ván, mỗi FEN
+    thêm đúng một quân (last_move) so với FEN trước.
+
+    Với mỗi người chơi, lưu độ dài đoạn thẳng bắt đầu từ từng quân theo từng hướng
+    (như count_lines) và, với mỗi k = 2..5, đoạn đầu tiên theo thứ tự duyệt có độ
+    dài >= k. Quân mới chỉ làm dài thêm các đoạn nằm trên 4 đường đi qua nó, nên
+    mỗi nước đi chỉ tốn O(1). Kết quả giống hệt parse_connect6_fen.
+    """
+
+    _next = _step_table()
+    _prev = [[-1] * (CONNECT6_SIZE * CONNECT6_SIZE) for _ in _DIRECTIONS]
+    for _d, _steps in enumerate(_next):
+        for _move, _step in enumerate(_steps):
+            if _step >= 0:
+                _prev[_d][_step] = _move
+    del _d, _steps, _move, _step
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        """Bắt đầu một ván mới (bàn cờ trống)."""
+        size = CONNECT6_SIZE * CONNECT6_SIZE
+        self.board = [[0] * CONNECT6_SIZE for _ in range(CONNECT6_SIZE)]
+        self.move_count = 0
+        # runs[player][move * 4 + d]: độ dài đoạn bắt đầu từ move theo hướng d
+        self._runs = {1: [0] * (size * 4), 2: [0] * (size * 4)}
+        # first[player][k]: chỉ số (move * 4 + d) nhỏ nhất có độ dài >= k
+        self._first = {1: [None] * 6, 2: [None] * 6}
+        # người chơi của hai quân được đặt gần nhất
+        self._last_player = None
+        self._previous_player = None
+
+    def place(self, move, player):
+        """Đặt một quân của player vào ô trống move và cập nhật các đoạn qua nó."""
+        row, col = divmod(move, CONNECT6_SIZE)
+        self.board[row][col] = player
+        self._previous_player, self._last_player = self._last_player, player
+        runs = self._runs[player]
+        first = self._first[player]
+        for d in range(len(_DIRECTIONS)):
+            nxt = self._next[d][move]
+            length = 1 + (runs[nxt * 4 + d] if nxt >= 0 else 0)
+            # quân mới và các quân liền trước nó theo hướng d
+            q = move
+            while True:
+                index = q * 4 + d
+                old = runs[index]
+                runs[index] = length
+                for k in range(max(old + 1, 2), min(length, 5) + 1):
+                    if first[k] is None or index < first[k]:
+                        first[k] = index
+                q = self._prev[d][q]
+                if q < 0 or self.board[q // CONNECT6_SIZE][q % CONNECT6_SIZE] != player:
+                    break
+                length += 1
+
+    def rebuild(self, board):
+        """Dựng lại trạng thái từ một bàn cờ (10, 10) bất kỳ."""
+        board = np.asarray(board).reshape(-1)
+        self.rebuild_moves((int(move), int(board[move])) for move in np.flatnonzero(board))
+
+    def rebuild_moves(self, moves):
+        """Dựng lại trạng thái từ các cặp (ô, người chơi) theo thứ tự đã đi."""
+        self.reset()
+        for move, player in moves:
+            self.place(move, player)
+
+    def line_flags(self, player):
+        """Cờ 0/1 của line_counts 2, 3, 4, 5 trong count_lines(board, player)."""
+        runs = self._runs[player]
+        first = self._first[player]
+        flags = {5: int(first[5] is not None)}
+        for k in (2, 3, 4):
+            flags[k] = int(first[k] is not None and runs[first[k]] == k)
+        return flags
+
+    def update(self, fen):
+        """Đưa FEN tiếp theo của ván vào và trả về dict giống parse_connect6_fen(fen)."""
+        board_state, turn, move_count, a, last_move, b, next_move = fen.split()
+        move_count = int(move_count)
+        piece = {'b': 1, 'w': 2}.get(last_move[0])
+        move = int(last_move[1:]) if piece else -1
+        if (move_count == self.move_count + 1 and 0 <= move < CONNECT6_SIZE * CONNECT6_SIZE
+                and self.board[move // CONNECT6_SIZE][move % CONNECT6_SIZE] == 0):
+            self.place(move, piece)
+        else:
+            # không nối tiếp FEN trước: đọc lại toàn bộ bàn cờ
+            self.rebuild(parse_connect6_boards([board_state])[0])
+        self.move_count = move_count
+        return self._features(turn == '[b]', move_count, (last_move if last_move != '-' else None)[1:],
+                              int(next_move[1:]))
+
+    def update_board(self, board, next_move):
+        """
+        Đặc trưng của một Board (game.py) ngay trước khi đi next_move, giống hệt
+        parse_connect6_fen(Game.generate_fen(board.states, next_move, ...)) nhưng
+        đọc thẳng từ bàn cờ: chỉ quân board.last_move được thêm vào trạng thái.
+        """
+        if board.width != CONNECT6_SIZE or board.height != CONNECT6_SIZE:
+            raise ValueError("Connect6 features need a {0}x{0} board".format(CONNECT6_SIZE))
+        move_count = len(board.states)
+        move = board.last_move
+        if move_count == self.move_count + 1 and self.board[move // CONNECT6_SIZE][move % CONNECT6_SIZE] == 0:
+            self.place(move, board.states[move])
+        else:
+            self.rebuild_moves(board.states.items())
+        self.move_count = move_count
+
+        # lượt tiếp theo theo cách của Game.generate_fen: từ hai quân cuối cùng
+        if move_count == 1:
+            next_turn = 2
+        elif self._last_player == self._previous_player:
+            next_turn = 3 - self._last_player
+        else:
+            next_turn = self._last_player
+        return self._features(next_turn == 1, move_count, str(move), next_move)
+
+    def _features(self, black_next, move_count, last_move_position, next_move):
+        competitor = self.line_flags(2 if black_next else 1)
+        player = self.line_flags(1)
+        # check_move trả ô nước đi về 0 sau khi thử, nên lưu lại giá trị cũ
+        row, col = divmod(next_move, CONNECT6_SIZE)
+        saved = self.board[row][col]
+        next_move_code = check_move(self.board, next_move, 1 if black_next else 2)
+        self.board[row][col] = saved
+
+        features = {
+            "next_turn": 0 if black_next else 1,
+            "move_count": move_count,
+            "last_move_player": 0 if move_count % 2 == 1 else 1,
+            "last_move_position": last_move_position,
+        }
+        for k in (2, 3, 4, 5):
+            features["line_counts_competitor_%d" % k] = competitor[k]
+        for k in (2, 3, 4, 5):
+            features["line_counts_player_%d" % k] = player[k]
+        features["next_move"] = next_move_code
+        return features
+
+
+def parse_connect6_fens_incremental(fens, extractor=None):
+    """
+    Như parse_connect6_fens nhưng dùng Connect6GameFeatures cho từng ván. Các dòng
+    bắt đầu bằng '=' ngăn cách các ván và bị bỏ qua. Truyền cùng một extractor
+    cho các khối liên tiếp của một file để ván không bị cắt ngang giữa hai khối.
+    """
+    if extractor is None:
+        extractor = Connect6GameFeatures()
+    rows = []
+    for fen in fens:
+        if fen.startswith("="):
+            extractor.reset()
+            continue
+        rows.append(extractor.update(fen))
+    columns = {}
+    for name in CONNECT6_COLUMNS:
+        values = [row[name] for row in rows]
+        columns[name] = np.array(values, dtype=object if name == "last_move_position" else np.int64)
+    return columns
+
+
 # Ví dụ sử dụng
 # fen = "w9/5w3b/5b4/5bw3/4wb4/w3bb2w1/3w1bw3/10/10/10 [b] 15 - w0 - b75"
 # features = parse_connect6_fen(fen)
@@ -1,32 +1,108 @@
+import multiprocessing
+import time
+from collections import deque
+
 import chess
 import chess.engine
+import numpy as np
 import pandas as pd
 
-from src.explain_chess import extract_features, parse_connect6_fen
-
-ENGINE_PATH = "engine/lc0.exe"
-
-
-def process_fen_file(csv_path):
-    df = pd.read_csv(csv_path)
-
-    features_list = []
-
-    for fen in df['fen'].head(5000):
-        board = chess.Board(fen)
-        if board.is_checkmate():
-            continue
-        features = extract_features(fen)
-        if features is not None:
-            features['advantage'] = get_best_move(fen)
-            features_list.append(features)
-
-    features_df = pd.DataFrame(features_list)
-    features_df.to_csv("data/chess_result_test.csv", index=True)
-
-    return features_df
+from .fen_to_features import Connect6GameFeatures, extract_features_batch, parse_connect6_fen, \
+    parse_connect6_fens, parse_connect6_fens_incremental
+from .dedup import Connect6Dedup
+from .feature_store import CONNECT6_SCHEMA, FeatureStoreWriter, cast_columns
+from .engine_pool import ENGINE_PATH, EnginePool
+
+
+def process_fen_file(csv_path, output_path="data/chess_result_test.csv", max_rows=None, chunk_size=1000,
+                     n_workers=0, n_engines=1, limit=None, cache_path=None, engine_path=ENGINE_PATH):
+    """
+    Gán nhãn lợi thế cho các FEN cờ vua trong csv_path bằng engine UCI, ghi ra output_path.
+
+    Cột 'fen' được đọc theo từng khối chunk_size dòng (mặc định cả file, hoặc
+    chỉ max_rows dòng đầu). Đặc trưng của mỗi khối được tính bằng
+    extract_features_batch, chia cho n_workers tiến trình nếu n_workers > 0, và
+    mỗi khối được ghi ngay sau khi gán nhãn nên bộ nhớ không phụ thuộc kích thước file.
+
+    Các thế cờ được phân tích bởi một EnginePool gồm n_engines tiến trình chạy
+    suốt quá trình, với giới hạn limit (xem engine_pool.make_limit, mặc định 5
+    giây mỗi thế cờ). cache_path lưu điểm số theo FEN để lần chạy sau bỏ qua
+    các thế cờ đã phân tích.
+    """
+    row_count = 0
+    read_count = 0
+    header_written = False
+    start = time.time()
+    workers = multiprocessing.Pool(n_workers) if n_workers > 0 else None
+    pending = deque()
+
+    def write_chunk(fens, columns):
+        nonlocal row_count, header_written
+        scores = pool.scores(fens)
+        columns['advantage'] = [1 if score > 0 else 0 for score in scores]
+        features_df = pd.DataFrame(columns, index=np.arange(row_count, row_count + len(fens)))
+        # Khối đầu có thể không còn dòng nào (toàn thế chiếu hết), header vẫn chỉ ghi một lần
+        f.write(features_df.to_csv(header=not header_written, index=True))
+        header_written = True
+        row_count += len(fens)
+        elapsed = time.time() - start
+        print(f"{row_count} rows, {row_count / max(elapsed, 1e-9):.1f} rows/s, {pool}")
+
+    try:
+        with EnginePool(engine_path, n_engines, limit, cache_path) as pool, \
+                open(output_path, mode='w', newline='') as f:
+            for chunk in pd.read_csv(csv_path, chunksize=chunk_size, usecols=['fen']):
+                fens = chunk['fen'].tolist()
+                if max_rows is not None:
+                    fens = fens[:max_rows - read_count]
+                read_count += len(fens)
+                if workers is None:
+                    write_chunk(*extract_features_batch(fens))
+                else:
+                    pending.append(workers.apply_async(extract_features_batch, (fens,)))
+                    # Giới hạn số khối đang chờ để bộ nhớ không phụ thuộc kích thước file
+                    if len(pending) >= 2 * n_workers:
+                        write_chunk(*pending.popleft().get())
+                if max_rows is not None and read_count >= max_rows:
+                    break
+            while pending:
+                write_chunk(*pending.popleft().get())
+    finally:
+        if workers is not None:
+            workers.terminate()
+
+    print(f"Labelled {row_count} of {read_count} positions with {n_engines} engines "
+          f"in {time.time() - start:.1f}s.")
+    return output_path
 
-def process_connect6_fen_file(csv_path, output_path="data/connect6_result.csv"):
+def process_connect6_fen_file(csv_path, output_path="data/connect6_result.csv", streaming=False,
+                              chunk_size=10000, n_workers=0, incremental=False, dedup=False):
+    """
+    Trích xuất đặc trưng của mọi FEN Connect6 trong csv_path ra output_path.
+
+    streaming=True đọc csv_path theo từng khối chunk_size dòng, trích xuất cả khối
+    bằng parse_connect6_fens và ghi mỗi khối bằng một lần write duy nhất (file
+    đầu ra giống hệt chế độ từng dòng). n_workers > 0 chia các khối cho một
+    process pool, thứ tự ghi vẫn theo thứ tự đọc.
+
+    Nếu output_path không có đuôi .csv, đặc trưng được ghi theo luồng vào một
+    feature store dạng cột với kiểu int8/int16 (xem feature_store.py).
+
+    incremental=True cập nhật đặc trưng theo từng nước đi của mỗi ván
+    (Connect6GameFeatures) thay vì tính lại trên cả bàn cờ; chế độ này chạy tuần
+    tự vì mỗi ván phụ thuộc các dòng trước nó.
+
+    dedup=True chỉ giữ lần xuất hiện đầu tiên của mỗi dòng đặc trưng (xem
+    dedup.py) và ghi số lần xuất hiện vào cột "weight" của feature store làm
+    trọng số mẫu.
+    """
+    if streaming or not output_path.endswith(".csv"):
+        if incremental and n_workers > 0:
+            raise ValueError("incremental extraction is sequential, use n_workers=0")
+        if dedup and output_path.endswith(".csv"):
+            raise ValueError("sample weights of deduplicated rows need a feature store output")
+        return _process_connect6_fen_file_streaming(csv_path, output_path, chunk_size, n_workers,
+                                                    incremental, dedup)
     df = pd.read_csv(csv_path)
     board_count = 0
 
@@ -47,7 +123,88 @@ def process_connect6_fen_file(csv_path, output_path="data/connect6_result.csv"):
     print(f"Processed {board_count} boards.")
     return output_path
 
-def get_best_move(fen):
+
+def _connect6_chunk(fens, header, extractor=None):
+    """
+    Đặc trưng của một khối FEN, số ván và số dòng của khối. Đặc trưng là văn bản
+    CSV (có dòng tiêu đề nếu header=True), hoặc các cột đã ép kiểu theo
+    CONNECT6_SCHEMA nếu header là None. extractor (Connect6GameFeatures) được giữ
+    qua các khối trong chế độ incremental.
+    """
+    fens = np.asarray(fens, dtype=object)
+    separators = np.array([fen.startswith("=") for fen in fens], dtype=bool)
+    if extractor is not None:
+        features = parse_connect6_fens_incremental(fens, extractor)
+    else:
+        features = parse_connect6_fens(list(fens[~separators]))
+    n_rows = len(fens) - int(separators.sum())
+    if header is None:
+        return cast_columns(features, CONNECT6_SCHEMA), int(separators.sum()), n_rows
+    # Chế độ từng dòng ghi mỗi dòng với chỉ số 0, giữ nguyên định dạng đó
+    features_df = pd.DataFrame(features, index=np.zeros(n_rows, dtype=np.int64))
+    return features_df.to_csv(header=header, index=True), int(separators.sum()), n_rows
+
+
+def _process_connect6_fen_file_streaming(csv_path, output_path, chunk_size, n_workers,
+                                         incremental=False, dedup=False):
+    board_count = 0
+    row_count = 0
+    start = time.time()
+    workers = multiprocessing.Pool(n_workers) if n_workers > 0 else None
+    pending = deque()
+    extractor = Connect6GameFeatures() if incremental else None
+    dedup = Connect6Dedup() if dedup else None
+
+    as_csv = output_path.endswith(".csv")
+
+    def write_chunk(features, n_boards, n_rows):
+        nonlocal board_count, row_count
+        if dedup is not None:
+            # loại trùng sau khi trích xuất, để chế độ incremental vẫn thấy mọi nước đi
+            features = dedup.filter(features)
+            n_rows = len(features["next_move"])
+        write(features)
+        board_count += n_boards
+        row_count += n_rows
+        elapsed = time.time() - start
+        print(f"{row_count} rows, {row_count / max(elapsed, 1e-9):.0f} rows/s")
+
+    try:
+        sink = open(output_path, mode='w', newline='') if as_csv \
+            else FeatureStoreWriter(output_path, CONNECT6_SCHEMA)
+        with sink:
+            write = sink.write if as_csv else sink.append
+            first_chunk = True
+            for chunk in pd.read_csv(csv_path, chunksize=chunk_size):
+                fens = chunk['fen'].tolist()
+                args = (fens, first_chunk if as_csv else None)
+                first_chunk = False
+                if workers is None:
+                    write_chunk(*_connect6_chunk(*args, extractor=extractor))
+                    continue
+                pending.append(workers.apply_async(_connect6_chunk, args))
+                # Giới hạn số khối đang chờ để bộ nhớ không phụ thuộc kích thước file
+                if len(pending) >= 2 * n_workers:
+                    write_chunk(*pending.popleft().get())
+            while pending:
+                write_chunk(*pending.popleft().get())
+            if dedup is not None:
+                sink.add_column("weight", dedup.weights, "int32")
+    finally:
+        if workers is not None:
+            workers.terminate()
+
+    elapsed = time.time() - start
+    print(f"Processed {board_count} boards, {row_count} rows in {elapsed:.1f}s "
+          f"({row_count / max(elapsed, 1e-9):.0f} rows/s).")
+    if dedup is not None:
+        print(f"Deduplicated {dedup.n_seen} positions into {row_count}.")
+    return output_path
+
+def get_best_move(fen, engine_pool=None):
+    if engine_pool is not None:
+        return 1 if engine_pool.score(fen) > 0 else 0
+
     board = chess.Board(fen)
 
     # Kiểm tra nếu ván cờ đã kết thúc
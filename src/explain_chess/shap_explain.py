@@ -1,3 +1,8 @@
+import multiprocessing
+import time
+from collections import deque
+
+import numpy as np
 import pandas as pd
 import shap
 from sklearn.model_selection import train_test_split
@@ -5,8 +10,27 @@ from sklearn.ensemble import RandomForestClassifier
 from sklearn.metrics import confusion_matrix, classification_report, accuracy_score, precision_score, recall_score, f1_score, ConfusionMatrixDisplay
 from imblearn.under_sampling import RandomUnderSampler, ClusterCentroids
 
+from .artifact_cache import ARTIFACT_CACHE_DIR, ArtifactCache, artifact_key, file_digest
+from .feature_store import FEATURE_STORE_PATH, is_feature_store, load_features
+
+
+# File CSV đặc trưng cũ, dùng khi chưa có feature store
+FEATURES_CSV_PATH = "data/connect6_result.csv"
+
+# Tăng khi kết quả của một bước thay đổi định dạng, để không đọc nhầm cache cũ
+CACHE_VERSION = 4
+
 
 def split_features_and_labels(csv_path):
+    if is_feature_store(csv_path):
+        # Feature store dạng cột: đọc memmap int8/int16 thay vì phân tích văn bản.
+        # DataFrame (và các bước lấy mẫu sau đó) vẫn chép dữ liệu vào bộ nhớ, nhưng
+        # giữ nguyên kiểu int8/int16 nên nhỏ hơn nhiều so với đọc từ CSV
+        df = pd.DataFrame(load_features(csv_path))
+        X = df.drop(columns=['next_move', 'weight'], errors='ignore')
+        y = pd.DataFrame(df, columns=['next_move'])
+        return X, y
+
     # Đọc dữ liệu từ file CSV
     df = pd.read_csv(csv_path)
 
@@ -16,8 +40,15 @@ def split_features_and_labels(csv_path):
     return X, y
 
 
-def save_shap_explanation(model, X_test, y_test, explainer, shap_values,
-                          output_path="chess_result/shap_explanation.csv"):
+def load_sample_weights(path):
+    """Trọng số mẫu (số lần xuất hiện của các thế cờ đã loại trùng), None nếu không có."""
+    if not is_feature_store(path):
+        return None
+    columns = load_features(path)
+    return np.asarray(columns['weight']) if 'weight' in columns else None
+
+
+def shap_explanation_frame(model, X_test, y_test, explainer, shap_values):
     # Chuyển SHAP values thành DataFrame
     shap_df = pd.DataFrame(shap_values.values, columns=X_test.columns)
 
@@ -31,44 +62,237 @@ def save_shap_explanation(model, X_test, y_test, explainer, shap_values,
 
     # Thêm giá trị kỳ vọng từ explainer
     shap_df['expected_value'] = shap_df['predicted_class'].apply(lambda c: explainer.expected_value[c])
+    return shap_df
+
+
+def save_shap_explanation(model, X_test, y_test, explainer, shap_values,
+                          output_path="chess_result/shap_explanation.csv"):
+    shap_df = shap_explanation_frame(model, X_test, y_test, explainer, shap_values)
 
     # Xuất DataFrame ra file CSV
     shap_df.to_csv(output_path, index=False)
 
     print(f"SHAP explanation saved to: {output_path}")
 
-def explain():
-    X_raw, y_raw = split_features_and_labels("data/connect6_result.csv")
-    X, y = RandomUnderSampler().fit_resample(X_raw, y_raw)
 
-    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
-    y_train = y_train.values.ravel()
-    y_test = y_test.values.ravel()
+def summarize_background(X, background_size=100, method="kmeans"):
+    """
+    Tóm tắt tập nền của TreeExplainer (interventional) về tối đa background_size dòng:
+    - "kmeans": các tâm cụm của shap.kmeans (làm tròn về giá trị có trong dữ liệu),
+      mỗi tâm lặp lại theo kích thước cụm của nó
+    - "sample": lấy mẫu ngẫu nhiên
+    Thời gian giải thích mỗi dòng tỉ lệ với số dòng của tập nền.
+    """
+    if len(X) <= background_size:
+        return X
+    if method == "kmeans":
+        return pd.DataFrame(weighted_rows(shap.kmeans(X, background_size), background_size),
+                            columns=X.columns)
+    return shap.sample(X, background_size, random_state=0)
 
-    # Huấn luyện mô hình proxy
-    model = RandomForestClassifier(n_estimators=200)
-    model.fit(X_train, y_train)
 
-    # Áp dụng SHAP để giải thích quyết định
-    explainer = shap.TreeExplainer(model, X_test)
-    shap_values = explainer(X_test)
+def weighted_rows(summary, n_rows):
+    """
+    Chuyển DenseData của shap.kmeans thành n_rows dòng không trọng số.
+    TreeExplainer bỏ qua trọng số của DenseData, nên mỗi tâm cụm được lặp lại
+    tỉ lệ với trọng số (chia theo phần dư lớn nhất); cụm quá nhỏ có thể không
+    còn dòng nào.
+    """
+    quota = summary.weights / summary.weights.sum() * n_rows
+    counts = np.floor(quota).astype(int)
+    counts[np.argsort(counts - quota)[:n_rows - counts.sum()]] += 1
+    return np.repeat(summary.data, counts, axis=0)
 
-    print("Shape of SHAP values:", shap_values.shape)
-    print("Shape of X_test:", X_test.shape)
 
-    if len(shap_values.shape) > 2:
-        shap_values = shap_values.mean(axis=2)  # Hoặc chọn slice phù hợp
+def tree_explainer(model, background=None):
+    """TreeExplainer interventional trên tập nền background, hoặc path-dependent nếu background là None."""
+    if background is None:
+        return shap.TreeExplainer(model, feature_perturbation="tree_path_dependent")
+    return shap.TreeExplainer(model, background)
 
-    # Vẽ biểu đồ SHAP
-    shap.summary_plot(shap_values, X_test, max_display=23)
-    shap.summary_plot(shap_values, X_test, max_display=23, plot_type="bar")
 
+# TreeExplainer của tiến trình con, tạo một lần trong _init_shap_worker
+_worker_explainer = None
+
+
+def _init_shap_worker(model, background):
+    global _worker_explainer
+    _worker_explainer = tree_explainer(model, background)
+
+
+def _shap_chunk(X_chunk, explainer=None):
+    """SHAP values và base values của một khối, lấy trung bình theo lớp nếu có nhiều lớp."""
+    explanation = (explainer or _worker_explainer)(X_chunk)
+    values = explanation.values
+    base_values = np.asarray(explanation.base_values)
+    if values.ndim > 2:
+        values = values.mean(axis=2)
+        base_values = base_values.reshape(len(X_chunk), -1).mean(axis=1)
+    return values, base_values
+
+
+def explain_in_chunks(model, X_test, y_test, background=None, chunk_size=1000, n_workers=0,
+                      output_path="chess_result/shap_explanation.csv", max_plot_rows=2000):
+    """
+    Giải thích X_test theo từng khối chunk_size dòng và ghi nối từng khối vào
+    output_path (cùng định dạng với save_shap_explanation), nên bộ nhớ không tăng
+    theo kích thước tập dữ liệu.
+
+    background: tập nền đã tóm tắt (xem summarize_background), None để dùng thuật
+        toán path-dependent (không cần tập nền)
+    n_workers > 0: chia các khối cho một process pool, thứ tự ghi vẫn theo thứ tự dòng
+
+    Returns:
+    - shap.Explanation của tối đa max_plot_rows dòng đầu để vẽ biểu đồ, và
+      X_test tương ứng
+    """
+    explainer = tree_explainer(model, background)
+    workers = None
+    if n_workers > 0:
+        workers = multiprocessing.Pool(n_workers, initializer=_init_shap_worker,
+                                       initargs=(model, background))
+    y_test = np.asarray(y_test)
+    pending = deque()
+    plot_values, plot_base_values = [], []
+    n_rows = 0
+    start = time.time()
 
-    # Xuất kết quả ra file
-    # shap_df = pd.DataFrame(shap_values.values, columns=X.columns)
-    # shap_df.to_csv("chess_result/shap_explanation.csv", index=False)
-    # print(shap_values.values.shape)
-    save_shap_explanation(model, X_test, y_test, explainer, shap_values)
+    def write_chunk(begin, values, base_values):
+        nonlocal n_rows
+        end = begin + len(values)
+        shap_values = shap.Explanation(values, base_values=base_values)
+        shap_df = shap_explanation_frame(model, X_test.iloc[begin:end], y_test[begin:end],
+                                         explainer, shap_values)
+        shap_df.to_csv(f, index=False, header=begin == 0)
+        if begin < max_plot_rows:
+            plot_values.append(values[:max_plot_rows - begin])
+            plot_base_values.append(base_values[:max_plot_rows - begin])
+        n_rows = end
+        print(f"SHAP: {n_rows}/{len(X_test)} rows, {n_rows / max(time.time() - start, 1e-9):.0f} rows/s")
+
+    try:
+        with open(output_path, mode='w', newline='') as f:
+            for begin in range(0, len(X_test), chunk_size):
+                X_chunk = X_test.iloc[begin:begin + chunk_size]
+                if workers is None:
+                    write_chunk(begin, *_shap_chunk(X_chunk, explainer))
+                    continue
+                pending.append((begin, workers.apply_async(_shap_chunk, (X_chunk,))))
+                # Giới hạn số khối đang chờ để bộ nhớ không phụ thuộc kích thước dữ liệu
+                if len(pending) >= 2 * n_workers:
+                    done, result = pending.popleft()
+                    write_chunk(done, *result.get())
+            while pending:
+                done, result = pending.popleft()
+                write_chunk(done, *result.get())
+    finally:
+        if workers is not None:
+            workers.terminate()
+
+    print(f"SHAP explanation saved to: {output_path}")
+    if not plot_values:
+        return shap.Explanation(np.zeros((0, X_test.shape[1]))), X_test.iloc[:0]
+    values = np.concatenate(plot_values)
+    plot_shap_values = shap.Explanation(values, base_values=np.concatenate(plot_base_values),
+                                        data=X_test.iloc[:len(values)].values,
+                                        feature_names=list(X_test.columns))
+    return plot_shap_values, X_test.iloc[:len(values)]
+
+
+def default_features_path():
+    """FEATURE_STORE_PATH nếu đã được ghi, nếu không thì file CSV FEATURES_CSV_PATH."""
+    return FEATURE_STORE_PATH if is_feature_store(FEATURE_STORE_PATH) else FEATURES_CSV_PATH
+
+
+def explain(features_path=None, background_size=None, background_method="kmeans",
+            path_dependent=False, chunk_size=None, n_workers=0, cache_dir=ARTIFACT_CACHE_DIR,
+            output_path="chess_result/shap_explanation.csv"):
+    # features_path: feature store do process_connect6_fen_file ghi, hoặc file CSV;
+    #     mặc định là feature store nếu có, nếu không thì FEATURES_CSV_PATH
+    # background_size: tóm tắt tập nền về số dòng này (mặc định dùng cả X_test)
+    # path_dependent: dùng thuật toán path-dependent, không cần tập nền
+    # chunk_size: giải thích theo khối và ghi dần kết quả (xem explain_in_chunks)
+    # cache_dir: cache kết quả từng bước (chia tập, mô hình, SHAP), None để tắt
+    if features_path is None:
+        features_path = default_features_path()
+    cache = ArtifactCache(cache_dir) if cache_dir else None
+
+    def cached(stage, key, compute, outputs=()):
+        return cache.cached(stage, key, compute, outputs) if cache else compute()
+
+    # Mỗi bước được định danh bằng khóa của bước trước và tham số của nó
+    features_key = artifact_key(file_digest(features_path), CACHE_VERSION) if cache else None
+    split_key = artifact_key(features_key, "RandomUnderSampler", 0.2, 42)
+    model_key = artifact_key(split_key, "RandomForestClassifier", 200)
+    shap_key = artifact_key(model_key, background_size, background_method, path_dependent, bool(chunk_size))
+
+    def split():
+        # Không cache riêng bước đọc đặc trưng: đọc lại nhanh, và hash nội dung
+        # đã nằm trong features_key
+        X_raw, y_raw = split_features_and_labels(features_path)
+        weights = load_sample_weights(features_path)
+        sampler = RandomUnderSampler(random_state=42)
+        X, y = sampler.fit_resample(X_raw, y_raw)
+        # Dữ liệu đã loại trùng: mỗi dòng được tính theo số lần xuất hiện
+        if weights is None:
+            weights = np.ones(len(X_raw))
+        weights = weights[sampler.sample_indices_]
+
+        X_train, X_test, y_train, y_test, w_train, w_test = train_test_split(
+            X, y, weights, test_size=0.2, random_state=42)
+        y_train = y_train.values.ravel()
+        y_test = y_test.values.ravel()
+        return X_train, X_test, y_train, y_test, w_train
+
+    X_train, X_test, y_train, y_test, w_train = cached("split", split_key, split)
+
+    def fit():
+        # Huấn luyện mô hình proxy
+        model = RandomForestClassifier(n_estimators=200)
+        model.fit(X_train, y_train, sample_weight=w_train)
+        return model
+
+    model = cached("model", model_key, fit)
+
+    def compute_shap():
+        # Áp dụng SHAP để giải thích quyết định
+        background = X_test
+        if path_dependent:
+            background = None
+        elif background_size is not None:
+            background = summarize_background(X_test, background_size, background_method)
+
+        if chunk_size:
+            # Kết quả được ghi dần ra file, chỉ giữ một phần để vẽ biểu đồ
+            return explain_in_chunks(model, X_test, y_test, background, chunk_size, n_workers,
+                                     output_path)
+
+        explainer = tree_explainer(model, background)
+        shap_values = explainer(X_test)
+
+        print("Shape of SHAP values:", shap_values.shape)
+        print("Shape of X_test:", X_test.shape)
+
+        if len(shap_values.shape) > 2:
+            # Lấy trung bình theo lớp như _shap_chunk; Explanation.mean bỏ mất
+            # base_values mà summary_plot cần
+            shap_values = shap.Explanation(
+                shap_values.values.mean(axis=2),
+                base_values=np.asarray(shap_values.base_values).reshape(len(X_test), -1).mean(axis=1),
+                data=X_test.values, feature_names=list(X_test.columns))
+
+        # Xuất kết quả ra file
+        # shap_df = pd.DataFrame(shap_values.values, columns=X.columns)
+        # shap_df.to_csv("chess_result/shap_explanation.csv", index=False)
+        # print(shap_values.values.shape)
+        save_shap_explanation(model, X_test, y_test, explainer, shap_values, output_path)
+        return shap_values, X_test
+
+    shap_values, X_plot = cached("shap", shap_key, compute_shap, outputs=(output_path,))
+
+    # Vẽ biểu đồ SHAP
+    shap.summary_plot(shap_values, X_plot, max_display=23)
+    shap.summary_plot(shap_values, X_plot, max_display=23, plot_type="bar")
 
     # Dự đoán trên tập kiểm tra
     y_pred = model.predict(X_test)
@@ -264,19 +264,28 @@ class Game(object):
         fen = '/'.join(fen_rows) + f' [{"b" if next_turn == 1 else "w"}] {len(board_state)} - {"b" if last_player == 1 else "w"}{last_movi} - {"b" if next_turn == 1 else "w"}{move}'
         return fen
 
-    def start_self_play(self, player, is_shown=0, temp=1e-3):
+    def start_self_play(self, player, is_shown=0, temp=1e-3, feature_sink=None,
+                        recorder=None):
         """ start a self-play game using a MCTS player, reuse the search tree,
         and store the self-play data: (state, mcts_probs, z) for training
+        feature_sink: if given (e.g. explain_chess.feature_sink.
+            SelfPlayFeatureSink), the explain features of every position are
+            passed to it straight from the board instead of appending FEN
+            strings to fen.csv
+        recorder: if given (a game_record.GameRecordWriter), the moves, MCTS
+            probabilities and winner of the game are appended to it
         """
         self.board.init_board()
         p1, p2 = self.board.players
-        states, mcts_probs, current_players = [], [], []
+        states, mcts_probs, current_players, moves = [], [], [], []
         while True:
             move, move_probs = player.get_action(self.board,
                                                  temp=temp,
                                                  return_prob=1)
 
-            if current_players:
+            if current_players and feature_sink is not None:
+                feature_sink.add(self.board, move)
+            elif current_players:
                 fen = self.generate_fen(self.board.states, move, current_players[-1])
                 print(f"board: {self.board.states}")
                 print(f"fen: {fen}")
@@ -286,6 +295,7 @@ class Game(object):
             states.append(self.board.current_state())
             mcts_probs.append(move_probs)
             current_players.append(self.board.current_player)
+            moves.append(move)
             # perform a move
             self.board.do_move(move)
             if is_shown:
@@ -299,7 +309,13 @@ class Game(object):
                     winners_z[np.array(current_players) != winner] = -1.0
                 # reset MCTS root node
                 player.reset_player()
-                open("fen.csv", "a").write(f"======\n")
+                if feature_sink is not None:
+                    feature_sink.end_game()
+                else:
+                    open("fen.csv", "a").write(f"======\n")
+                if recorder is not None:
+                    recorder.add_game(moves, current_players, winner,
+                                      mcts_probs, {"temp": temp})
                 if is_shown:
                     if winner != -1:
                         print("Game end. Winner is player:", winner)
@@ -0,0 +1,375 @@
+# -*- coding: utf-8 -*-
+"""
+A compact binary archive of self-play game records
+
+The archive is a data file with one variable-length record per game and an
+index file <path>.idx with the byte offset and move count of every game, so
+any game is found in O(1) and any position inside it from fixed-size arrays.
+A record stores the moves (uint16), the player of each move (uint8), the
+MCTS move probabilities of each position (float16, optional), the winner and
+a small JSON metadata dict. The players are kept because Board carries its
+stones-per-turn count over from the previous game, so the turn order cannot
+be derived from the moves alone.
+
+convert_fen_csv turns an existing fen.csv (FEN lines with '======' between
+games) into an archive; the MCTS probabilities are not part of the FEN and
+are left out.
+
+"""
+
+from __future__ import print_function
+import json
+import os
+import struct
+from collections import namedtuple
+import numpy as np
+from game import Board
+
+MAGIC = b"C6GR"
+VERSION = 1
+# magic, version, width, height, n_in_row
+_FILE_HEADER = struct.Struct("<4sHHHH")
+# n_moves, winner, flags, metadata length
+_RECORD_HEADER = struct.Struct("<IbBH")
+_HAS_PROBS = 1
+INDEX_DTYPE = np.dtype([("offset", "<u8"), ("n_moves", "<u4")])
+
+GameRecord = namedtuple("GameRecord",
+                        ["moves", "players", "mcts_probs", "winner",
+                         "metadata"])
+
+
+def index_path(path):
+    return path + ".idx"
+
+
+def _read_file_header(f):
+    magic, version, width, height, n_in_row = _FILE_HEADER.unpack(
+        f.read(_FILE_HEADER.size))
+    if magic != MAGIC:
+        raise ValueError("not a game record archive")
+    if version != VERSION:
+        raise ValueError("unsupported archive version {}".format(version))
+    return width, height, n_in_row
+
+
+class GameRecordWriter(object):
+    """Append games to an archive, creating it if it does not exist."""
+
+    def __init__(self, path, board_width, board_height, n_in_row):
+        self.path = path
+        self.board_width = board_width
+        self.board_height = board_height
+        self.n_in_row = n_in_row
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                shape = _read_file_header(f)
+            if shape != (board_width, board_height, n_in_row):
+                raise ValueError("archive {} holds {}x{} games with {} in a "
+                                 "row".format(path, *shape))
+            if not os.path.exists(index_path(path)):
+                build_index(path)
+            self._data = open(path, "ab")
+        else:
+            self._data = open(path, "wb")
+            self._data.write(_FILE_HEADER.pack(MAGIC, VERSION, board_width,
+                                               board_height, n_in_row))
+        self._index = open(index_path(path), "ab")
+        self.n_games = 0
+
+    def add_game(self, moves, players, winner, mcts_probs=None,
+                 metadata=None):
+        """Append one game.
+        moves, players: the moves in play order and the player of each
+        mcts_probs: (n_moves, width*height) move probabilities of the
+            position before each move, or None
+        winner: the winning player, -1 for a tie or an unfinished game
+        """
+        moves = np.asarray(moves, dtype="<u2")
+        players = np.asarray(players, dtype=np.uint8)
+        if len(players) != len(moves):
+            raise ValueError("need one player per move")
+        flags = 0
+        if mcts_probs is not None:
+            mcts_probs = np.asarray(mcts_probs, dtype="<f2")
+            if mcts_probs.shape != (len(moves),
+                                    self.board_width * self.board_height):
+                raise ValueError("need one move distribution per move")
+            flags |= _HAS_PROBS
+        meta = json.dumps(metadata or {}).encode("utf-8")
+
+        offset = self._data.tell()
+        self._data.write(_RECORD_HEADER.pack(len(moves), winner, flags,
+                                             len(meta)))
+        self._data.write(meta)
+        self._data.write(moves.tobytes())
+        self._data.write(players.tobytes())
+        if mcts_probs is not None:
+            self._data.write(mcts_probs.tobytes())
+        # the data has to be on disk before the index points at it
+        self._data.flush()
+        self._index.write(np.array([(offset, len(moves))],
+                                   dtype=INDEX_DTYPE).tobytes())
+        self._index.flush()
+        self.n_games += 1
+
+    def close(self):
+        if self._data is None:
+            return
+        self._data.close()
+        self._index.close()
+        self._data = self._index = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+def build_index(path):
+    """Rebuild the index of an archive by scanning its records."""
+    entries = []
+    with open(path, "rb") as f:
+        width, height, _ = _read_file_header(f)
+        size = os.fstat(f.fileno()).st_size
+        offset = f.tell()
+        while offset + _RECORD_HEADER.size <= size:
+            n_moves, _, flags, meta_len = _RECORD_HEADER.unpack(
+                f.read(_RECORD_HEADER.size))
+            end = (offset + _RECORD_HEADER.size + meta_len + 3 * n_moves +
+                   (2 * n_moves * width * height if flags & _HAS_PROBS
+                    else 0))
+            if end > size:
+                # a record cut off by a crash while writing
+                break
+            entries.append((offset, n_moves))
+            offset = end
+            f.seek(offset)
+    with open(index_path(path), "wb") as f:
+        f.write(np.array(entries, dtype=INDEX_DTYPE).tobytes())
+    return len(entries)
+
+
+class GameArchive(object):
+    """Random access to the games of an archive."""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.board_width, self.board_height, self.n_in_row = \
+                _read_file_header(f)
+        if not os.path.exists(index_path(path)):
+            build_index(path)
+        self._index = np.fromfile(index_path(path), dtype=INDEX_DTYPE)
+        # index of the first position of every game, for locate()
+        self._first_position = np.concatenate(
+            [[0], np.cumsum(self._index["n_moves"], dtype=np.int64)])
+        self._data = np.memmap(path, dtype=np.uint8, mode="r")
+
+    def __len__(self):
+        return len(self._index)
+
+    @property
+    def n_positions(self):
+        return int(self._first_position[-1])
+
+    def __getitem__(self, game):
+        offset, n_moves = self._index[game]
+        offset, n_moves = int(offset), int(n_moves)
+        _, winner, flags, meta_len = _RECORD_HEADER.unpack_from(self._data,
+                                                                offset)
+        start = offset + _RECORD_HEADER.size
+        metadata = json.loads(bytes(self._data[start:start + meta_len]))
+        start += meta_len
+        moves = np.frombuffer(self._data, dtype="<u2", count=n_moves,
+                              offset=start)
+        start += 2 * n_moves
+        players = np.frombuffer(self._data, dtype=np.uint8, count=n_moves,
+                                offset=start)
+        start += n_moves
+        mcts_probs = None
+        if flags & _HAS_PROBS:
+            n_cells = self.board_width * self.board_height
+            mcts_probs = np.frombuffer(
+                self._data, dtype="<f2", count=n_moves * n_cells,
+                offset=start).reshape(n_moves, n_cells)
+        return GameRecord(moves, players, mcts_probs, winner, metadata)
+
+    def __iter__(self):
+        for game in range(len(self)):
+            yield self[game]
+
+    def locate(self, position):
+        """(game, move index) of a position numbered across the archive."""
+        if not 0 <= position < self.n_positions:
+            raise IndexError("position out of range")
+        game = int(np.searchsorted(self._first_position, position,
+                                   side="right")) - 1
+        return game, position - int(self._first_position[game])
+
+    def new_board(self):
+        board = Board(width=self.board_width, height=self.board_height,
+                      n_in_row=self.n_in_row)
+        board.init_board()
+        return board
+
+    def replay(self, game, board=None):
+        """Replay a game, yielding (board, move, mcts_prob) with the board
+        as it was before each move (mcts_prob is None if not recorded).
+        The same Board object is updated in place.
+        """
+        record = self[game]
+        if board is None:
+            board = self.new_board()
+        else:
+            board.init_board()
+        board.last_moves = []
+        board.curr_moves = []
+        if len(record.players):
+            # the first turn has one stone, or two if the recording Board
+            # carried its count over from the previous game
+            board.current_player = int(record.players[0])
+            board.chesses = 2 if (len(record.players) > 1 and
+                                  record.players[1] == record.players[0]) \
+                else 1
+        for i, (move, player) in enumerate(zip(record.moves,
+                                               record.players)):
+            if player != board.current_player:
+                # a turn of a different length than Board expects
+                board._change_turn()
+                board.chesses = 2
+            mcts_prob = None
+            if record.mcts_probs is not None:
+                mcts_prob = record.mcts_probs[i].astype(np.float32)
+            yield board, int(move), mcts_prob
+            board.do_move(int(move))
+
+    def board_at(self, game, move_index):
+        """The board of a game after its first move_index moves."""
+        board = self.new_board()
+        for i, _ in enumerate(self.replay(game, board)):
+            if i == move_index:
+                return board
+        if move_index == len(self[game].moves):
+            return board
+        raise IndexError("move index out of range")
+
+    def training_data(self, game):
+        """[(state, mcts_prob, winner_z), ...] of a game, in the format of
+        Game.start_self_play. Needs a recording with the MCTS
+        probabilities.
+        """
+        record = self[game]
+        if record.mcts_probs is None:
+            raise ValueError("game {} was recorded without MCTS "
+                             "probabilities".format(game))
+        states = [board.current_state().copy()
+                  for board, _, _ in self.replay(game)]
+        winners_z = np.zeros(len(record.players))
+        if record.winner != -1:
+            winners_z[record.players == record.winner] = 1.0
+            winners_z[record.players != record.winner] = -1.0
+        return list(zip(states, record.mcts_probs.astype(np.float32),
+                        winners_z))
+
+
+def _fen_stones(fen):
+    """{move: player} of the board part of a Connect6 FEN line."""
+    stones = {}
+    for row, cells in enumerate(fen.split()[0].split("/")):
+        col, digits = 0, ""
+        for c in cells + " ":
+            if c.isdigit():
+                digits += c
+                continue
+            col += int(digits or 0)
+            digits = ""
+            if c in "bw":
+                stones[row * 10 + col] = 1 if c == "b" else 2
+                col += 1
+    return stones
+
+
+def _fen_game(fens, n_in_row):
+    """(moves, players, winner) of the FEN lines of one game."""
+    # every line is written before its move; the first move only shows up as
+    # the last move of the first line
+    first = fens[0].split()[4]
+    moves = [int(first[1:])]
+    players = [1 if first[0] == "b" else 2]
+    for i, fen in enumerate(fens):
+        move_field = fen.split()[6]
+        moves.append(int(move_field[1:]))
+        if i + 1 < len(fens):
+            # the stone on the next board; the turn in the FEN line assumes
+            # a fresh board and can be off by one stone
+            players.append(_fen_stones(fens[i + 1])[moves[-1]])
+        else:
+            players.append(1 if move_field[0] == "b" else 2)
+    board = Board(width=10, height=10, n_in_row=n_in_row)
+    board.init_board()
+    for move in moves:
+        board.states[move] = players[len(board.states)]
+        board.availables.remove(move)
+    end, winner = board.game_end()
+    return moves, players, winner if end else -1
+
+
+def convert_fen_csv(csv_path, archive_path, n_in_row=6):
+    """Convert a fen.csv of 10x10 Connect6 games into an archive.
+    Return: the number of games written
+    """
+    games, fens = [], []
+    with open(csv_path) as f:
+        for line in f:
+            line = line.strip()
+            if line.startswith("="):
+                if fens:
+                    games.append(fens)
+                fens = []
+            elif len(line.split()) == 7:
+                # skips blank lines and a 'fen' header; a game cut off
+                # without its '======' line ends where the move count
+                # starts over
+                if fens and int(line.split()[2]) != \
+                        int(fens[-1].split()[2]) + 1:
+                    games.append(fens)
+                    fens = []
+                fens.append(line)
+    if fens:
+        games.append(fens)
+
+    with GameRecordWriter(archive_path, 10, 10, n_in_row) as writer:
+        for fens in games:
+            moves, players, winner = _fen_game(fens, n_in_row)
+            writer.add_game(moves, players, winner,
+                            metadata={"source": os.path.basename(csv_path)})
+    return len(games)
+
+
+def usage():
+    print("python game_record.py <fen.csv> <file lưu trữ>")
+    print("Chuyển các ván trong fen.csv sang file lưu trữ nhị phân")
+    print("-n Số quân liên tiếp để thắng, mặc định là 6")
+
+
+if __name__ == '__main__':
+    import sys, getopt
+
+    n_in_row = 6
+    opts, args = getopt.getopt(sys.argv[1:], "hn:")
+    for op, value in opts:
+        if op == "-h":
+            usage()
+            sys.exit()
+        elif op == "-n":
+            n_in_row = int(value)
+    if len(args) != 2:
+        usage()
+        sys.exit(1)
+
+    n_games = convert_fen_csv(args[0], args[1], n_in_row)
+    archive = GameArchive(args[1])
+    print("Saved {} games, {} positions to {}".format(
+        n_games, archive.n_positions, args[1]))
@@ -10,7 +10,8 @@ Input your move in the format: 2,3
 from __future__ import print_function
 from game import Board, Game
 from mcts_alphaZero import MCTSPlayer
-from policy_value_net_pytorch import PolicyValueNet  # Pytorch
+from opening_book import OpeningBook
+from policy_value_engine import load_policy  # Pytorch
 
 
 # 请仔细阅读Human这个类
@@ -47,28 +48,42 @@ class Human(object):
 # 以下函数可以略读
 def run(n_in_row, width, height, # 几子棋，棋盘宽度，高度
         model_file, ai_first, # 载入的模型文件，是否AI先下棋
-        n_playout, use_gpu): # AI每次进行蒙特卡洛的模拟次数，是否使用GPU
+        n_playout, use_gpu, # AI每次进行蒙特卡洛的模拟次数，是否使用GPU
+        search_workers=0, # 并行搜索的进程数，0表示单进程搜索
+        book_file=None, book_depth=None, book_mode="play"): # 开局库文件，使用开局库的步数，直接落子或作为先验
+    mcts_player = None
     try:
         board = Board(width=width, height=height, n_in_row=n_in_row) # 产生一个棋盘
         game = Game(board) # 加载一个游戏
 
         # ############### human VS AI ###################
-        best_policy = PolicyValueNet(width, height, model_file=model_file, use_gpu=use_gpu) # 加载最佳策略网络
-        mcts_player = MCTSPlayer(best_policy.policy_value_fn, c_puct=5, n_playout=n_playout) # 生成一个AI玩家
+        best_policy = load_policy(model_file, width, height, use_gpu=use_gpu) # 加载最佳策略网络(.model或导出的.pt/.onnx)
+        opening_book = OpeningBook(book_file, book_depth) if book_file else None # 加载开局库
+        mcts_player = MCTSPlayer(best_policy.policy_value_fn, c_puct=5, n_playout=n_playout,
+                                 n_search_workers=search_workers,
+                                 opening_book=opening_book, book_mode=book_mode,
+                                 verbose=True) # 生成一个AI玩家
         human = Human() # 生成一个人类玩家
 
         # set start_player=0 for human first
         game.start_play(human, mcts_player, start_player=ai_first, is_shown=1) # 开始游戏
     except KeyboardInterrupt:
         print('\n\rquit')
+    finally:
+        if mcts_player is not None:
+            mcts_player.close() # 关闭并行搜索的进程
 
 def usage():
     print("-s 设置棋盘大小，默认为6")
     print("-r 设置是几子棋，默认为4")
     print("-m 设置每步棋执行MCTS模拟的次数，默认为400")
-    print("-i ai使用哪个文件中的模型，默认为model/6_6_4_best_policy.model")
+    print("-i ai使用哪个文件中的模型，默认为model/6_6_4_best_policy.model（也可以是policy_value_engine.py导出的.pt/.onnx）")
     print("--use_gpu 使用GPU进行运算")
     print("--human_first 让人类先下")
+    print("--search_workers 使用多少个进程并行搜索，默认为0（单进程）")
+    print("--book 开局库文件（由opening_book.py生成），默认不使用")
+    print("--book_depth 只在前几步使用开局库，默认为开局库的深度")
+    print("--book_prior 把开局库作为根节点的先验概率继续搜索，而不是直接落子")
 
 
 if __name__ == '__main__':
@@ -81,8 +96,13 @@ if __name__ == '__main__':
     n_playout = 800
     model_file = "model/10_10_6_best_policy_3.model"
     ai_first=True
+    search_workers = 0
+    book_file = None
+    book_depth = None
+    book_mode = "play"
 
-    opts, args = getopt.getopt(sys.argv[1:], "hs:r:m:i:", ["use_gpu", "graphics", "human_first"])
+    opts, args = getopt.getopt(sys.argv[1:], "hs:r:m:i:", ["use_gpu", "graphics", "human_first", "search_workers=",
+                                                           "book=", "book_depth=", "book_prior"])
     for op, value in opts:
         if op == "-h":
             usage()
@@ -99,5 +119,14 @@ if __name__ == '__main__':
             model_file = value
         elif op == "--human_first":
             ai_first=False
+        elif op == "--search_workers":
+            search_workers = int(value)
+        elif op == "--book":
+            book_file = value
+        elif op == "--book_depth":
+            book_depth = int(value)
+        elif op == "--book_prior":
+            book_mode = "prior"
     run(height=height, width=width, n_in_row=n_in_row, use_gpu=use_gpu, n_playout=n_playout,
-        model_file=model_file, ai_first=ai_first)
+        model_file=model_file, ai_first=ai_first, search_workers=search_workers,
+        book_file=book_file, book_depth=book_depth, book_mode=book_mode)
@@ -1,4 +1,5 @@
 from explain_chess import process_connect6_fen_file
+from explain_chess.feature_store import FEATURE_STORE_PATH
 
 if __name__ == '__main__':
-    process_connect6_fen_file('kaggle/output/fen.csv')
+    process_connect6_fen_file('kaggle/output/fen.csv', FEATURE_STORE_PATH)
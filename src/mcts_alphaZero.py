@@ -10,6 +10,8 @@ network to guide the tree search and evaluate the leaf nodes
 
 import numpy as np
 import copy
+import multiprocessing
+from node_pool import NodePool
 
 
 def softmax(x):
@@ -25,23 +27,33 @@ class TreeNode(object):
     its visit-count-adjusted prior score u.
     """
 
+    __slots__ = ('_parent', '_children', '_n_visits', '_Q', '_u', '_P')
+
     def __init__(self, parent, prior_p):
-        self._parent = parent
         self._children = {}  # a map from action to TreeNode
+        self.reset(parent, prior_p)
+        # self.flag = flag # 代表是否为对应选手所下的最后一步棋
+
+    def reset(self, parent, prior_p):
+        """(Re)initialize the node, used when it is recycled by a NodePool."""
+        self._parent = parent
         self._n_visits = 0
         self._Q = 0
         self._u = 0
         self._P = prior_p
-        # self.flag = flag # 代表是否为对应选手所下的最后一步棋
 
-    def expand(self, action_priors):
+    def expand(self, action_priors, pool=None):
         """Expand tree by creating new children.
         action_priors: a list of tuples of actions and their prior probability
             according to the policy function.
+        pool: the NodePool to take the new children from, if any.
         """
         for action, prob in action_priors:
             if action not in self._children:
-                self._children[action] = TreeNode(self, prob)
+                if pool is not None:
+                    self._children[action] = pool.acquire(self, prob)
+                else:
+                    self._children[action] = TreeNode(self, prob)
 
     def select(self, c_puct):
         """Select action among children that gives maximum action value Q
@@ -96,7 +108,8 @@ class TreeNode(object):
 class MCTS(object):
     """An implementation of Monte Carlo Tree Search."""
 
-    def __init__(self, policy_value_fn, c_puct=5, n_playout=10000):
+    def __init__(self, policy_value_fn, c_puct=5, n_playout=10000,
+                 max_nodes=None, max_memory=None):
         """
         policy_value_fn: a function that takes in a board state and outputs
             a list of (action, probability) tuples and also a score in [-1, 1]
@@ -105,8 +118,13 @@ class MCTS(object):
         c_puct: a number in (0, inf) that controls how quickly exploration
             converges to the maximum-value policy. A higher value means
             relying on the prior more.
+        max_nodes, max_memory: optional ceiling on the tree size, as a node
+            count or in bytes. When it is hit the lowest-visit leaves are
+            pruned (see NodePool).
         """
-        self._root = TreeNode(None, 1.0)
+        self._pool = NodePool(TreeNode, max_nodes=max_nodes,
+                              max_memory=max_memory)
+        self._root = self._pool.acquire(None, 1.0)
         self._policy = policy_value_fn
         self._c_puct = c_puct
         self._n_playout = n_playout
@@ -132,7 +150,9 @@ class MCTS(object):
         # Check for end of game.
         end, winner = state.game_end()
         if not end:
-            node.expand(action_probs)
+            action_probs = list(action_probs)
+            self._pool.reserve(self._root, node, len(action_probs))
+            node.expand(action_probs, self._pool)
         else:
             # for end state，return the "true" leaf_value
             if winner == -1:  # tie
@@ -150,19 +170,42 @@ class MCTS(object):
         else:
             node.update_recursive(leaf_value, 1)
 
-    def get_move_probs(self, state, temp=1e-3):
+    def search(self, state, dirichlet_eps=0.0, dirichlet_alpha=0.3,
+               root_priors=None, prior_weight=0.5):
+        """Run all playouts sequentially and return the visit counts of the
+        root's children as a list of (action, visits) tuples.
+        dirichlet_eps: if > 0, mix this fraction of Dirichlet(dirichlet_alpha)
+            noise into the root priors as soon as the root is expanded.
+        root_priors: optional move probabilities over the whole board (e.g.
+            from an opening book), mixed into the root priors with weight
+            prior_weight as soon as the root is expanded.
+        """
+        for n in range(self._n_playout):
+            state_copy = copy.deepcopy(state)
+            self._playout(state_copy)
+            if n == 0 and root_priors is not None:
+                for act, child in self._root._children.items():
+                    child._P = (1 - prior_weight) * child._P + \
+                        prior_weight * root_priors[act]
+            if n == 0 and dirichlet_eps > 0:
+                children = list(self._root._children.values())
+                noise = np.random.dirichlet(
+                    dirichlet_alpha * np.ones(len(children)))
+                for child, eta in zip(children, noise):
+                    child._P = (1 - dirichlet_eps) * child._P + \
+                        dirichlet_eps * eta
+        return [(act, node._n_visits)
+                for act, node in self._root._children.items()]
+
+    def get_move_probs(self, state, temp=1e-3, root_priors=None):
         """Run all playouts sequentially and return the available actions and
         their corresponding probabilities.
         state: the current game state
         temp: temperature parameter in (0, 1] controls the level of exploration
+        root_priors: see search()
         """
-        for n in range(self._n_playout):
-            state_copy = copy.deepcopy(state)
-            self._playout(state_copy)
-
         # calc the move probabilities based on visit counts at the root node
-        act_visits = [(act, node._n_visits)
-                      for act, node in self._root._children.items()]
+        act_visits = self.search(state, root_priors=root_priors)
         acts, visits = zip(*act_visits)
         act_probs = softmax(1.0/temp * np.log(np.array(visits) + 1e-10))
 
@@ -172,23 +215,151 @@ class MCTS(object):
         """Step forward in the tree, keeping everything we already know
         about the subtree.
         """
-        if last_move in self._root._children:
-            self._root = self._root._children[last_move]
+        old_root = self._root
+        if last_move in old_root._children:
+            self._root = old_root._children.pop(last_move)
             self._root._parent = None
         else:
-            self._root = TreeNode(None, 1.0)
+            self._root = self._pool.acquire(None, 1.0)
+        # recycle the part of the tree that can no longer be reached
+        self._pool.release(old_root)
 
     def __str__(self):
         return "MCTS"
 
 
+_search_worker = None
+
+
+def _init_search_worker(policy_value_fn, c_puct, n_playout):
+    global _search_worker
+    _search_worker = (policy_value_fn, c_puct, n_playout)
+
+
+def _search_task(args):
+    """Run one independent search in a worker process."""
+    state, seed, dirichlet_eps = args
+    policy_value_fn, c_puct, n_playout = _search_worker
+    np.random.seed(seed)
+    mcts = MCTS(policy_value_fn, c_puct, n_playout)
+    return seed, mcts.search(state, dirichlet_eps=dirichlet_eps)
+
+
+class RootParallelMCTS(object):
+    """Root-parallel MCTS: n_workers processes each run an independent
+    n_playout search from the same root, with its own seed and Dirichlet
+    noise on the root priors, and the root visit counts are summed before
+    they are turned into move probabilities. No tree is shared or kept
+    between moves.
+
+    policy_value_fn is pickled to every worker, which it must survive under
+    the spawn start method (the default on Windows and macOS);
+    start_method picks the multiprocessing start method, None for the
+    platform default.
+    """
+
+    def __init__(self, policy_value_fn, c_puct=5, n_playout=10000,
+                 n_workers=2, dirichlet_eps=0.25, start_method=None):
+        self._policy = policy_value_fn
+        self._c_puct = c_puct
+        self._n_playout = n_playout
+        self._n_workers = n_workers
+        self._dirichlet_eps = dirichlet_eps
+        self._start_method = start_method
+        self._workers = None
+        # per-worker results of the last search: (seed, [(action, visits)])
+        self.last_searches = []
+        self.last_merged = []
+
+    def search(self, state):
+        """Run the independent searches and return the merged root visit
+        counts as a list of (action, visits) tuples.
+        """
+        if self._workers is None:
+            context = multiprocessing.get_context(self._start_method)
+            self._workers = context.Pool(
+                self._n_workers, initializer=_init_search_worker,
+                initargs=(self._policy, self._c_puct, self._n_playout))
+        seeds = np.random.randint(2**31 - 1, size=self._n_workers)
+        self.last_searches = self._workers.map(
+            _search_task,
+            [(state, int(seed), self._dirichlet_eps) for seed in seeds])
+        merged = {}
+        for seed, act_visits in self.last_searches:
+            for act, visits in act_visits:
+                merged[act] = merged.get(act, 0) + visits
+        self.last_merged = list(merged.items())
+        return self.last_merged
+
+    def get_move_probs(self, state, temp=1e-3):
+        """Same contract as MCTS.get_move_probs, on the merged visits."""
+        act_visits = self.search(state)
+        acts, visits = zip(*act_visits)
+        act_probs = softmax(1.0/temp * np.log(np.array(visits) + 1e-10))
+        return acts, act_probs
+
+    def update_with_move(self, last_move):
+        """Nothing to keep, every search starts from a fresh tree."""
+        pass
+
+    def report(self, board):
+        """Describe each worker's search next to the merged result."""
+        def best(act_visits):
+            act, visits = max(act_visits, key=lambda av: av[1])
+            total = sum(v for _, v in act_visits)
+            return "move {} ({}/{} visits)".format(
+                board.move_to_location(act), visits, total)
+        lines = ["worker {} (seed {}): {}".format(i, seed, best(act_visits))
+                 for i, (seed, act_visits) in enumerate(self.last_searches)]
+        lines.append("merged: {}".format(best(self.last_merged)))
+        return "\n".join(lines)
+
+    def close(self):
+        """Shut down the worker pool, if one was started."""
+        if self._workers is not None:
+            self._workers.terminate()
+            self._workers = None
+
+    def __str__(self):
+        return "RootParallelMCTS"
+
+
 class MCTSPlayer(object):
     """AI player based on MCTS"""
 
     def __init__(self, policy_value_function,
-                 c_puct=5, n_playout=2000, is_selfplay=0):
-        self.mcts = MCTS(policy_value_function, c_puct, n_playout)
+                 c_puct=5, n_playout=2000, is_selfplay=0,
+                 max_nodes=None, max_memory=None, n_search_workers=0,
+                 opening_book=None, book_mode="play", verbose=False):
+        """
+        verbose: print how the root-parallel searches agreed after every
+            search (see RootParallelMCTS.report)
+        opening_book: optional opening_book.OpeningBook. Positions found in
+            it within its depth are answered from the book ("play" mode,
+            no search) or searched with the book probabilities mixed into
+            the root priors ("prior" mode).
+        """
+        if book_mode not in ("play", "prior"):
+            raise ValueError("book_mode should be 'play' or 'prior'")
+        if book_mode == "prior" and opening_book is not None \
+                and n_search_workers:
+            raise ValueError("book priors need the single-process search")
+        if n_search_workers and (max_nodes is not None
+                                 or max_memory is not None):
+            raise ValueError("tree size limits need the single-process "
+                             "search")
+        self.opening_book = opening_book
+        self.book_mode = book_mode
+        if n_search_workers:
+            # independent searches in several processes, merged at the root
+            self.mcts = RootParallelMCTS(policy_value_function, c_puct,
+                                         n_playout,
+                                         n_workers=n_search_workers)
+        else:
+            self.mcts = MCTS(policy_value_function, c_puct, n_playout,
+                             max_nodes=max_nodes, max_memory=max_memory)
         self._is_selfplay = is_selfplay
+        self._verbose = verbose
 
     def set_player_ind(self, p):
         self.player = p
@@ -196,12 +367,33 @@ class MCTSPlayer(object):
     def reset_player(self):
         self.mcts.update_with_move(-1)
 
+    def close(self):
+        if isinstance(self.mcts, RootParallelMCTS):
+            self.mcts.close()
+
     def get_action(self, board, temp=1e-3, return_prob=0):
         sensible_moves = board.availables
         # the pi vector returned by MCTS as in the alphaGo Zero paper
         move_probs = np.zeros(board.width*board.height)
         if len(sensible_moves) > 0:
-            acts, probs = self.mcts.get_move_probs(board, temp)
+            book_probs = None
+            if self.opening_book is not None:
+                book_probs = self.opening_book.lookup(board)
+            book_acts = []
+            if book_probs is not None and self.book_mode == "play":
+                book_acts = [act for act in sensible_moves
+                             if book_probs[act] > 0]
+            if book_acts:
+                acts = book_acts
+                probs = softmax(1.0/temp * np.log(book_probs[acts] + 1e-10))
+            else:
+                if book_probs is not None:
+                    acts, probs = self.mcts.get_move_probs(
+                        board, temp, root_priors=book_probs)
+                else:
+                    acts, probs = self.mcts.get_move_probs(board, temp)
+                if self._verbose and isinstance(self.mcts, RootParallelMCTS):
+                    print(self.mcts.report(board))
             move_probs[list(acts)] = probs
             if self._is_selfplay:
                 # add Dirichlet Noise for exploration (needed for
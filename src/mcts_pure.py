@@ -7,6 +7,9 @@ A pure implementation of the Monte Carlo Tree Search (MCTS)
 
 import numpy as np
 import copy
+import multiprocessing
+from node_pool import NodePool
+from mcts_rollout import RolloutEngine
 from operator import itemgetter
 
 
@@ -17,6 +20,57 @@ def rollout_policy_fn(board):
     return zip(board.availables, action_probs)
 
 
+_rollout_engines = {}
+
+
+def evaluate_rollout(state, n_rollout=0, limit=1000, policy=None):
+    """Play random games from the state until the end, returning +1 if the
+    current player wins, -1 if the opponent wins, and 0 if it is a tie.
+    n_rollout: if > 0, average n_rollout games played by the RolloutEngine,
+        otherwise play one game move by move with rollout_policy_fn.
+    policy: a PatternPolicy to play the RolloutEngine games with, instead of
+        uniformly random moves.
+    State is modified in-place, so a copy must be provided.
+    """
+    if policy is not None:
+        n_rollout = max(n_rollout, 1)
+    if n_rollout:
+        key = (state.width, state.height, state.n_in_row)
+        if key not in _rollout_engines:
+            _rollout_engines[key] = RolloutEngine(*key)
+        return _rollout_engines[key].evaluate(state, n_rollout, policy)
+    player = state.get_current_player()
+    for i in range(limit):
+        end, winner = state.game_end()
+        if end:
+            break
+        action_probs = rollout_policy_fn(state)
+        max_action = max(action_probs, key=itemgetter(1))[0]
+        state.do_move(max_action)
+    else:
+        # If no break from the loop, issue a warning.
+        print("WARNING: rollout reached move limit")
+    if winner == -1:  # tie
+        return 0
+    else:
+        return 1 if winner == player else -1
+
+
+_worker_rollout_policy = None
+
+
+def _init_rollout_worker(rollout_policy):
+    """Reseed each worker, forked workers would share the parent's RNG."""
+    global _worker_rollout_policy
+    _worker_rollout_policy = rollout_policy
+    np.random.seed()
+
+
+def _rollout_task(args):
+    state, n_rollout = args
+    return evaluate_rollout(state, n_rollout, policy=_worker_rollout_policy)
+
+
 def policy_value_fn(board):
     """a function that takes in a state and outputs a list of (action, probability)
     tuples and a score for the state"""
@@ -30,24 +84,34 @@ class TreeNode(object):
     prior probability P, and its visit-count-adjusted prior score u.
     """
 
+    __slots__ = ('_parent', '_children', '_n_visits', '_Q', '_u', '_P')
+
     def __init__(self, parent, prior_p):
-        self._parent = parent
         self._children = {}  # a map from action to TreeNode
+        self.reset(parent, prior_p)
+        # self.flag = flag # 代表是否为对应选手所下的最后一步棋
+
+
+    def reset(self, parent, prior_p):
+        """(Re)initialize the node, used when it is recycled by a NodePool."""
+        self._parent = parent
         self._n_visits = 0
         self._Q = 0
         self._u = 0
         self._P = prior_p
-        # self.flag = flag # 代表是否为对应选手所下的最后一步棋
 
-
-    def expand(self, action_priors):
+    def expand(self, action_priors, pool=None):
         """Expand tree by creating new children.
         action_priors: a list of tuples of actions and their prior probability
             according to the policy function.
+        pool: the NodePool to take the new children from, if any.
         """
         for action, prob in action_priors:
             if action not in self._children:
-                self._children[action] = TreeNode(self, prob)
+                if pool is not None:
+                    self._children[action] = pool.acquire(self, prob)
+                else:
+                    self._children[action] = TreeNode(self, prob)
 
     def select(self, c_puct):
         """Select action among children that gives maximum action value Q
@@ -102,7 +166,9 @@ class TreeNode(object):
 class MCTS(object):
     """A simple implementation of Monte Carlo Tree Search."""
 
-    def __init__(self, policy_value_fn, c_puct=5, n_playout=10000):
+    def __init__(self, policy_value_fn, c_puct=5, n_playout=10000,
+                 max_nodes=None, max_memory=None, n_rollout=0,
+                 n_workers=0, leaf_batch=None, rollout_policy=None):
         """
         policy_value_fn: a function that takes in a board state and outputs
             a list of (action, probability) tuples and also a score in [-1, 1]
@@ -111,11 +177,29 @@ class MCTS(object):
         c_puct: a number in (0, inf) that controls how quickly exploration
             converges to the maximum-value policy. A higher value means
             relying on the prior more.
+        max_nodes, max_memory: optional ceiling on the tree size, as a node
+            count or in bytes. When it is hit the lowest-visit leaves are
+            pruned (see NodePool).
+        n_rollout: if > 0, evaluate each leaf with the average of n_rollout
+            random games played at once by the vectorized RolloutEngine,
+            instead of a single game played move by move in Python.
+        n_workers: if > 0, run the rollouts in a pool of n_workers processes.
+            Each round selects leaf_batch leaves (4 per worker by default),
+            evaluates them in parallel and backs the results up in a batch.
+        rollout_policy: a PatternPolicy to play the rollouts with (through
+            the RolloutEngine) instead of uniformly random moves.
         """
-        self._root = TreeNode(None, 1.0)
+        self._pool = NodePool(TreeNode, max_nodes=max_nodes,
+                              max_memory=max_memory)
+        self._root = self._pool.acquire(None, 1.0)
         self._policy = policy_value_fn
         self._c_puct = c_puct
         self._n_playout = n_playout
+        self._n_rollout = n_rollout
+        self._rollout_policy = rollout_policy
+        self._n_workers = n_workers
+        self._leaf_batch = leaf_batch or 4 * n_workers
+        self._workers = None
 
     def _playout(self, state):
         """Run a single playout from the root to the leaf, getting a value at
@@ -135,11 +219,16 @@ class MCTS(object):
         # Check for end of game
         end, winner = state.game_end()
         if not end:
-            node.expand(action_probs)
+            action_probs = list(action_probs)
+            self._pool.reserve(self._root, node, len(action_probs))
+            node.expand(action_probs, self._pool)
+        # Read the turn of the leaf before the rollout, which may move on
+        # the state in place
+        chesses = state.chesses
         # Evaluate the leaf node by random rollout
         leaf_value = self._evaluate_rollout(state)
         # Update value and visit count of nodes in this traversal.
-        if state.chesses == 2:
+        if chesses == 2:
             node.update_recursive(-leaf_value, 0)
         else:
             node.update_recursive(leaf_value, 1)
@@ -150,31 +239,81 @@ class MCTS(object):
         returning +1 if the current player wins, -1 if the opponent wins,
         and 0 if it is a tie.
         """
-        player = state.get_current_player()
-        for i in range(limit):
-            end, winner = state.game_end()
-            if end:
-                break
-            action_probs = rollout_policy_fn(state)
-            max_action = max(action_probs, key=itemgetter(1))[0]
-            state.do_move(max_action)
-        else:
-            # If no break from the loop, issue a warning.
-            print("WARNING: rollout reached move limit")
-        if winner == -1:  # tie
-            return 0
-        else:
-            return 1 if winner == player else -1
+        return evaluate_rollout(state, self._n_rollout, limit,
+                                self._rollout_policy)
+
+    def _playout_batch(self, state, n_leaves):
+        """Leaf-parallel version of _playout: select n_leaves leaves, evaluate
+        them in the worker pool and back each value up exactly as _playout
+        does. While the batch is being selected every node on a selected
+        path carries a pending visit, which lowers its exploration bonus so
+        that the following selections spread over different leaves. Pending
+        visits are removed before the backup, so update_recursive sees the
+        same tree as in a sequential search.
+        """
+        leaves, states, paths, chesses = [], [], [], []
+        for i in range(n_leaves):
+            state_copy = copy.deepcopy(state)
+            node = self._root
+            path = [node]
+            while not node.is_leaf():
+                action, node = node.select(self._c_puct)
+                state_copy.do_move(action)
+                path.append(node)
+            action_probs, _ = self._policy(state_copy)
+            end, winner = state_copy.game_end()
+            if not end:
+                action_probs = list(action_probs)
+                self._pool.reserve(self._root, node, len(action_probs),
+                                   protected=[l._parent for l in leaves])
+                node.expand(action_probs, self._pool)
+            for n in path:
+                n._n_visits += 1
+            leaves.append(node)
+            states.append(state_copy)
+            paths.append(path)
+            chesses.append(state_copy.chesses)
+
+        if self._workers is None:
+            self._workers = multiprocessing.Pool(
+                self._n_workers, initializer=_init_rollout_worker,
+                initargs=(self._rollout_policy,))
+        leaf_values = self._workers.map(
+            _rollout_task, [(s, self._n_rollout) for s in states])
+
+        for path in paths:
+            for n in path:
+                n._n_visits -= 1
+        for node, leaf_chesses, leaf_value in zip(leaves, chesses,
+                                                  leaf_values):
+            if leaf_chesses == 2:
+                node.update_recursive(-leaf_value, 0)
+            else:
+                node.update_recursive(leaf_value, 1)
+
+    def close(self):
+        """Shut down the rollout worker pool, if one was started."""
+        if self._workers is not None:
+            self._workers.terminate()
+            self._workers = None
 
     def get_move(self, state):
-        """Runs all playouts sequentially and returns the most visited action.
+        """Runs all playouts (sequentially, or in batches of leaves if
+        n_workers > 0) and returns the most visited action.
         state: the current game state
 
         Return: the selected action
         """
-        for n in range(self._n_playout):
-            state_copy = copy.deepcopy(state)
-            self._playout(state_copy)
+        if self._n_workers:
+            n = 0
+            while n < self._n_playout:
+                batch = min(self._leaf_batch, self._n_playout - n)
+                self._playout_batch(state, batch)
+                n += batch
+        else:
+            for n in range(self._n_playout):
+                state_copy = copy.deepcopy(state)
+                self._playout(state_copy)
         return max(self._root._children.items(),
                    key=lambda act_node: act_node[1]._n_visits)[0]
 
@@ -182,11 +321,14 @@ class MCTS(object):
         """Step forward in the tree, keeping everything we already know
         about the subtree.
         """
-        if last_move in self._root._children:
-            self._root = self._root._children[last_move]
+        old_root = self._root
+        if last_move in old_root._children:
+            self._root = old_root._children.pop(last_move)
             self._root._parent = None
         else:
-            self._root = TreeNode(None, 1.0)
+            self._root = self._pool.acquire(None, 1.0)
+        # recycle the part of the tree that can no longer be reached
+        self._pool.release(old_root)
 
     def __str__(self):
         return "MCTS"
@@ -194,8 +336,16 @@ class MCTS(object):
 
 class MCTSPlayer(object):
     """AI player based on MCTS"""
-    def __init__(self, c_puct=5, n_playout=2000):
-        self.mcts = MCTS(policy_value_fn, c_puct, n_playout)
+    def __init__(self, c_puct=5, n_playout=2000,
+                 max_nodes=None, max_memory=None, n_rollout=0,
+                 n_workers=0, leaf_batch=None, rollout_policy=None):
+        # a distilled PatternPolicy also gives the priors of the tree
+        prior_fn = (policy_value_fn if rollout_policy is None
+                    else rollout_policy.policy_value_fn)
+        self.mcts = MCTS(prior_fn, c_puct, n_playout,
+                         max_nodes=max_nodes, max_memory=max_memory,
+                         n_rollout=n_rollout, n_workers=n_workers,
+                         leaf_batch=leaf_batch, rollout_policy=rollout_policy)
 
     def set_player_ind(self, p):
         self.player = p
@@ -203,6 +353,9 @@ class MCTSPlayer(object):
     def reset_player(self):
         self.mcts.update_with_move(-1)
 
+    def close(self):
+        self.mcts.close()
+
     def get_action(self, board):
         sensible_moves = board.availables
         if len(sensible_moves) > 0:
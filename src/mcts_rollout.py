@@ -0,0 +1,204 @@
+# -*- coding: utf-8 -*-
+"""
+A vectorized rollout engine for the pure MCTS
+
+A uniformly random rollout is the same as placing the remaining empty
+points in a uniformly random order, so the engine draws one permutation per
+simulated game and plays all of them at once on an array of boards. After
+each placement only the four lines through the new stone are checked for a
+win, for every unfinished game in a single NumPy operation. With a
+PatternPolicy the games are played move by move instead, sampling each move
+from the 3x3 pattern weights of the empty points.
+
+"""
+
+import numpy as np
+
+# value of the extra column of the rollout boards that stands for every
+# point off the board
+OFF_BOARD = 3
+# offsets (dh, dw) of the 8 neighbours of a point, in pattern digit order
+NEIGHBOURS = [(-1, -1), (-1, 0), (-1, 1), (0, -1),
+              (0, 1), (1, -1), (1, 0), (1, 1)]
+
+
+def neighbour_table(width, height):
+    """Indices of the 8 neighbours of every point, width*height for the
+    neighbours off the board. shape: (width*height, 8)
+    """
+    size = width * height
+    h, w = np.divmod(np.arange(size), width)
+    table = np.empty((size, len(NEIGHBOURS)), dtype=np.intp)
+    for i, (dh, dw) in enumerate(NEIGHBOURS):
+        nh, nw = h + dh, w + dw
+        inside = (nh >= 0) & (nh < height) & (nw >= 0) & (nw < width)
+        table[:, i] = np.where(inside, nh * width + nw, size)
+    return table
+
+
+class PatternPolicy(object):
+    """A rollout policy that weights every empty point by the 3x3 pattern
+    around it. Each neighbour is empty, own stone, opponent stone or off the
+    board, so a pattern is a base-4 number of 8 digits and the policy is a
+    table of 4**8 weights, distilled from the policy-value net (see
+    distill_rollout.py). A table of ones is the uniform random policy.
+    """
+
+    n_patterns = 4 ** len(NEIGHBOURS)
+
+    def __init__(self, weights=None):
+        if weights is None:
+            weights = np.ones(self.n_patterns, dtype=np.float32)
+        self.weights = np.asarray(weights, dtype=np.float32)
+        self._neighbours = {}
+
+    @classmethod
+    def load(cls, path):
+        return cls(np.load(path))
+
+    def save(self, path):
+        np.save(path, self.weights)
+
+    @staticmethod
+    def codes(boards, player, neighbours):
+        """Pattern number of every point of boards, seen by player.
+        boards: (n, width*height+1) arrays with 0 for empty, 1 and 2 for the
+            players, and OFF_BOARD in the last column
+        """
+        cells = boards[:, neighbours]
+        digits = np.where(cells == player, 1,
+                          np.where((cells == 0) | (cells == OFF_BOARD),
+                                   cells, 2))
+        return digits.astype(np.intp) @ (4 ** np.arange(len(NEIGHBOURS)))
+
+    def sample(self, boards, player, neighbours):
+        """Draw one move of player on each of boards, with probability
+        proportional to the pattern weights of the empty points.
+        """
+        size = len(neighbours)
+        scores = self.weights[self.codes(boards, player, neighbours)]
+        scores *= boards[:, :size] == 0
+        cum = np.cumsum(scores, axis=1)
+        u = np.random.rand(len(boards)) * cum[:, -1]
+        return np.minimum((cum < u[:, None]).sum(axis=1), size - 1)
+
+    def policy_value_fn(self, board):
+        """Pattern weights as a fast prior for the pure MCTS, with score 0
+        (same contract as mcts_pure.policy_value_fn).
+        """
+        key = (board.width, board.height)
+        if key not in self._neighbours:
+            self._neighbours[key] = neighbour_table(*key)
+        size = board.width * board.height
+        cells = np.zeros((1, size + 1), dtype=np.int8)
+        cells[0, size] = OFF_BOARD
+        if board.states:
+            moves, players = zip(*board.states.items())
+            cells[0, list(moves)] = players
+        codes = self.codes(cells, board.get_current_player(),
+                           self._neighbours[key])[0]
+        action_probs = self.weights[codes[board.availables]]
+        action_probs = action_probs / action_probs.sum()
+        return zip(board.availables, action_probs), 0
+
+
+class RolloutEngine(object):
+    """Simulates many random continuations of a position at once."""
+
+    def __init__(self, width, height, n_in_row):
+        self.width = width
+        self.height = height
+        self.n_in_row = n_in_row
+        self._lines = self._line_table()
+        self._neighbours = neighbour_table(width, height)
+
+    def _line_table(self):
+        """For every point, the indices of the 2*n_in_row-1 points centered
+        on it along each of the four directions (horizontal, vertical and the
+        two diagonals). Points off the board map to an extra column at index
+        width*height, which holds OFF_BOARD.
+        shape: (width*height, 4, 2*n_in_row-1)
+        """
+        n = self.n_in_row
+        size = self.width * self.height
+        offsets = np.arange(-(n - 1), n)
+        h, w = np.divmod(np.arange(size), self.width)
+        lines = np.empty((size, 4, len(offsets)), dtype=np.intp)
+        for i, (dh, dw) in enumerate([(0, 1), (1, 0), (1, 1), (1, -1)]):
+            lh = h[:, None] + dh * offsets
+            lw = w[:, None] + dw * offsets
+            inside = ((lh >= 0) & (lh < self.height) &
+                      (lw >= 0) & (lw < self.width))
+            lines[:, i] = np.where(inside, lh * self.width + lw, size)
+        return lines
+
+    def _owners(self, board, n_moves):
+        """The player placing each of the next n_moves stones: the current
+        player finishes this turn, then players alternate two stones each.
+        """
+        player = board.get_current_player()
+        other = (board.players[0] if player == board.players[1]
+                 else board.players[1])
+        k = np.arange(n_moves)
+        turn = np.where(k < board.chesses, 0, (k - board.chesses) // 2 + 1)
+        return np.where(turn % 2 == 0, player, other).astype(np.int8)
+
+    def _place(self, boards, alive, move, owner):
+        """Place a stone of owner at move on the boards of the alive games
+        and return which of them it wins.
+        """
+        n = self.n_in_row
+        boards[alive, move] = owner
+        same = boards[alive[:, None, None], self._lines[move]] == owner
+        # run length through the new stone in each direction
+        forward = np.cumprod(same[:, :, n:], axis=2).sum(axis=2)
+        backward = np.cumprod(same[:, :, n-2::-1], axis=2).sum(axis=2)
+        return (forward + backward + 1 >= n).any(axis=1)
+
+    def simulate(self, board, n_rollout, policy=None):
+        """Play n_rollout games to the end from the board, choosing moves
+        uniformly at random, or with the PatternPolicy policy if given.
+        Return: an array with the winner of each game, -1 for a tie
+        """
+        size = self.width * self.height
+        empties = np.array(board.availables, dtype=np.intp)
+        boards = np.zeros((n_rollout, size + 1), dtype=np.int8)
+        boards[:, size] = OFF_BOARD
+        if board.states:
+            moves, players = zip(*board.states.items())
+            boards[:, list(moves)] = players
+        if policy is None:
+            order = np.argsort(np.random.rand(n_rollout, len(empties)), axis=1)
+            moves = empties[order]
+        owners = self._owners(board, len(empties))
+
+        winners = np.full(n_rollout, -1, dtype=np.int8)
+        alive = np.arange(n_rollout)
+        for k in range(len(empties)):
+            if policy is None:
+                move = moves[alive, k]
+            else:
+                move = policy.sample(boards[alive], owners[k],
+                                     self._neighbours)
+            won = self._place(boards, alive, move, owners[k])
+            if won.any():
+                winners[alive[won]] = owners[k]
+                alive = alive[~won]
+                if not len(alive):
+                    break
+        return winners
+
+    def evaluate(self, board, n_rollout=1, policy=None):
+        """Return the average result of n_rollout games from the board (see
+        simulate): +1 for a win of the current player, -1 for a loss and 0
+        for a tie.
+        """
+        player = board.get_current_player()
+        end, winner = board.game_end()
+        if end:
+            winners = np.array([winner])
+        else:
+            winners = self.simulate(board, n_rollout, policy)
+        values = np.where(winners == player, 1.0,
+                          np.where(winners == -1, 0.0, -1.0))
+        return values.mean()
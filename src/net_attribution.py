@@ -0,0 +1,241 @@
+# -*- coding: utf-8 -*-
+"""
+Batched attribution of the policy-value network over stored positions
+
+The SHAP pipeline in explain_chess explains a random forest trained on
+hand-made features. This module attributes the outputs of the Net that
+actually plays to its input cells instead. For every position it scores
+two outputs: the value head, and the log-probability that the policy head
+gives to its own top legal move (occupied cells are not moves, whatever
+the net gives them). Each input entry (plane, row, column) gets a
+score from one of these methods:
+
+- "gradient": the gradient of the output with respect to the input
+- "grad_x_input": gradient times input, so only occupied entries score
+- "occlusion": the output drop when the entry is cleared. All the
+  perturbations of a position are evaluated in one forward batch, and only
+  non-zero entries are cleared, since clearing a zero changes nothing.
+
+Attributions are saved as float16 arrays of shape (N, 4, height, width), in
+the orientation of Board.current_state, and are summarized per input plane.
+
+"""
+
+from __future__ import print_function
+import time
+import numpy as np
+import torch
+
+PLANE_NAMES = ["current player stones", "opponent stones",
+               "last turn moves", "this turn moves"]
+METHODS = ("gradient", "grad_x_input", "occlusion")
+
+
+def archive_states(archive_path, max_positions=None):
+    """Net inputs of the positions recorded in a game archive (see
+    game_record.py), before each move.
+    Return: states (N, 4, height, width) float32, and the (game, move index)
+    of every position
+    """
+    from game_record import GameArchive
+    archive = GameArchive(archive_path)
+    n = archive.n_positions
+    if max_positions is not None:
+        n = min(n, max_positions)
+    states = np.empty((n, 4, archive.board_height, archive.board_width),
+                      dtype=np.float32)
+    positions = np.empty((n, 2), dtype=np.int32)
+    i = 0
+    for game in range(len(archive)):
+        for move_index, (board, _, _) in enumerate(archive.replay(game)):
+            if i == n:
+                return states, positions
+            states[i] = board.current_state()
+            positions[i] = game, move_index
+            i += 1
+    return states, positions
+
+
+def _outputs(net, state_input, top_moves=None):
+    """(policy score, value) per row: the log-probability of top_moves, or of
+    the top legal move of each row if None, and the value.
+    """
+    log_act_probs, value = net(state_input)
+    if top_moves is None:
+        # only empty cells are moves; the planes are flipped vertically
+        # against the move numbering (see Board.current_state)
+        occupied = (state_input[:, 0] + state_input[:, 1]).detach() != 0
+        occupied = occupied.flip(1).reshape(len(state_input), -1)
+        top_moves = log_act_probs.detach().masked_fill(
+            occupied, -float("inf")).argmax(dim=1)
+    policy = log_act_probs.gather(1, top_moves[:, None])[:, 0]
+    return policy, value[:, 0], top_moves
+
+
+def _gradient_batch(net, states, times_input):
+    state_input = states.clone().requires_grad_(True)
+    policy, value, top_moves = _outputs(net, state_input)
+    policy_grad, = torch.autograd.grad(policy.sum(), state_input,
+                                       retain_graph=True)
+    value_grad, = torch.autograd.grad(value.sum(), state_input)
+    if times_input:
+        policy_grad = policy_grad * states
+        value_grad = value_grad * states
+    return policy_grad, value_grad, top_moves
+
+
+def _occlusion_batch(net, states, max_rows):
+    """Clear each non-zero entry of each position in turn. All the
+    perturbations of a position go through the net in the same forward pass,
+    which holds up to max_rows rows (or the perturbations of one position).
+    """
+    n = len(states)
+    flat = states.reshape(n, -1)
+    policy_attr = torch.zeros_like(flat)
+    value_attr = torch.zeros_like(flat)
+    with torch.no_grad():
+        base_policy, base_value, top_moves = _outputs(net, states)
+        rows, entries = flat.nonzero(as_tuple=True)
+        # split into forward batches of whole positions
+        starts = np.searchsorted(rows.cpu().numpy(), np.arange(n + 1))
+        first = 0
+        while first < n:
+            last = first + 1
+            while last < n and starts[last + 1] - starts[first] <= max_rows:
+                last += 1
+            r = rows[starts[first]:starts[last]]
+            e = entries[starts[first]:starts[last]]
+            perturbed = flat[r].clone()
+            perturbed[torch.arange(len(r), device=r.device), e] = 0.0
+            policy, value, _ = _outputs(
+                net, perturbed.reshape((-1,) + states.shape[1:]),
+                top_moves[r])
+            policy_attr[r, e] = base_policy[r] - policy
+            value_attr[r, e] = base_value[r] - value
+            first = last
+    return (policy_attr.reshape(states.shape),
+            value_attr.reshape(states.shape), top_moves)
+
+
+def attribute(policy_value_net, states, method="grad_x_input",
+              batch_size=256, max_rows=4096):
+    """Per-entry attributions of the policy and value heads.
+    policy_value_net: a PolicyValueNet
+    states: (N, 4, height, width) net inputs
+    batch_size: positions per batch
+    max_rows: perturbed rows per forward pass for occlusion
+    Return: dict of "policy" and "value" attributions, float16 arrays shaped
+    like states, and "top_moves", the move scored for the policy head
+    """
+    if method not in METHODS:
+        raise ValueError("unknown attribution method {}".format(method))
+    net = policy_value_net.policy_value_net
+    was_training = net.training
+    net.eval()
+    device = next(net.parameters()).device
+    states = np.ascontiguousarray(states, dtype=np.float32)
+    n = len(states)
+    result = {"policy": np.empty(states.shape, dtype=np.float16),
+              "value": np.empty(states.shape, dtype=np.float16),
+              "top_moves": np.empty(n, dtype=np.int16)}
+    try:
+        for i in range(0, n, batch_size):
+            batch = torch.from_numpy(states[i:i + batch_size]).to(device)
+            if method == "occlusion":
+                policy, value, top_moves = _occlusion_batch(net, batch,
+                                                            max_rows)
+            else:
+                policy, value, top_moves = _gradient_batch(
+                    net, batch, method == "grad_x_input")
+            result["policy"][i:i + batch_size] = policy.cpu().numpy()
+            result["value"][i:i + batch_size] = value.cpu().numpy()
+            result["top_moves"][i:i + batch_size] = top_moves.cpu().numpy()
+    finally:
+        net.train(was_training)
+    return result
+
+
+def summarize(attributions):
+    """Mean absolute and mean signed attribution of each input plane.
+    Return: {head: [(plane name, mean |attribution|, mean attribution)]}
+    """
+    summary = {}
+    for head in ("policy", "value"):
+        values = attributions[head].astype(np.float32)
+        summary[head] = [(name,
+                          float(np.abs(values[:, plane]).mean()),
+                          float(values[:, plane].mean()))
+                         for plane, name in enumerate(PLANE_NAMES)]
+    return summary
+
+
+def save_attributions(path, attributions, positions=None, method=""):
+    """Save the attributions as one compressed .npz file."""
+    arrays = dict(attributions)
+    if positions is not None:
+        arrays["positions"] = positions
+    np.savez_compressed(path, method=np.array(method), **arrays)
+
+
+def load_attributions(path):
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+def usage():
+    print("-i File mô hình cần giải thích, mặc định là model/10_10_6_best_policy_3.model")
+    print("-r File lưu trữ các ván tự chơi (xem game_record.py)")
+    print("-s Thiết lập kích thước bàn cờ, mặc định là 10")
+    print("-m Phương pháp: gradient, grad_x_input hoặc occlusion, mặc định là grad_x_input")
+    print("-n Số thế cờ tối đa, mặc định là tất cả")
+    print("-b Kích thước batch, mặc định là 256")
+    print("-o File kết quả, mặc định là data/net_attributions.npz")
+
+
+if __name__ == '__main__':
+    import sys, getopt
+    from policy_value_net_pytorch import PolicyValueNet
+
+    width = height = 10
+    model_file = "model/10_10_6_best_policy_3.model"
+    archive_path = None
+    method = "grad_x_input"
+    max_positions = None
+    batch_size = 256
+    output_path = "data/net_attributions.npz"
+
+    opts, args = getopt.getopt(sys.argv[1:], "hi:r:s:m:n:b:o:")
+    for op, value in opts:
+        if op == "-h":
+            usage()
+            sys.exit()
+        elif op == "-i":
+            model_file = value
+        elif op == "-r":
+            archive_path = value
+        elif op == "-s":
+            height = width = int(value)
+        elif op == "-m":
+            method = value
+        elif op == "-n":
+            max_positions = int(value)
+        elif op == "-b":
+            batch_size = int(value)
+        elif op == "-o":
+            output_path = value
+    if archive_path is None:
+        usage()
+        sys.exit(1)
+
+    net = PolicyValueNet(width, height, model_file=model_file)
+    states, positions = archive_states(archive_path, max_positions)
+    start = time.time()
+    attributions = attribute(net, states, method, batch_size)
+    print("Attributed {} positions with {} in {:.1f}s".format(
+        len(states), method, time.time() - start))
+    save_attributions(output_path, attributions, positions, method)
+    for head, planes in summarize(attributions).items():
+        print(head)
+        for name, mean_abs, mean in planes:
+            print("  {:24s} mean |a| {:.5f}  mean a {:+.5f}".format(
+                name, mean_abs, mean))
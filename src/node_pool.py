@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+"""
+A node pool for the MCTS trees, used by both mcts_alphaZero and mcts_pure.
+
+The pool recycles the nodes of subtrees that are detached by
+update_with_move, and keeps the number of live nodes under a ceiling by
+collapsing the lowest-visit frontier of the tree back into leaves.
+
+"""
+
+import sys
+
+
+class NodePool(object):
+    """Allocates and recycles TreeNode objects.
+
+    node_factory: the TreeNode class of the calling module, called as
+        node_factory(parent, prior_p) when the free list is empty.
+    max_nodes: ceiling on the number of live nodes, None for no limit.
+    max_memory: ceiling on the tree size in bytes, converted to a node
+        ceiling with an estimate of the size of one node. If both are given
+        the smaller ceiling wins.
+    low_water: after the ceiling is hit the tree is pruned down to this
+        fraction of it, so that the pruning scan runs rarely.
+    """
+
+    def __init__(self, node_factory, max_nodes=None, max_memory=None,
+                 low_water=0.9):
+        self._factory = node_factory
+        self._free = []
+        self.n_live = 0
+        self.n_pruned = 0
+        self.low_water = low_water
+        self.max_nodes = max_nodes
+        if max_memory is not None:
+            memory_nodes = int(max_memory // self.node_bytes())
+            if self.max_nodes is None or memory_nodes < self.max_nodes:
+                self.max_nodes = memory_nodes
+
+    def node_bytes(self):
+        """Estimate the memory held by one node: the object, its (empty)
+        children dict, its float fields and its entry in the parent's dict.
+        """
+        node = self._factory(None, 1.0)
+        return (sys.getsizeof(node) + sys.getsizeof(node._children) +
+                3 * sys.getsizeof(1.0) + 64)
+
+    def acquire(self, parent, prior_p):
+        """Return a fresh node, reusing a recycled one if possible."""
+        if self._free:
+            node = self._free.pop()
+            node.reset(parent, prior_p)
+        else:
+            node = self._factory(parent, prior_p)
+        self.n_live += 1
+        return node
+
+    def release(self, node):
+        """Recycle a node and its whole subtree.
+        The node must already be detached from its parent.
+        """
+        stack = [node]
+        while stack:
+            n = stack.pop()
+            stack.extend(n._children.values())
+            n._children.clear()
+            n._parent = None
+            self.n_live -= 1
+            if self.max_nodes is None or len(self._free) < self.max_nodes:
+                self._free.append(n)
+
+    def reserve(self, root, node, n_children, protected=()):
+        """Make room for the n_children nodes about to be added under node,
+        pruning the tree below root if the ceiling would be exceeded.
+        If the tree cannot be pruned far enough (e.g. the ceiling is smaller
+        than one expansion) the ceiling is overshot rather than stopping the
+        search. Nodes in protected (and node's parent) are not collapsed.
+        """
+        if self.max_nodes is None or \
+                self.n_live + n_children <= self.max_nodes:
+            return
+        target = int(self.max_nodes * self.low_water) - n_children
+        self.prune(root, target, protected=[node._parent] + list(protected))
+
+    def prune(self, root, target, protected=()):
+        """Collapse frontier nodes (nodes whose children are all leaves)
+        into leaves, lowest visit count first, until at most target nodes
+        are live. A collapsed node keeps its own Q and visit count and is
+        simply expanded again if the search comes back to it.
+        root and the nodes in protected are never collapsed.
+        """
+        while self.n_live > target:
+            frontier = []
+            stack = [root]
+            while stack:
+                n = stack.pop()
+                if not n._children:
+                    continue
+                inner = [c for c in n._children.values() if c._children]
+                if inner:
+                    stack.extend(inner)
+                elif n is not root and n not in protected:
+                    frontier.append(n)
+            if not frontier:
+                return
+            frontier.sort(key=lambda n: n._n_visits)
+            for n in frontier:
+                for child in n._children.values():
+                    self.release(child)
+                self.n_pruned += 1
+                n._children.clear()
+                if self.n_live <= target:
+                    return
+
+    def __len__(self):
+        return self.n_live
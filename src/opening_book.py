@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+"""
+An opening book built from recorded self-play games
+
+The first moves of every game are searched from a nearly empty board and
+come out almost the same each time. The book keeps, for every position seen
+within the first `depth` moves of the recorded games (see game_record.py),
+the mean of the stored MCTS move probabilities over its occurrences. Games
+recorded without them, e.g. converted from fen.csv, count the played move
+instead. Positions are keyed by a 64-bit hash of their canonical form under
+the symmetries of the board (the planes of EvalCache), and the probabilities
+are stored in the canonical orientation.
+
+The book is one compressed .npz file: sorted keys, float16 probabilities
+and occurrence counts. MCTSPlayer can play book moves directly or use them
+as root priors (see MCTSPlayer.get_action).
+
+"""
+
+from __future__ import print_function
+import hashlib
+import numpy as np
+from eval_cache import EvalCache
+
+
+def position_key(board):
+    """64-bit hash of the canonical form of the board, and the symmetry
+    that maps the board onto it.
+    """
+    key, sym = EvalCache.canonical(board)
+    return int.from_bytes(hashlib.blake2b(key, digest_size=8).digest(),
+                          "little"), sym
+
+
+def _symmetrize(planes, prob):
+    """Average prob over the symmetries that leave the (canonical) planes
+    unchanged, so that a symmetric position answers the same in every
+    orientation.
+    """
+    height, width = prob.shape
+    stabilizer = [sym for sym in EvalCache._symmetries(width, height)
+                  if np.array_equal(EvalCache._transform(planes, *sym), planes)]
+    if len(stabilizer) == 1:
+        return prob
+    return np.mean([EvalCache._transform(prob, *sym) for sym in stabilizer],
+                   axis=0)
+
+
+def build_opening_book(archive_paths, depth=8, min_count=2):
+    """Collect the first depth positions of every game in the archives.
+    min_count: keep only positions seen at least this many times
+    Return: (keys, probs, counts) sorted by key
+    """
+    from game_record import GameArchive
+    totals = {}
+    shape = None
+    for path in archive_paths:
+        archive = GameArchive(path)
+        if shape is None:
+            shape = (archive.board_height, archive.board_width)
+        elif shape != (archive.board_height, archive.board_width):
+            raise ValueError("archives hold different board sizes")
+        for game in range(len(archive)):
+            for i, (board, move, mcts_prob) in enumerate(archive.replay(game)):
+                if i >= depth:
+                    break
+                if mcts_prob is None:
+                    mcts_prob = np.zeros(shape[0] * shape[1], dtype=np.float32)
+                    mcts_prob[move] = 1.0
+                key, sym = position_key(board)
+                prob = _symmetrize(
+                    EvalCache._transform(EvalCache.planes(board), *sym),
+                    EvalCache._transform(mcts_prob.reshape(shape), *sym))
+                entry = totals.get(key)
+                if entry is None:
+                    totals[key] = [prob.astype(np.float64), 1]
+                else:
+                    entry[0] += prob
+                    entry[1] += 1
+    keys = np.array(sorted(k for k, (_, n) in totals.items()
+                           if n >= min_count), dtype=np.uint64)
+    if shape is None:
+        shape = (0, 0)
+    probs = np.zeros((len(keys),) + shape, dtype=np.float16)
+    counts = np.zeros(len(keys), dtype=np.uint32)
+    for i, key in enumerate(keys):
+        prob, n = totals[int(key)]
+        probs[i] = prob / n
+        counts[i] = n
+    return keys, probs, counts
+
+
+def save_opening_book(path, keys, probs, counts, depth):
+    np.savez_compressed(path, keys=keys, probs=probs, counts=counts,
+                        depth=np.array(depth))
+
+
+class OpeningBook(object):
+    """Lookup of book move probabilities by position."""
+
+    def __init__(self, path, depth=None):
+        """depth: answer only positions with fewer stones than this,
+        at most the depth the book was built with.
+        """
+        with np.load(path) as data:
+            self.keys = data["keys"]
+            self.probs = data["probs"]
+            self.counts = data["counts"]
+            self.depth = int(data["depth"])
+        if depth is not None:
+            self.depth = min(self.depth, depth)
+        self.hits = 0
+        self.misses = 0
+
+    def lookup(self, board):
+        """Book move probabilities over all moves of the board, or None if
+        the position is not in the book.
+        """
+        if len(board.states) >= self.depth:
+            return None
+        key, sym = position_key(board)
+        i = int(np.searchsorted(self.keys, np.uint64(key)))
+        if i == len(self.keys) or int(self.keys[i]) != key:
+            self.misses += 1
+            return None
+        self.hits += 1
+        probs = EvalCache._inverse(self.probs[i].astype(np.float64), *sym)
+        return probs.reshape(-1)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __str__(self):
+        return "opening book: {} positions, {} hits / {} lookups".format(
+            len(self), self.hits, self.hits + self.misses)
+
+
+def usage():
+    print("python opening_book.py [-d độ sâu] [-c số lần tối thiểu] [-o file kết quả] <file lưu trữ ván> ...")
+    print("-d Lấy các thế cờ trong bao nhiêu nước đầu của mỗi ván, mặc định là 8")
+    print("-c Thế cờ phải xuất hiện ít nhất bao nhiêu lần, mặc định là 2")
+    print("-o File opening book, mặc định là model/opening_book.npz")
+
+
+if __name__ == '__main__':
+    import sys, getopt
+
+    depth = 8
+    min_count = 2
+    output_path = "model/opening_book.npz"
+
+    opts, args = getopt.getopt(sys.argv[1:], "hd:c:o:")
+    for op, value in opts:
+        if op == "-h":
+            usage()
+            sys.exit()
+        elif op == "-d":
+            depth = int(value)
+        elif op == "-c":
+            min_count = int(value)
+        elif op == "-o":
+            output_path = value
+    if not args:
+        usage()
+        sys.exit(1)
+
+    keys, probs, counts = build_opening_book(args, depth, min_count)
+    save_opening_book(output_path, keys, probs, counts, depth)
+    print("Saved {} positions ({} occurrences) to {}".format(
+        len(keys), int(counts.sum()), output_path))
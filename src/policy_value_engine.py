@@ -0,0 +1,320 @@
+# -*- coding: utf-8 -*-
+"""
+Export of the policy-value net for inference, and a standalone evaluator
+
+export_model turns a .model state_dict into a frozen TorchScript (.pt) or
+ONNX (.onnx) artifact, optionally in int8 or bfloat16 for CPU inference
+(select_precision picks the fastest precision that stays within tolerance
+of the fp32 net). InferenceEngine loads only that artifact (no Net
+construction, no optimizer) and has the same policy_value_fn /
+policy_value contract as PolicyValueNet, so it can be handed to MCTSPlayer
+directly.
+
+"""
+
+from __future__ import print_function
+import copy
+import time
+import numpy as np
+import torch
+import torch.nn as nn
+from game import Board
+from mcts_alphaZero import MCTSPlayer
+from policy_value_net_pytorch import CPU_CONFIG_FILE, Net, PolicyValueNet, \
+    apply_cpu_config, fill_state, save_shared_weights
+
+
+PRECISIONS = ["fp32", "int8-dynamic", "int8", "bf16"]
+
+
+class _CastNet(nn.Module):
+    """Runs a reduced-precision copy of the net behind a float32 interface."""
+
+    def __init__(self, net, dtype):
+        super(_CastNet, self).__init__()
+        self.net = net.to(dtype)
+        self.dtype = dtype
+
+    def forward(self, state_input):
+        log_act_probs, value = self.net(state_input.to(self.dtype))
+        return log_act_probs.float(), value.float()
+
+
+def bf16_supported():
+    """Whether this CPU has native bfloat16 support in oneDNN."""
+    check = getattr(torch.ops.mkldnn, "_is_mkldnn_bf16_supported", None)
+    return check is not None and check()
+
+
+def load_net(model_file, board_width, board_height):
+    net = Net(board_width, board_height)
+    net.load_state_dict(torch.load(model_file,
+                                   map_location=lambda storage, loc: storage))
+    net.eval()
+    return net
+
+
+def reduce_precision(net, precision, calibration_states=None):
+    """Return a copy of net for CPU inference in the given precision:
+    fp32: unchanged
+    int8-dynamic: int8 weights for act_fc1/val_fc1/val_fc2, activations
+        quantized on the fly (no calibration needed)
+    int8: static int8 for the convolutions too, with activation ranges
+        calibrated on calibration_states (e.g. from collect_states)
+    bf16: bfloat16 weights and activations, if the CPU supports it
+    """
+    net = copy.deepcopy(net).eval()
+    if precision == "fp32":
+        return net
+    if precision == "int8-dynamic":
+        return torch.ao.quantization.quantize_dynamic(
+            net, {nn.Linear}, dtype=torch.qint8).eval()
+    if precision == "int8":
+        if calibration_states is None or not len(calibration_states):
+            raise ValueError("int8 quantization needs calibration states")
+        from torch.ao.quantization import get_default_qconfig_mapping
+        from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+        example = torch.from_numpy(
+            np.asarray(calibration_states[:1], dtype=np.float32))
+        prepared = prepare_fx(net, get_default_qconfig_mapping(), (example,))
+        with torch.no_grad():
+            for i in range(0, len(calibration_states), 64):
+                prepared(torch.from_numpy(np.asarray(
+                    calibration_states[i:i + 64], dtype=np.float32)))
+        return convert_fx(prepared).eval()
+    if precision == "bf16":
+        if not bf16_supported():
+            raise ValueError("this CPU has no native bfloat16 support")
+        return _CastNet(net, torch.bfloat16).eval()
+    raise ValueError("unknown precision {}".format(precision))
+
+
+def collect_states(policy_value_fn, board_width, board_height, n_in_row,
+                   n_games=2, n_playout=50):
+    """Positions from short self-play games, as calibration and agreement
+    data for the reduced-precision evaluators.
+    """
+    states = []
+    for i in range(n_games):
+        board = Board(width=board_width, height=board_height,
+                      n_in_row=n_in_row)
+        board.init_board()
+        player = MCTSPlayer(policy_value_fn, n_playout=n_playout,
+                            is_selfplay=1)
+        while True:
+            states.append(board.current_state().copy())
+            board.do_move(player.get_action(board, temp=1.0))
+            end, winner = board.game_end()
+            if end:
+                break
+    return states
+
+
+def agreement(reference, candidate, states):
+    """Compare two nets on states: the fraction of positions where they pick
+    the same top legal move, and the mean and max absolute value error.
+    """
+    state_input = torch.from_numpy(np.asarray(states, dtype=np.float32))
+    with torch.no_grad():
+        ref_act, ref_val = reference(state_input)
+        cand_act, cand_val = candidate(state_input)
+    # occupied points are not legal moves; planes are flipped vertically
+    occupied = (state_input[:, 0] + state_input[:, 1]).flip(1)
+    occupied = occupied.reshape(len(states), -1) > 0
+    ref_act = ref_act.masked_fill(occupied, -float("inf"))
+    cand_act = cand_act.masked_fill(occupied, -float("inf"))
+    top1 = (ref_act.argmax(1) == cand_act.argmax(1)).float().mean().item()
+    value_err = (ref_val - cand_val).abs()
+    return top1, value_err.mean().item(), value_err.max().item()
+
+
+def select_precision(net, states, min_top1=0.95, max_value_err=0.05,
+                     n_calls=200):
+    """Build every supported reduced-precision evaluator of net, keep those
+    within tolerance of the fp32 net on states (top move agreement at least
+    min_top1, max value error at most max_value_err) and return the name
+    and module of the fastest at batch 1, with a report line per candidate.
+    """
+    single = torch.from_numpy(np.asarray(states[:1], dtype=np.float32))
+    best, report = None, []
+    for precision in PRECISIONS:
+        try:
+            candidate = reduce_precision(net, precision, states)
+        except (ValueError, RuntimeError) as e:
+            report.append("{}: skipped ({})".format(precision, e))
+            continue
+        top1, value_mean, value_max = agreement(net, candidate, states)
+        with torch.no_grad():
+            candidate(single)
+            start = time.time()
+            for i in range(n_calls):
+                candidate(single)
+        latency = 1000.0 * (time.time() - start) / n_calls
+        ok = top1 >= min_top1 and value_max <= max_value_err
+        report.append("{}: {:.3f} ms, top move agreement {:.3f}, value error "
+                      "mean {:.4f} max {:.4f}{}".format(
+                          precision, latency, top1, value_mean, value_max,
+                          "" if ok else " (out of tolerance)"))
+        if ok and (best is None or latency < best[2]):
+            best = (precision, candidate, latency)
+    return best[0], best[1], report
+
+
+def export_model(model_file, output_file, board_width, board_height,
+                 precision="fp32", calibration_states=None):
+    """Export the weights in model_file to output_file, as ONNX if
+    output_file ends with .onnx, as a flat memory-mappable weights file if
+    it ends with .weights (see PolicyValueNet.load_shared), and as frozen
+    TorchScript otherwise.
+    precision: see reduce_precision (TorchScript only).
+    """
+    net = load_net(model_file, board_width, board_height)
+    if output_file.endswith(".weights"):
+        save_shared_weights(net.state_dict(), output_file)
+        return output_file
+    if precision != "fp32":
+        net = reduce_precision(net, precision, calibration_states)
+    example = torch.zeros((1, 4, board_width, board_height))
+    if output_file.endswith(".onnx"):
+        torch.onnx.export(net, example, output_file,
+                          input_names=["state"],
+                          output_names=["log_act_probs", "value"],
+                          dynamic_axes={"state": {0: "batch"},
+                                        "log_act_probs": {0: "batch"},
+                                        "value": {0: "batch"}})
+        return output_file
+    with torch.no_grad():
+        scripted = torch.jit.trace(net, example)
+    # fold the weights into the graph as constants where supported
+    if hasattr(torch.jit, "freeze"):
+        scripted = torch.jit.freeze(scripted)
+    scripted.save(output_file)
+    return output_file
+
+
+class InferenceEngine(object):
+    """Evaluator over an exported TorchScript or ONNX artifact.
+
+    Pickling keeps only the artifact path and the board size, and the
+    artifact is loaded again on unpickling, so policy_value_fn can be sent
+    to spawned worker processes (see mcts_alphaZero.RootParallelMCTS).
+    cpu_config: tuned CPU settings to apply (see
+    policy_value_net_pytorch.apply_cpu_config), None to leave the process
+    wide torch settings alone.
+    """
+
+    def __init__(self, model_file, board_width, board_height,
+                 cpu_config=None):
+        self.model_file = model_file
+        self.board_width = board_width
+        self.board_height = board_height
+        self.cpu_config = cpu_config
+        if cpu_config:
+            apply_cpu_config(cpu_config)
+        self._state_buffer = np.zeros((1, 4, board_width, board_height),
+                                      dtype=np.float32)
+        if model_file.endswith(".onnx"):
+            # optional dependency, only needed for ONNX artifacts
+            import onnxruntime
+            session = onnxruntime.InferenceSession(
+                model_file, providers=["CPUExecutionProvider"])
+            self._run = lambda state: session.run(None, {"state": state})
+        else:
+            module = torch.jit.load(model_file, map_location="cpu")
+            module.eval()
+
+            def run(state):
+                with torch.no_grad():
+                    log_act_probs, value = module(torch.from_numpy(state))
+                return log_act_probs.numpy(), value.numpy()
+            self._run = run
+
+    def __getstate__(self):
+        return (self.model_file, self.board_width, self.board_height,
+                self.cpu_config)
+
+    def __setstate__(self, state):
+        self.__init__(*state)
+
+    def policy_value(self, state_batch):
+        """
+        input: a batch of states
+        output: a batch of action probabilities and state values
+        """
+        state_batch = np.asarray(state_batch, dtype=np.float32)
+        log_act_probs, value = self._run(state_batch)
+        return np.exp(log_act_probs), value
+
+    def policy_value_fn(self, board):
+        """
+        input: board
+        output: a list of (action, probability) tuples for each available
+        action and the score of the board state
+        """
+        legal_positions = board.availables
+        fill_state(board, self._state_buffer[0])
+        log_act_probs, value = self._run(self._state_buffer)
+        act_probs = np.exp(log_act_probs[0])
+        return zip(legal_positions, act_probs[legal_positions]), \
+            float(value[0][0])
+
+
+def load_policy(model_file, board_width, board_height, use_gpu=False):
+    """Return an evaluator for model_file: an InferenceEngine for exported
+    .pt/.onnx artifacts, an inference-mode PolicyValueNet for .model files.
+    Both apply the tuned CPU settings of CPU_CONFIG_FILE, if there are any.
+    """
+    if model_file.endswith(".pt") or model_file.endswith(".onnx"):
+        return InferenceEngine(model_file, board_width, board_height,
+                               cpu_config=CPU_CONFIG_FILE)
+    return PolicyValueNet(board_width, board_height, model_file=model_file,
+                          use_gpu=use_gpu, inference=True)
+
+
+def usage():
+    print("-s Thiết lập kích thước bàn cờ, mặc định là 10")
+    print("-i File mô hình (.model) cần xuất")
+    print("-o File đầu ra: .pt (TorchScript), .onnx hoặc .weights (trọng số dùng chung qua mmap), mặc định thay đuôi .model bằng .pt")
+    print("-r Thiết lập số quân liên tiếp để thắng, mặc định là 6")
+    print("-p Độ chính xác: fp32, int8-dynamic, int8, bf16 hoặc auto (chọn bản nhanh nhất trong ngưỡng sai số), mặc định là fp32")
+
+
+if __name__ == '__main__':
+    import sys, getopt
+
+    width = height = 10
+    model_file = "model/10_10_6_best_policy_3.model"
+    output_file = None
+    n_in_row = 6
+    precision = "fp32"
+
+    opts, args = getopt.getopt(sys.argv[1:], "hs:i:o:r:p:")
+    for op, value in opts:
+        if op == "-h":
+            usage()
+            sys.exit()
+        elif op == "-s":
+            height = width = int(value)
+        elif op == "-i":
+            model_file = value
+        elif op == "-o":
+            output_file = value
+        elif op == "-r":
+            n_in_row = int(value)
+        elif op == "-p":
+            precision = value
+    if output_file is None:
+        output_file = model_file.rsplit(".", 1)[0] + ".pt"
+    states = None
+    if precision != "fp32":
+        policy = PolicyValueNet(width, height, model_file=model_file,
+                                inference=True)
+        states = collect_states(policy.policy_value_fn, width, height,
+                                n_in_row)
+    if precision == "auto":
+        net = load_net(model_file, width, height)
+        precision, _, report = select_precision(net, states)
+        print("\n".join(report))
+        print("Selected precision:", precision)
+    print("Exported to", export_model(model_file, output_file, width, height,
+                                      precision, states))
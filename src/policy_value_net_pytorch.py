@@ -13,7 +13,34 @@ import torch.nn as nn
 import torch.optim as optim
 import torch.nn.functional as F
 from torch.autograd import Variable
+import json
+import time
 import numpy as np
+from eval_cache import EvalCache
+
+
+# CPU inference settings written by `python benchmark.py --tune` and
+# applied by PolicyValueNet on construction
+CPU_CONFIG_FILE = "model/cpu_config.json"
+
+
+def apply_cpu_config(config_file=CPU_CONFIG_FILE):
+    """Apply the tuned thread counts of config_file, if it exists, and
+    return the config (None if there is none).
+    """
+    try:
+        with open(config_file) as f:
+            config = json.load(f)
+    except (IOError, ValueError):
+        return None
+    torch.set_num_threads(config["num_threads"])
+    try:
+        torch.set_num_interop_threads(config["num_interop_threads"])
+    except RuntimeError:
+        # can only be set once, before any inter-op parallel work started
+        pass
+    torch.set_flush_denormal(config.get("flush_denormal", True))
+    return config
 
 
 def set_learning_rate(optimizer, lr):
@@ -22,6 +49,64 @@ def set_learning_rate(optimizer, lr):
         param_group['lr'] = lr
 
 
+def save_shared_weights(net_params, weights_file):
+    """Write a state_dict as one flat float32 file plus a JSON header
+    (weights_file + '.json') with the name, shape and offset of each tensor,
+    so that load_shared_weights can memory-map it.
+    """
+    header, offset = [], 0
+    with open(weights_file, 'wb') as f:
+        for name, tensor in net_params.items():
+            array = tensor.detach().cpu().numpy().astype(np.float32)
+            f.write(np.ascontiguousarray(array).tobytes())
+            header.append([name, list(array.shape), offset])
+            offset += array.size
+    with open(weights_file + '.json', 'w') as f:
+        json.dump({'numel': offset, 'tensors': header}, f)
+
+
+def load_shared_weights(weights_file):
+    """Memory-map a file written by save_shared_weights and return a
+    state_dict of views into it. The mapping is private and read-only in
+    practice: every process that maps the same file shares its physical
+    pages, and a write (e.g. a training step) only copies the touched page.
+    """
+    with open(weights_file + '.json') as f:
+        header = json.load(f)
+    flat = torch.from_file(weights_file, shared=False,
+                           size=header['numel'], dtype=torch.float32)
+    net_params = {}
+    for name, shape, offset in header['tensors']:
+        numel = int(np.prod(shape))
+        net_params[name] = flat[offset:offset + numel].view(shape)
+    return net_params
+
+
+def fill_state(board, out):
+    """Write board.current_state() into the float32 array out, without
+    the float64 temporary and the reversed-stride copy.
+    """
+    out.fill(0)
+    if not board.states:
+        return
+    flip = board.width - 1
+    moves = np.fromiter(board.states.keys(), dtype=np.intp,
+                        count=len(board.states))
+    players = np.fromiter(board.states.values(), dtype=np.intp,
+                          count=len(board.states))
+    curr = players == board.current_player
+    out[0, flip - moves[curr] // board.height,
+        moves[curr] % board.height] = 1.0
+    out[1, flip - moves[~curr] // board.height,
+        moves[~curr] % board.height] = 1.0
+    for plane, plane_moves in ((2, board.last_moves),
+                               (3, board.curr_moves)):
+        if plane_moves:
+            plane_moves = np.array(plane_moves)
+            out[plane, flip - plane_moves // board.height,
+                plane_moves % board.height] = 1.0
+
+
 class Net(nn.Module):
     """policy-value network module"""
     def __init__(self, board_width, board_height):
@@ -49,11 +134,11 @@ class Net(nn.Module):
         x = F.relu(self.conv3(x))
         # action policy layers
         x_act = F.relu(self.act_conv1(x))
-        x_act = x_act.view(-1, 4*self.board_width*self.board_height)
+        x_act = x_act.reshape(-1, 4*self.board_width*self.board_height)
         x_act = F.log_softmax(self.act_fc1(x_act), dim=1)
         # state value layers
         x_val = F.relu(self.val_conv1(x))
-        x_val = x_val.view(-1, 2*self.board_width*self.board_height)
+        x_val = x_val.reshape(-1, 2*self.board_width*self.board_height)
         x_val = F.relu(self.val_fc1(x_val))
         x_val = F.tanh(self.val_fc2(x_val))
         return x_act, x_val
@@ -62,8 +147,16 @@ class Net(nn.Module):
 class PolicyValueNet():
     """policy-value network """
     def __init__(self, board_width, board_height,
-                 model_file=None, use_gpu=False):
+                 model_file=None, use_gpu=False, cache_size=0,
+                 inference=False, cpu_config=CPU_CONFIG_FILE,
+                 compile_train=False):
         self.use_gpu = use_gpu
+        # batch size for large policy_value calls in inference mode
+        self.eval_batch_size = None
+        if not use_gpu and cpu_config:
+            config = apply_cpu_config(cpu_config)
+            if config is not None:
+                self.eval_batch_size = config["batch_size"]
         self.board_width = board_width
         self.board_height = board_height
         self.l2_const = 1e-4  # coef of l2 penalty
@@ -72,17 +165,77 @@ class PolicyValueNet():
             self.policy_value_net = Net(board_width, board_height).cuda()
         else:
             self.policy_value_net = Net(board_width, board_height)
-        self.optimizer = optim.Adam(self.policy_value_net.parameters(),
-                                    weight_decay=self.l2_const)
+        # the Adam optimizer is only built by the first train_step, so that
+        # evaluation-only processes do not allocate it
+        self._optimizer = None
+        # state of train_step_fused
+        self._mse_loss = nn.MSELoss()
+        self._grad_scaler = None
+        self.compile_train = compile_train
+        self._compiled_net = None
+        self.samples_per_sec = None
+        # optional LRU cache of policy_value_fn results, keyed by position
+        # up to symmetry, cleared whenever the weights change
+        self.cache = EvalCache(cache_size) if cache_size else None
+        # inference mode: evaluate without autograd, in eval mode, from a
+        # float32 input buffer that is reused across calls
+        self._state_buffer = None
+        self.set_inference(inference)
 
         if model_file:
             self.load_model(model_file=model_file)
 
+    @property
+    def optimizer(self):
+        if self._optimizer is None:
+            self._optimizer = optim.Adam(self.policy_value_net.parameters(),
+                                         weight_decay=self.l2_const)
+        return self._optimizer
+
+    def set_inference(self, inference):
+        """Switch the inference-only fast path on or off."""
+        self.inference = inference
+        if inference:
+            self.policy_value_net.eval()
+        else:
+            self.policy_value_net.train()
+
+    def _input_buffer(self, n):
+        """A (n, 4, width, height) float32 view of the reusable input buffer,
+        grown when a larger batch comes in.
+        """
+        if self._state_buffer is None or len(self._state_buffer) < n:
+            self._state_buffer = torch.zeros(
+                (n, 4, self.board_width, self.board_height))
+        return self._state_buffer[:n]
+
+    def _forward(self, state_input):
+        """Run the net without gradients and return the action
+        probabilities and values as NumPy arrays (exp is taken in place).
+        """
+        if self.use_gpu:
+            state_input = state_input.cuda()
+        with torch.no_grad():
+            log_act_probs, value = self.policy_value_net(state_input)
+        act_probs = log_act_probs.cpu().numpy()
+        np.exp(act_probs, out=act_probs)
+        return act_probs, value.cpu().numpy()
+
     def policy_value(self, state_batch):
         """
         input: a batch of states
         output: a batch of action probabilities and state values
         """
+        if self.inference:
+            batch = self.eval_batch_size or len(state_batch)
+            if len(state_batch) > batch:
+                results = [self.policy_value(state_batch[i:i + batch])
+                           for i in range(0, len(state_batch), batch)]
+                act_probs, values = zip(*results)
+                return np.concatenate(act_probs), np.concatenate(values)
+            state_input = self._input_buffer(len(state_batch))
+            state_input.numpy()[:] = state_batch
+            return self._forward(state_input)
         if self.use_gpu:
             state_batch = Variable(torch.FloatTensor(state_batch).cuda())
             log_act_probs, value = self.policy_value_net(state_batch)
@@ -101,6 +254,27 @@ class PolicyValueNet():
         action and the score of the board state
         """
         legal_positions = board.availables
+        if self.cache is not None:
+            hit, key, sym = self.cache.lookup(board)
+            if hit is not None:
+                act_probs, value = hit
+                return zip(legal_positions, act_probs[legal_positions]), value
+        if self.inference:
+            state_input = self._input_buffer(1)
+            fill_state(board, state_input.numpy()[0])
+            act_probs, value = self._forward(state_input)
+            act_probs, value = act_probs[0], value.item()
+        else:
+            act_probs, value = self._policy_value_legacy(board)
+        if self.cache is not None:
+            self.cache.store(board, key, sym, act_probs, value)
+        act_probs = zip(legal_positions, act_probs[legal_positions])
+        return act_probs, value
+
+    def _policy_value_legacy(self, board):
+        """policy_value_fn evaluation with autograd, used outside of
+        inference mode.
+        """
         current_state = np.ascontiguousarray(board.current_state().reshape(
                 -1, 4, self.board_width, self.board_height))
         if self.use_gpu:
@@ -111,9 +285,7 @@ class PolicyValueNet():
             log_act_probs, value = self.policy_value_net(
                     Variable(torch.from_numpy(current_state)).float())
             act_probs = np.exp(log_act_probs.data.numpy().flatten())
-        act_probs = zip(legal_positions, act_probs[legal_positions])
-        value = value.data[0][0]
-        return act_probs, value
+        return act_probs, value.data[0][0]
 
     def train_step(self, state_batch, mcts_probs, winner_batch, lr):
         """perform a training step"""
@@ -127,6 +299,10 @@ class PolicyValueNet():
             mcts_probs = Variable(torch.FloatTensor(mcts_probs))
             winner_batch = Variable(torch.FloatTensor(winner_batch))
 
+        # the cached evaluations are stale once the weights move
+        if self.cache is not None:
+            self.cache.clear()
+        self.policy_value_net.train()
         # zero the parameter gradients
         self.optimizer.zero_grad()
         # set learning rate
@@ -147,11 +323,113 @@ class PolicyValueNet():
         entropy = -torch.mean(
                 torch.sum(torch.exp(log_act_probs) * log_act_probs, 1)
                 )
+        if self.inference:
+            self.policy_value_net.eval()
         if self.use_gpu:
             return loss.cpu().data[0],entropy.cpu().data[0]
         else:
             return loss.item(), entropy.item()
 
+    def _as_tensor(self, batch):
+        """Pre-stacked float32 arrays/tensors become tensors without a copy."""
+        batch = torch.as_tensor(np.asarray(batch, dtype=np.float32)
+                                if not torch.is_tensor(batch) else batch)
+        return batch.cuda() if self.use_gpu else batch
+
+    def train_step_fused(self, state_batch, mcts_probs, winner_batch, lr,
+                         old_probs=None, kl_limit=None,
+                         accumulation_steps=1, mixed_precision=False):
+        """A training step that also measures the policy KL and entropy from
+        its own forward pass, instead of separate policy_value calls.
+        state_batch, mcts_probs, winner_batch: pre-stacked float32 tensors or
+            arrays (no per-call re-wrapping of Python lists)
+        old_probs: reference action probabilities; the KL from them to the
+            net's current output (before this step's update) is returned
+        kl_limit: if that KL exceeds it, the update is skipped
+        accumulation_steps: split the batch into that many micro-batches
+            and accumulate their gradients, for an effective batch larger
+            than fits in memory at once
+        mixed_precision: run the forward pass under autocast, float16 with
+            loss scaling on the GPU and bfloat16 on the CPU
+        Return: loss, entropy, kl (None without old_probs), the action
+            probabilities and values of the forward pass (before the
+            update) as NumPy arrays, and whether the update was applied.
+            The throughput of the step is left in self.samples_per_sec.
+        """
+        start = time.time()
+        state_batch = self._as_tensor(state_batch)
+        mcts_probs = self._as_tensor(mcts_probs)
+        winner_batch = self._as_tensor(winner_batch)
+        if self.cache is not None:
+            self.cache.clear()
+        net = self._training_net()
+        net.train()
+        self.optimizer.zero_grad()
+        set_learning_rate(self.optimizer, lr)
+        device = "cuda" if self.use_gpu else "cpu"
+        dtype = torch.float16 if self.use_gpu else torch.bfloat16
+        use_amp = mixed_precision and hasattr(torch, "autocast")
+        if use_amp and self.use_gpu and self._grad_scaler is None:
+            self._grad_scaler = torch.cuda.amp.GradScaler()
+        scaler = self._grad_scaler if use_amp and self.use_gpu else None
+
+        n = len(state_batch)
+        log_probs, values, loss_sum = [], [], 0.0
+        for chunk in np.array_split(np.arange(n), accumulation_steps):
+            if not len(chunk):
+                continue
+            lo, hi = chunk[0], chunk[-1] + 1
+            with torch.autocast(device, dtype=dtype, enabled=use_amp):
+                log_act_probs, value = net(state_batch[lo:hi])
+            log_act_probs, value = log_act_probs.float(), value.float()
+            # loss = (z - v)^2 - pi^T * log(p), L2 penalty in the optimizer
+            value_loss = self._mse_loss(value.view(-1),
+                                        winner_batch[lo:hi])
+            policy_loss = -torch.mean(
+                torch.sum(mcts_probs[lo:hi] * log_act_probs, 1))
+            loss = (value_loss + policy_loss) * (hi - lo) / n
+            if scaler is not None:
+                scaler.scale(loss).backward()
+            else:
+                loss.backward()
+            loss_sum += loss.item()
+            log_probs.append(log_act_probs.detach())
+            values.append(value.detach())
+
+        log_act_probs = torch.cat(log_probs)
+        act_probs = torch.exp(log_act_probs)
+        # policy entropy, for monitoring only
+        entropy = -torch.mean(torch.sum(act_probs * log_act_probs, 1)).item()
+        kl = None
+        if old_probs is not None:
+            old_probs = self._as_tensor(old_probs)
+            kl = torch.mean(torch.sum(old_probs * (
+                torch.log(old_probs + 1e-10) - torch.log(act_probs + 1e-10)),
+                1)).item()
+        stepped = kl_limit is None or kl is None or kl <= kl_limit
+        if stepped:
+            if scaler is not None:
+                scaler.step(self.optimizer)
+                scaler.update()
+            else:
+                self.optimizer.step()
+        self.optimizer.zero_grad()
+        if self.inference:
+            self.policy_value_net.eval()
+        self.samples_per_sec = n / (time.time() - start)
+        return (loss_sum, entropy, kl, act_probs.cpu().numpy(),
+                torch.cat(values).cpu().numpy(), stepped)
+
+    def _training_net(self):
+        """The module used by train_step_fused: compiled with torch.compile
+        if compile_train was set (and torch has it), else the net itself.
+        """
+        if self.compile_train and hasattr(torch, "compile"):
+            if self._compiled_net is None:
+                self._compiled_net = torch.compile(self.policy_value_net)
+            return self._compiled_net
+        return self.policy_value_net
+
     def get_policy_param(self):
         net_params = self.policy_value_net.state_dict()
         return net_params
@@ -163,6 +441,26 @@ class PolicyValueNet():
 
     def load_model(self, model_file):
         """load model params from file"""
+        if model_file.endswith('.weights'):
+            self.load_shared(model_file)
+            return
         # net_params = torch.load(model_file)
         net_params = torch.load(model_file, map_location=lambda storage, loc:storage)
-        self.policy_value_net.load_state_dict(net_params)
\ No newline at end of file
+        self.policy_value_net.load_state_dict(net_params)
+        if self.cache is not None:
+            self.cache.clear()
+
+    def load_shared(self, weights_file):
+        """Point the net's parameters at a memory-mapped weights file (see
+        save_shared_weights) instead of copying them in. Can be called again
+        to swap to another checkpoint without rebuilding the net.
+        """
+        net_params = load_shared_weights(weights_file)
+        if self.use_gpu:
+            self.policy_value_net.load_state_dict(net_params)
+        else:
+            for name, tensor in self.policy_value_net.state_dict(
+                    keep_vars=True).items():
+                tensor.data = net_params[name]
+        if self.cache is not None:
+            self.cache.clear()
\ No newline at end of file
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+"""
+A self-play replay buffer that stores every position once, up to symmetry
+
+Self-play from one model repeats openings, and TrainPipeline.get_equi_data
+stores 8 rotated/reflected copies of every position on top of that. This
+buffer keys positions by the canonical form of their state planes under the
+8 symmetries of the board. A repeated position updates the running mean of
+its MCTS probabilities and winner and increments its count, which is used as
+its sampling weight. The symmetric copies are drawn at sample time instead of
+being stored.
+
+"""
+
+from collections import OrderedDict
+import numpy as np
+
+
+class DedupReplayBuffer(object):
+    """Replay buffer of canonical positions with occurrence counts."""
+
+    def __init__(self, board_width, board_height, maxlen=10000):
+        if board_width != board_height:
+            raise ValueError("symmetry deduplication needs a square board")
+        self.board_width = board_width
+        self.board_height = board_height
+        self.maxlen = maxlen
+        # canonical key -> [state, mcts_prob, winner, count], oldest first
+        self._entries = OrderedDict()
+        self.n_added = 0
+
+    def _transform(self, state, mcts_prob, k, flip):
+        """Rotate by k*90 degrees, then optionally flip left-right, the same
+        way as get_equi_data: the move probabilities are indexed by
+        h*width+w, the state planes are flipped vertically.
+        """
+        state = np.rot90(state, k, axes=(1, 2))
+        prob = np.rot90(np.flipud(
+            mcts_prob.reshape(self.board_height, self.board_width)), k)
+        if flip:
+            state = state[:, :, ::-1]
+            prob = np.fliplr(prob)
+        return state, np.flipud(prob).flatten()
+
+    def canonical(self, state, mcts_prob):
+        """Return the canonical key of the position and the state and move
+        probabilities in the canonical orientation.
+        """
+        best = None
+        for k in range(4):
+            for flip in (False, True):
+                equi_state, equi_prob = self._transform(state, mcts_prob,
+                                                        k, flip)
+                key = equi_state.astype(np.int8).tobytes()
+                if best is None or key < best[0]:
+                    best = (key, equi_state, equi_prob)
+        return best
+
+    def extend(self, play_data):
+        """Add [(state, mcts_prob, winner_z), ...] of one game (without
+        augmentation).
+        """
+        for state, mcts_prob, winner in play_data:
+            key, state, mcts_prob = self.canonical(state, mcts_prob)
+            self.n_added += 1
+            entry = self._entries.get(key)
+            if entry is None:
+                self._entries[key] = [np.ascontiguousarray(state), mcts_prob,
+                                      float(winner), 1]
+                if len(self._entries) > self.maxlen:
+                    self._entries.popitem(last=False)
+                continue
+            # running mean of the targets over the occurrences
+            entry[3] += 1
+            entry[1] = entry[1] + (mcts_prob - entry[1]) / entry[3]
+            entry[2] += (winner - entry[2]) / entry[3]
+            self._entries.move_to_end(key)
+
+    def sample(self, batch_size):
+        """Draw batch_size positions with replacement, each with probability
+        proportional to its count, as if the repeats had been stored, and in
+        a random one of its 8 orientations.
+        Return: [(state, mcts_prob, winner_z), ...]
+        """
+        entries = list(self._entries.values())
+        counts = np.array([entry[3] for entry in entries], dtype=np.float64)
+        chosen = np.random.choice(len(entries), batch_size, replace=True,
+                                  p=counts / counts.sum())
+        mini_batch = []
+        for i in chosen:
+            state, mcts_prob, winner, _ = entries[i]
+            state, mcts_prob = self._transform(state, mcts_prob,
+                                               np.random.randint(4),
+                                               np.random.randint(2))
+            mini_batch.append((state, mcts_prob, winner))
+        return mini_batch
+
+    def dedup_ratio(self):
+        """Stored positions per position added."""
+        return 1.0 * len(self) / self.n_added if self.n_added else 1.0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __str__(self):
+        return "replay buffer: {} positions from {} added ({:.3f})".format(
+            len(self), self.n_added, self.dedup_ratio())
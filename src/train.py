@@ -12,16 +12,20 @@ import random
 import numpy as np
 from collections import defaultdict, deque
 from game import Board, Game
+from game_record import GameRecordWriter
 from mcts_pure import MCTSPlayer as MCTS_Pure
 from mcts_alphaZero import MCTSPlayer
 from policy_value_net_pytorch import PolicyValueNet  # Pytorch
+from replay_buffer import DedupReplayBuffer
 
 
 
 class TrainPipeline():
     def __init__(self, init_model=None, board_width=6, board_height=6,
                  n_in_row=4, n_playout=400, use_gpu=False, is_shown=False,
-                 output_file_name="", game_batch_number=1500):
+                 output_file_name="", game_batch_number=1500,
+                 pure_mcts_workers=0, eval_cache_size=0, dedup_buffer=False,
+                 features_path=None, record_path=None):
         # params of the board and the game
         self.board_width = board_width
         self.board_height = board_height
@@ -38,24 +42,55 @@ class TrainPipeline():
         self.c_puct = 5
         self.buffer_size = 10000
         self.batch_size = 512  # mini-batch size for training
-        self.data_buffer = deque(maxlen=self.buffer_size)
+        # with dedup_buffer, positions are stored once up to symmetry with a
+        # count as sampling weight; each stands for its 8 augmented copies
+        self.dedup_buffer = dedup_buffer
+        if dedup_buffer:
+            self.data_buffer = DedupReplayBuffer(self.board_width,
+                                                 self.board_height,
+                                                 self.buffer_size // 8)
+        else:
+            self.data_buffer = deque(maxlen=self.buffer_size)
         self.play_batch_size = 1
         self.epochs = 5  # num of train_steps for each update
         self.kl_targ = 0.02
+        # micro-batches per training step (gradient accumulation) and
+        # autocast to float16/bfloat16 in the training forward pass
+        self.accumulation_steps = 1
+        self.mixed_precision = False
         self.check_freq = 50
         self.game_batch_num = game_batch_number
         self.best_win_ratio = 0.0
         # num of simulations used for the pure mcts, which is used as
         # the opponent to evaluate the trained policy
         self.pure_mcts_playout_num = 1000
+        # random games per leaf of the pure mcts, played by the vectorized
+        # rollout engine (0 falls back to the move-by-move Python rollout)
+        self.pure_mcts_rollout_num = 1
+        # rollout processes of the pure mcts (0 runs the search in-process)
+        self.pure_mcts_workers = pure_mcts_workers
         self.use_gpu = use_gpu
         self.is_shown = is_shown
         self.output_file_name = output_file_name
         self.policy_value_net = PolicyValueNet(self.board_width,
                                                self.board_height,
                                                model_file=init_model,
-                                               use_gpu=self.use_gpu
+                                               use_gpu=self.use_gpu,
+                                               cache_size=eval_cache_size,
+                                               inference=True
                                                )
+        # explain features of the self-play positions, written straight from
+        # the board instead of the FEN strings appended to fen.csv
+        self.feature_sink = None
+        if features_path is not None:
+            # optional dependency, only needed to produce explain data
+            from explain_chess.feature_sink import SelfPlayFeatureSink
+            self.feature_sink = SelfPlayFeatureSink(features_path)
+        # binary archive of the self-play games (see game_record.py)
+        self.recorder = None
+        if record_path is not None:
+            self.recorder = GameRecordWriter(record_path, board_width,
+                                             board_height, n_in_row)
         self.mcts_player = MCTSPlayer(self.policy_value_net.policy_value_fn,
                                       c_puct=self.c_puct,
                                       n_playout=self.n_playout,
@@ -87,10 +122,15 @@ class TrainPipeline():
     def collect_selfplay_data(self, n_games=1):
         """collect self-play data for training"""
         for i in range(n_games):
-            winner, play_data = self.game.start_self_play(self.mcts_player,
-                                                          temp=self.temp)
+            winner, play_data = self.game.start_self_play(
+                self.mcts_player, temp=self.temp,
+                feature_sink=self.feature_sink, recorder=self.recorder)
             play_data = list(play_data)[:]
             self.episode_len = len(play_data)
+            if self.dedup_buffer:
+                # symmetric copies are drawn when sampling
+                self.data_buffer.extend(play_data)
+                continue
             # augment the data
             play_data = self.get_equi_data(play_data)
             self.data_buffer.extend(play_data)
@@ -98,24 +138,43 @@ class TrainPipeline():
 
     def policy_update(self):
         """update the policy-value net"""
-        mini_batch = random.sample(self.data_buffer, self.batch_size)
-        state_batch = [data[0] for data in mini_batch]
-        mcts_probs_batch = [data[1] for data in mini_batch]
-        winner_batch = [data[2] for data in mini_batch]
-        old_probs, old_v = self.policy_value_net.policy_value(state_batch)
+        if self.dedup_buffer:
+            mini_batch = self.data_buffer.sample(self.batch_size)
+        else:
+            mini_batch = random.sample(self.data_buffer, self.batch_size)
+        # stack the batch once; every epoch reuses the same tensors
+        state_batch = np.array([data[0] for data in mini_batch], dtype=np.float32)
+        mcts_probs_batch = np.array([data[1] for data in mini_batch], dtype=np.float32)
+        winner_batch = np.array([data[2] for data in mini_batch], dtype=np.float32)
+        # each step's forward pass gives the policy after the previous
+        # update, so the KL is measured there instead of by an extra
+        # policy_value call per epoch
+        old_probs = None
         for i in range(self.epochs):
-            loss, entropy = self.policy_value_net.train_step(
+            step_loss, step_entropy, kl, new_probs, new_v, stepped = \
+                self.policy_value_net.train_step_fused(
                     state_batch,
                     mcts_probs_batch,
                     winner_batch,
-                    self.learn_rate*self.lr_multiplier)
+                    self.learn_rate*self.lr_multiplier,
+                    old_probs=old_probs,
+                    kl_limit=self.kl_targ * 4,  # early stopping if D_KL diverges badly
+                    accumulation_steps=self.accumulation_steps,
+                    mixed_precision=self.mixed_precision)
+            print("epoch {}: {:.0f} samples/s".format(
+                i + 1, self.policy_value_net.samples_per_sec))
+            if i == 0:
+                old_probs, old_v = new_probs, new_v
+            if not stepped:
+                break
+            loss, entropy = step_loss, step_entropy
+        else:
+            # all epochs ran: evaluate the policy after the last update
             new_probs, new_v = self.policy_value_net.policy_value(state_batch)
             kl = np.mean(np.sum(old_probs * (
                     np.log(old_probs + 1e-10) - np.log(new_probs + 1e-10)),
                     axis=1)
             )
-            if kl > self.kl_targ * 4:  # early stopping if D_KL diverges badly
-                break
         # adaptively adjust the learning rate
         if kl > self.kl_targ * 2 and self.lr_multiplier > 0.1:
             self.lr_multiplier /= 1.5
@@ -151,14 +210,19 @@ class TrainPipeline():
                                          c_puct=self.c_puct,
                                          n_playout=self.n_playout)
         pure_mcts_player = MCTS_Pure(c_puct=5,
-                                     n_playout=self.pure_mcts_playout_num)
+                                     n_playout=self.pure_mcts_playout_num,
+                                     n_rollout=self.pure_mcts_rollout_num,
+                                     n_workers=self.pure_mcts_workers)
         win_cnt = defaultdict(int)
-        for i in range(n_games):
-            winner = self.game.start_play(current_mcts_player,
-                                          pure_mcts_player,
-                                          start_player=i % 2,
-                                          is_shown=self.is_shown)
-            win_cnt[winner] += 1
+        try:
+            for i in range(n_games):
+                winner = self.game.start_play(current_mcts_player,
+                                              pure_mcts_player,
+                                              start_player=i % 2,
+                                              is_shown=self.is_shown)
+                win_cnt[winner] += 1
+        finally:
+            pure_mcts_player.close()
         win_ratio = 1.0*(win_cnt[1] + 0.5*win_cnt[-1]) / n_games
         print("num_playouts:{}, win: {}, lose: {}, tie:{}".format(
                 self.pure_mcts_playout_num,
@@ -171,8 +235,17 @@ class TrainPipeline():
             for i in range(self.game_batch_num):
                 self.collect_selfplay_data(self.play_batch_size)
                 print("batch i:{}, episode_len:{}".format(i + 1, self.episode_len))
+                if self.policy_value_net.cache is not None:
+                    print(self.policy_value_net.cache)
+                if self.dedup_buffer:
+                    print(self.data_buffer)
         except KeyboardInterrupt:
             print('\nQuit')
+        finally:
+            if self.feature_sink is not None:
+                self.feature_sink.close()
+            if self.recorder is not None:
+                self.recorder.close()
 
     def run(self):
         """run the training pipeline"""
@@ -185,6 +258,10 @@ class TrainPipeline():
                 self.collect_selfplay_data(self.play_batch_size)
                 print("batch i:{}, episode_len:{}".format(
                         i+1, self.episode_len))
+                if self.policy_value_net.cache is not None:
+                    print(self.policy_value_net.cache)
+                if self.dedup_buffer:
+                    print(self.data_buffer)
                 if len(self.data_buffer) > self.batch_size:
                     loss, entropy = self.policy_update()
                     with open("info/" + str(self.board) + "_loss_" + self.output_file_name + ".txt", 'a') as loss_file:
@@ -215,6 +292,11 @@ class TrainPipeline():
                             self.best_win_ratio = 0.0
         except KeyboardInterrupt:
             print('\n\rquit')
+        finally:
+            if self.feature_sink is not None:
+                self.feature_sink.close()
+            if self.recorder is not None:
+                self.recorder.close()
         loss_file.close()
         win_ratio_file.close()
 
@@ -227,6 +309,11 @@ def usage():
     print("-n Thiết lập số ván dùng để huấn luyện, mặc định là 1500")
     print("--use_gpu Sử dụng GPU để huấn luyện")
     print("--graphics Hiển thị giao diện đồ họa khi đánh giá mô hình")
+    print("--cache Số thế cờ tối đa trong bộ nhớ đệm đánh giá của mạng (LRU, theo đối xứng), mặc định là 0 (tắt)")
+    print("--pure_workers Số tiến trình rollout song song của đối thủ pure MCTS khi đánh giá, mặc định là 0")
+    print("--features Ghi đặc trưng giải thích của các thế cờ tự chơi thẳng vào file này (feature store hoặc .csv) thay vì ghi FEN vào fen.csv")
+    print("--record Lưu các ván tự chơi (nước đi, xác suất MCTS, người thắng) vào file lưu trữ nhị phân này")
+    print("--dedup Lưu mỗi thế cờ một lần (theo đối xứng) trong bộ đệm huấn luyện, số lần xuất hiện làm trọng số lấy mẫu")
 
 
 if __name__ == '__main__':
@@ -242,8 +329,14 @@ if __name__ == '__main__':
     game_batch_number = 1500
     init_model_name = None
     battle=False
+    pure_mcts_workers = 0
+    eval_cache_size = 0
+    dedup_buffer = False
+    features_path = None
+    record_path = None
 
-    opts, args = getopt.getopt(sys.argv[1:], "hs:r:m:go:n:i:", ["use_gpu", "graphics"])
+    opts, args = getopt.getopt(sys.argv[1:], "hs:r:m:go:n:i:", ["use_gpu", "graphics", "pure_workers=", "cache=", "dedup",
+                                                                  "features=", "record="])
     for op, value in opts:
         if op == "-h":
             usage()
@@ -264,11 +357,26 @@ if __name__ == '__main__':
             init_model_name = value
         elif op == "-n":
             game_batch_number = int(value)
+        elif op == "--pure_workers":
+            pure_mcts_workers = int(value)
+        elif op == "--cache":
+            eval_cache_size = int(value)
+        elif op == "--dedup":
+            dedup_buffer = True
+        elif op == "--features":
+            features_path = value
+        elif op == "--record":
+            record_path = value
 
     training_pipeline = TrainPipeline(board_height=height, board_width=width,
                                       n_in_row=n_in_row, use_gpu=use_gpu,
                                       n_playout=n_playout, is_shown=is_shown,
                                       output_file_name=output_file_name,
                                       init_model=init_model_name,
-                                      game_batch_number=game_batch_number)
+                                      game_batch_number=game_batch_number,
+                                      pure_mcts_workers=pure_mcts_workers,
+                                      eval_cache_size=eval_cache_size,
+                                      dedup_buffer=dedup_buffer,
+                                      features_path=features_path,
+                                      record_path=record_path)
     training_pipeline.run_self()
@@ -19,7 +19,7 @@ n_playout = 800
 ##############################################
 from game import *
 from mcts_alphaZero import MCTSPlayer
-from policy_value_net_pytorch import PolicyValueNet  # Pytorch
+from policy_value_engine import load_policy  # Pytorch
 import sys
 import os
 import time
@@ -69,6 +69,7 @@ class ChessBoard(QWidget):
     signalAIFirst = pyqtSignal(bool)
     signalHumanDraw_ChessCoordinates = pyqtSignal(int, int)
     signalDraw_Finished = pyqtSignal(bool)
+    signalClosed = pyqtSignal()
     def __init__(self):
         super(ChessBoard, self).__init__()
         
@@ -208,6 +209,7 @@ class ChessBoard(QWidget):
     
     def closeEvent(self, event):
         event.accept()
+        self.signalClosed.emit() # 先关闭AI玩家的搜索进程
         sys.exit()
     ######################################################
     
@@ -326,6 +328,7 @@ class UserInterface_GO_Human_vs_AI(QWidget):
         
     def test(self):
         self.interface.signalAIFirst.connect(self.cycleInitialize)
+        self.interface.signalClosed.connect(self.AI.close)
         self.signalOfDrawnChess.connect(self.interface.draw)
         self.signalOfWinner.connect(self.interface.graphicsGameOver)
         self.interface.initialize(self.scale)
@@ -373,13 +376,16 @@ class UserInterface_GO_Human_vs_AI(QWidget):
     
 def run(n_in_row, width, height, # 几子棋，棋盘宽度，高度
         model_file, ai_first, # 载入的模型文件，是否AI先下棋
-        n_playout, use_gpu): # AI每次进行蒙特卡洛的模拟次数，是否使用GPU
+        n_playout, use_gpu, # AI每次进行蒙特卡洛的模拟次数，是否使用GPU
+        search_workers=0): # 并行搜索的进程数，0表示单进程搜索
+    mcts_player = None
     try:
         board = Board(width=width, height=height, n_in_row=n_in_row) # 产生一个棋盘
 
         # ############### human VS AI ###################
-        best_policy = PolicyValueNet(width, height, model_file=model_file, use_gpu=use_gpu) # 加载最佳策略网络
-        mcts_player = MCTSPlayer(best_policy.policy_value_fn, c_puct=5, n_playout=n_playout) # 生成一个AI玩家
+        best_policy = load_policy(model_file, width, height, use_gpu=use_gpu) # 加载最佳策略网络(.model或导出的.pt/.onnx)
+        mcts_player = MCTSPlayer(best_policy.policy_value_fn, c_puct=5, n_playout=n_playout,
+                                 n_search_workers=search_workers) # 生成一个AI玩家
         main = UserInterface_GO_Human_vs_AI(mcts_player, board, width, height,)
         
         main.test()
@@ -387,14 +393,18 @@ def run(n_in_row, width, height, # 几子棋，棋盘宽度，高度
 #        game.start_play(human, mcts_player, start_player=ai_first, is_shown=1) # 开始游戏
     except KeyboardInterrupt:
         print('\n\rquit')
+    finally:
+        if mcts_player is not None:
+            mcts_player.close() # 关闭并行搜索的进程
 
 def usage():
     print("-s 设置棋盘大小，默认为6")
     print("-r 设置是几子棋，默认为4")
     print("-m 设置每步棋执行MCTS模拟的次数，默认为400")
-    print("-i ai使用哪个文件中的模型，默认为model/6_6_4_best_policy.model")
+    print("-i ai使用哪个文件中的模型，默认为model/6_6_4_best_policy.model（也可以是policy_value_engine.py导出的.pt/.onnx）")
     print("--use_gpu 使用GPU进行运算")
     print("--human_first 让人类先下")
+    print("--search_workers 使用多少个进程并行搜索，默认为0（单进程）")
     
     
 #if __name__ == '__main__':
@@ -431,8 +441,9 @@ if __name__ == '__main__':
     model_file = "model/10_10_6_current_policy_.model"
 #    model_file = "model/10_10_6_best_policy_3.model"
     ai_first=True
+    search_workers = 0
 
-    opts, args = getopt.getopt(sys.argv[1:], "hs:r:m:i:", ["use_gpu", "graphics", "human_first"])
+    opts, args = getopt.getopt(sys.argv[1:], "hs:r:m:i:", ["use_gpu", "graphics", "human_first", "search_workers="])
     for op, value in opts:
         if op == "-h":
             usage()
@@ -449,5 +460,7 @@ if __name__ == '__main__':
             model_file = value
         elif op == "--human_first":
             ai_first=False
+        elif op == "--search_workers":
+            search_workers = int(value)
     run(height=height, width=width, n_in_row=n_in_row, use_gpu=use_gpu, n_playout=n_playout,
-        model_file=model_file, ai_first=ai_first)
+        model_file=model_file, ai_first=ai_first, search_workers=search_workers)
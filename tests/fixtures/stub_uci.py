@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+A minimal UCI engine for the EnginePool tests. The score of a position is a
+fixed hash of its FEN, in -200..200 centipawns, and the best move is the
+first legal move.
+
+Environment:
+- STUB_UCI_LOG: append the FEN of every analysed position to this file
+- STUB_UCI_DIE: if this file exists, delete it and exit on the next "go",
+  as a crashed engine would
+- STUB_UCI_DELAY: seconds to think per position, default 0
+"""
+import os
+import sys
+import time
+import zlib
+
+import chess
+
+
+def stub_score(fen):
+    return zlib.crc32(fen.encode()) % 401 - 200
+
+
+def main():
+    board = chess.Board()
+    for line in sys.stdin:
+        cmd = line.split()
+        if not cmd:
+            continue
+        if cmd[0] == "uci":
+            print("id name stub\nuciok", flush=True)
+        elif cmd[0] == "isready":
+            print("readyok", flush=True)
+        elif cmd[0] == "position":
+            board = chess.Board(" ".join(cmd[2:8]) if cmd[1] == "fen" else chess.STARTING_FEN)
+            if "moves" in cmd:
+                for move in cmd[cmd.index("moves") + 1:]:
+                    board.push_uci(move)
+        elif cmd[0] == "go":
+            die = os.environ.get("STUB_UCI_DIE")
+            if die and os.path.exists(die):
+                os.remove(die)
+                sys.exit(1)
+            if os.environ.get("STUB_UCI_LOG"):
+                with open(os.environ["STUB_UCI_LOG"], "a") as f:
+                    f.write(board.fen() + "\n")
+            time.sleep(float(os.environ.get("STUB_UCI_DELAY", 0)))
+            print("info depth 1 score cp {}".format(stub_score(board.fen())), flush=True)
+            print("bestmove " + next(iter(board.legal_moves)).uci(), flush=True)
+        elif cmd[0] == "quit":
+            break
+
+
+if __name__ == "__main__":
+    main()
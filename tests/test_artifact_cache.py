@@ -0,0 +1,70 @@
+import os
+
+from explain_chess.artifact_cache import ArtifactCache, artifact_key, file_digest
+
+
+def counting(value, calls):
+    def compute():
+        calls.append(value)
+        return value
+    return compute
+
+
+def test_cached_computes_once_per_key(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    calls = []
+    assert cache.cached("model", "a", counting({"x": 1}, calls)) == {"x": 1}
+    assert cache.cached("model", "a", counting({"x": 2}, calls)) == {"x": 1}
+    assert cache.cached("model", "b", counting({"x": 3}, calls)) == {"x": 3}
+    assert calls == [{"x": 1}, {"x": 3}]
+    cache.clear("model")
+    assert cache.cached("model", "a", counting({"x": 4}, calls)) == {"x": 4}
+
+
+def test_keys_follow_the_data_and_the_parameters(tmp_path):
+    store = tmp_path / "store"
+    store.mkdir()
+    (store / "a.bin").write_bytes(b"\x00\x01")
+    features_key = artifact_key(file_digest(str(store)), 1)
+    assert features_key == artifact_key(file_digest(str(store)), 1)
+    assert features_key != artifact_key(file_digest(str(store)), 2)
+
+    split_key = artifact_key(features_key, "RandomUnderSampler", 0.2, 42)
+    assert split_key != artifact_key(features_key, "RandomUnderSampler", 0.3, 42)
+
+    # đổi nội dung hay thêm file đều đổi khóa, và mọi bước sau theo đó
+    (store / "a.bin").write_bytes(b"\x00\x02")
+    changed_key = artifact_key(file_digest(str(store)), 1)
+    assert changed_key != features_key
+    assert artifact_key(changed_key, "RandomUnderSampler", 0.2, 42) != split_key
+    (store / "a.bin").write_bytes(b"\x00\x01")
+    (store / "b.bin").write_bytes(b"")
+    assert artifact_key(file_digest(str(store)), 1) != features_key
+
+
+def test_outputs_are_restored_on_a_hit(tmp_path):
+    cache = ArtifactCache(str(tmp_path / "cache"))
+    output_path = str(tmp_path / "shap.csv")
+
+    def compute():
+        with open(output_path, "w") as f:
+            f.write("a,b\n1,2\n")
+        return 42
+
+    assert cache.cached("shap", "k", compute, outputs=(output_path,)) == 42
+    os.remove(output_path)
+
+    def fail():
+        raise AssertionError("should come from the cache")
+
+    assert cache.cached("shap", "k", fail, outputs=(output_path,)) == 42
+    with open(output_path) as f:
+        assert f.read() == "a,b\n1,2\n"
+
+    # một output bị mất khỏi cache thì bước được tính lại
+    for name in os.listdir(str(tmp_path / "cache" / "shap")):
+        if name.endswith(".csv"):
+            os.remove(str(tmp_path / "cache" / "shap" / name))
+    calls = []
+    assert cache.cached("shap", "k", counting(7, calls), outputs=(output_path,)) == 7
+    assert calls == [7]
@@ -0,0 +1,28 @@
+import json
+
+from benchmark import tune
+
+
+def test_tune_picks_threads_at_the_player_batch_size(tmp_path):
+    config_file = str(tmp_path / "cpu_config.json")
+    config = tune(None, 6, 6, batch_size=2, batch_sizes=(1, 4), n_calls=8,
+                  config_file=config_file)
+    with open(config_file) as f:
+        assert json.load(f) == config
+    assert config["tuned_batch_size"] == 2
+    assert [row["batch_size"] for row in config["best_per_batch"]] == [1, 2, 4]
+    table = config["measurements"]
+    for best in config["best_per_batch"]:
+        rows = [row for row in table if row["batch_size"] == best["batch_size"]]
+        assert best["positions_per_sec"] == max(
+            row["positions_per_sec"] for row in rows)
+    at_player_batch = config["best_per_batch"][1]
+    assert config["num_threads"] == at_player_batch["num_threads"]
+    assert (config["num_interop_threads"] ==
+            at_player_batch["num_interop_threads"])
+    same_threads = [row for row in table
+                    if row["num_threads"] == config["num_threads"] and
+                    row["num_interop_threads"] ==
+                    config["num_interop_threads"]]
+    assert config["positions_per_sec"] == max(
+        row["positions_per_sec"] for row in same_threads)
@@ -0,0 +1,40 @@
+import os
+
+import numpy as np
+import pandas as pd
+
+from explain_chess.feature_store import CONNECT6_SCHEMA, cast_columns
+from explain_chess.fen_to_features import (CONNECT6_COLUMNS, Connect6GameFeatures, parse_connect6_fen,
+                                           parse_connect6_fens, parse_connect6_fens_incremental)
+
+FEN_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       "src", "kaggle", "output", "fen.csv")
+
+
+def read_fens(n_lines=500):
+    return pd.read_csv(FEN_CSV, nrows=n_lines)["fen"].tolist()
+
+
+def as_rows(columns):
+    columns = cast_columns(columns, CONNECT6_SCHEMA)
+    return np.stack([np.asarray(columns[name], dtype=np.int64) for name in CONNECT6_COLUMNS], axis=1)
+
+
+def test_batch_parsing_matches_parse_connect6_fen():
+    fens = [fen for fen in read_fens() if not fen.startswith("=")]
+    columns = parse_connect6_fens(fens)
+    assert list(columns) == CONNECT6_COLUMNS
+    expected = pd.DataFrame([parse_connect6_fen(fen) for fen in fens])
+    for name in CONNECT6_COLUMNS:
+        assert list(columns[name]) == list(expected[name]), name
+
+
+def test_incremental_parsing_matches_batch_parsing():
+    fens = read_fens()
+    expected = as_rows(parse_connect6_fens([fen for fen in fens if not fen.startswith("=")]))
+    np.testing.assert_array_equal(as_rows(parse_connect6_fens_incremental(fens)), expected)
+    # a game cut between two chunks goes on with the same extractor
+    extractor = Connect6GameFeatures()
+    chunks = [parse_connect6_fens_incremental(fens[i:i + 37], extractor)
+              for i in range(0, len(fens), 37)]
+    np.testing.assert_array_equal(np.concatenate([as_rows(chunk) for chunk in chunks]), expected)
@@ -0,0 +1,62 @@
+import os
+
+import numpy as np
+import pytest
+
+from explain_chess.dedup import Connect6Dedup
+from explain_chess.feature_store import CONNECT6_SCHEMA, load_features
+from explain_chess.init_data import process_connect6_fen_file
+
+FEN_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       "src", "kaggle", "output", "fen.csv")
+
+
+def columns_of(rows):
+    rows = np.asarray(rows)
+    return {name: rows[:, i] for i, (name, _) in enumerate(CONNECT6_SCHEMA)}
+
+
+def test_only_identical_rows_are_merged():
+    n_columns = len(CONNECT6_SCHEMA)
+    row = np.arange(n_columns) % 3
+    mirrored = row.copy()
+    # cùng thế cờ qua phép đối xứng nhưng last_move_position khác
+    mirrored[3] += 1
+    dedup = Connect6Dedup()
+    kept = dedup.filter(columns_of([row, mirrored, row]))
+    assert len(kept["next_move"]) == 2
+    kept = dedup.filter(columns_of([mirrored, mirrored]))
+    assert len(kept["next_move"]) == 0
+    assert list(dedup.weights) == [2, 3]
+    assert dedup.n_seen == 5
+
+
+def expand(store):
+    """Các dòng của store, mỗi dòng lặp lại theo trọng số (nếu có)."""
+    columns = load_features(store)
+    rows = np.stack([np.asarray(columns[name], dtype=np.int64) for name, _ in CONNECT6_SCHEMA], axis=1)
+    if "weight" in columns:
+        rows = np.repeat(rows, np.asarray(columns["weight"]), axis=0)
+    return rows[np.lexsort(rows.T[::-1])]
+
+
+@pytest.fixture
+def fen_csv(tmp_path):
+    path = str(tmp_path / "fen.csv")
+    with open(FEN_CSV) as src, open(path, "w") as dst:
+        for i, line in enumerate(src):
+            if i > 600:
+                break
+            dst.write(line)
+    return path
+
+
+@pytest.mark.parametrize("incremental", [False, True])
+def test_weighted_rows_expand_to_the_full_table(tmp_path, fen_csv, incremental):
+    full = process_connect6_fen_file(fen_csv, str(tmp_path / "full"), chunk_size=100)
+    deduped = process_connect6_fen_file(fen_csv, str(tmp_path / "dedup"), chunk_size=100,
+                                        incremental=incremental, dedup=True)
+    weights = load_features(deduped)["weight"]
+    assert len(weights) < len(load_features(full)["next_move"])
+    assert weights.min() >= 1
+    np.testing.assert_array_equal(expand(deduped), expand(full))
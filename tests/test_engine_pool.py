@@ -0,0 +1,91 @@
+import os
+import sys
+
+import pytest
+
+chess = pytest.importorskip("chess")
+
+from explain_chess.engine_pool import MATE_SCORE, EnginePool, make_limit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures"))
+from stub_uci import stub_score  # noqa: E402
+
+STUB_ENGINE = [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                            "fixtures", "stub_uci.py")]
+
+
+@pytest.fixture
+def engine_log(tmp_path, monkeypatch):
+    path = str(tmp_path / "analysed.txt")
+    monkeypatch.setenv("STUB_UCI_LOG", path)
+    return path
+
+
+def analysed(engine_log):
+    if not os.path.exists(engine_log):
+        return []
+    with open(engine_log) as f:
+        return f.read().split("\n")[:-1]
+
+
+def sample_fens(n):
+    board = chess.Board()
+    fens = []
+    for i in range(n):
+        board.push(list(board.legal_moves)[i % 3])
+        fens.append(board.fen())
+    return fens
+
+
+def test_scores_keep_the_order_of_the_fens(engine_log, monkeypatch):
+    monkeypatch.setenv("STUB_UCI_DELAY", "0.01")
+    fens = sample_fens(12)
+    with EnginePool(STUB_ENGINE, n_engines=3, limit=make_limit(depth=1)) as pool:
+        assert pool.scores(fens) == [stub_score(fen) for fen in fens]
+    assert sorted(analysed(engine_log)) == sorted(fens)
+
+
+def test_cache_is_reused_for_the_same_limit_only(tmp_path, engine_log):
+    cache_path = str(tmp_path / "scores.json")
+    fens = sample_fens(4)
+    with EnginePool(STUB_ENGINE, limit=make_limit(depth=1), cache_path=cache_path) as pool:
+        first = pool.scores(fens + fens[:2])
+        assert (pool.hits, pool.misses) == (2, 4)
+    assert len(analysed(engine_log)) == 4
+
+    with EnginePool(STUB_ENGINE, limit=make_limit(depth=1), cache_path=cache_path) as pool:
+        assert pool.scores(fens) == first[:4]
+        assert (pool.hits, pool.misses) == (4, 0)
+    assert len(analysed(engine_log)) == 4
+
+    # điểm tính với giới hạn khác không được dùng lại
+    with EnginePool(STUB_ENGINE, limit=make_limit(depth=2), cache_path=cache_path) as pool:
+        assert pool.scores(fens) == first[:4]
+        assert pool.misses == 4
+    assert len(analysed(engine_log)) == 8
+
+
+def test_dead_engine_is_restarted(tmp_path, engine_log, monkeypatch):
+    die = str(tmp_path / "die")
+    monkeypatch.setenv("STUB_UCI_DIE", die)
+    fens = sample_fens(3)
+    with EnginePool(STUB_ENGINE, n_engines=1, limit=make_limit(depth=1)) as pool:
+        assert pool.score(fens[0]) == stub_score(fens[0])
+        engine = pool._engines[0]
+        open(die, "w").close()
+        assert pool.score(fens[1]) == stub_score(fens[1])
+        assert not os.path.exists(die)
+        assert len(pool._engines) == 1 and pool._engines[0] is not engine
+        assert pool.score(fens[2]) == stub_score(fens[2])
+    assert analysed(engine_log) == fens
+
+
+def test_finished_games_are_scored_without_the_engine(engine_log):
+    checkmate = chess.Board()
+    for move in ["f2f3", "e7e5", "g2g4", "d8h4"]:
+        checkmate.push_uci(move)
+    stalemate = chess.Board("7k/5Q2/6K1/8/8/8/8/8 b - - 0 1")
+    assert checkmate.is_checkmate() and stalemate.is_stalemate()
+    with EnginePool(STUB_ENGINE, limit=make_limit(depth=1)) as pool:
+        assert pool.scores([checkmate.fen(), stalemate.fen()]) == [-MATE_SCORE, 0]
+    assert analysed(engine_log) == []
@@ -0,0 +1,75 @@
+import numpy as np
+import torch
+
+from eval_cache import EvalCache
+from game import Board
+from policy_value_net_pytorch import PolicyValueNet
+
+SIZE = 6
+
+
+def board_after(moves):
+    board = Board(width=SIZE, height=SIZE, n_in_row=4)
+    board.init_board()
+    for move in moves:
+        board.do_move(move)
+    return board
+
+
+def mirror(move):
+    h, w = divmod(move, SIZE)
+    return h * SIZE + SIZE - 1 - w
+
+
+def rotate(move):
+    h, w = divmod(move, SIZE)
+    return (SIZE - 1 - w) * SIZE + h
+
+
+MOVES = [1, 8, 14, 20]
+
+
+def test_symmetric_boards_share_an_entry():
+    cache = EvalCache(10)
+    board = board_after(MOVES)
+    hit, key, sym = cache.lookup(board)
+    assert hit is None
+    priors = np.arange(SIZE * SIZE, dtype=np.float64)
+    cache.store(board, key, sym, priors, 0.25)
+    for symmetry in (mirror, rotate, lambda m: mirror(rotate(m))):
+        hit, _, _ = cache.lookup(board_after([symmetry(m) for m in MOVES]))
+        assert hit is not None
+        symmetric_priors, value = hit
+        assert value == 0.25
+        for move in range(SIZE * SIZE):
+            assert symmetric_priors[symmetry(move)] == priors[move]
+    assert len(cache) == 1 and cache.hits == 3 and cache.misses == 1
+
+
+def test_least_recently_used_entry_is_dropped():
+    cache = EvalCache(2)
+    boards = [board_after([move]) for move in (0, 1, 2)]
+    for board in boards[:2]:
+        _, key, sym = cache.lookup(board)
+        cache.store(board, key, sym, np.zeros(SIZE * SIZE), 0.0)
+    # using the first entry makes the second the oldest
+    assert cache.lookup(boards[0])[0] is not None
+    _, key, sym = cache.lookup(boards[2])
+    cache.store(boards[2], key, sym, np.zeros(SIZE * SIZE), 0.0)
+    assert len(cache) == 2
+    assert cache.lookup(boards[1])[0] is None
+    assert cache.lookup(boards[0])[0] is not None
+
+
+def test_net_answers_repeats_from_the_cache():
+    torch.manual_seed(0)
+    net = PolicyValueNet(SIZE, SIZE, cache_size=100, inference=True, cpu_config=None)
+    board = board_after(MOVES)
+    probs, value = net.policy_value_fn(board)
+    probs = dict(probs)
+    again, again_value = net.policy_value_fn(board_after(MOVES))
+    assert dict(again) == probs and again_value == value
+    mirrored, _ = net.policy_value_fn(board_after([mirror(m) for m in MOVES]))
+    mirrored = dict(mirrored)
+    assert all(mirrored[mirror(move)] == p for move, p in probs.items())
+    assert net.cache.hits == 2 and net.cache.misses == 1
@@ -0,0 +1,44 @@
+import numpy as np
+
+from explain_chess.feature_sink import SelfPlayFeatureSink
+from explain_chess.feature_store import CONNECT6_SCHEMA, cast_columns, load_features
+from explain_chess.fen_to_features import CONNECT6_COLUMNS, parse_connect6_fens
+from game import Board, Game
+
+
+def as_rows(columns):
+    columns = cast_columns(columns, CONNECT6_SCHEMA)
+    return np.stack([np.asarray(columns[name], dtype=np.int64) for name in CONNECT6_COLUMNS], axis=1)
+
+
+class RandomPlayer(object):
+    """Plays uniformly random moves and keeps the FEN lines that
+    start_self_play would write to fen.csv without a feature sink.
+    """
+
+    def __init__(self, game, seed=0):
+        self.game = game
+        self.rng = np.random.RandomState(seed)
+        self.fens = []
+
+    def get_action(self, board, temp=1e-3, return_prob=0):
+        move = int(self.rng.choice(board.availables))
+        if board.states:
+            self.fens.append(self.game.generate_fen(board.states, move, None))
+        probs = np.zeros(board.width * board.height)
+        probs[board.availables] = 1.0 / len(board.availables)
+        return move, probs
+
+    def reset_player(self):
+        pass
+
+
+def test_sink_writes_the_rows_of_the_fen_lines(tmp_path):
+    game = Game(Board(width=10, height=10, n_in_row=6))
+    player = RandomPlayer(game)
+    store = str(tmp_path / "features")
+    with SelfPlayFeatureSink(store, buffer_size=50) as sink:
+        for _ in range(3):
+            game.start_self_play(player, feature_sink=sink)
+    # the sink writes the rows process_connect6_fen_file makes from the FENs
+    np.testing.assert_array_equal(as_rows(load_features(store)), as_rows(parse_connect6_fens(player.fens)))
@@ -0,0 +1,60 @@
+import numpy as np
+import pytest
+
+from explain_chess.feature_store import (CONNECT6_SCHEMA, FeatureStoreWriter, is_feature_store,
+                                         load_features, save_features)
+
+
+def random_columns(n_rows, seed=0):
+    rng = np.random.RandomState(seed)
+    columns = {name: rng.randint(0, 50, n_rows) for name, _ in CONNECT6_SCHEMA}
+    columns["move_count"] = rng.randint(0, 1000, n_rows)
+    # parse_connect6_fen gives last_move_position as strings
+    columns["last_move_position"] = np.array([str(v) for v in rng.randint(0, 100, n_rows)],
+                                             dtype=object)
+    return columns
+
+
+def test_chunks_round_trip_with_their_types(tmp_path):
+    path = str(tmp_path / "store")
+    chunks = [random_columns(n, seed) for seed, n in enumerate((5, 0, 7))]
+    with FeatureStoreWriter(path) as writer:
+        for chunk in chunks:
+            writer.append(chunk)
+        writer.add_column("weight", np.arange(12), "int32")
+    assert is_feature_store(path)
+    columns = load_features(path)
+    assert list(columns) == [name for name, _ in CONNECT6_SCHEMA] + ["weight"]
+    for name, dtype in CONNECT6_SCHEMA:
+        assert columns[name].dtype == np.dtype(dtype)
+        expected = np.concatenate([np.asarray(chunk[name]).astype(np.int64) for chunk in chunks])
+        np.testing.assert_array_equal(columns[name], expected)
+    np.testing.assert_array_equal(columns["weight"], np.arange(12))
+
+
+def test_values_out_of_range_are_rejected(tmp_path):
+    columns = random_columns(3)
+    columns["line_counts_player_2"][0] = 200
+    with pytest.raises(ValueError):
+        save_features(str(tmp_path / "store"), columns)
+    with FeatureStoreWriter(str(tmp_path / "weights")) as writer:
+        writer.append(random_columns(2))
+        with pytest.raises(ValueError):
+            writer.add_column("weight", np.ones(3), "int32")
+
+
+def test_interrupted_store_is_not_readable(tmp_path):
+    path = str(tmp_path / "store")
+    save_features(path, random_columns(4))
+    assert is_feature_store(path)
+    with pytest.raises(RuntimeError):
+        with FeatureStoreWriter(path) as writer:
+            writer.append(random_columns(4))
+            raise RuntimeError("interrupted")
+    assert not is_feature_store(path)
+
+
+def test_empty_store(tmp_path):
+    path = save_features(str(tmp_path / "store"), random_columns(0))
+    columns = load_features(path)
+    assert all(len(values) == 0 for values in columns.values())
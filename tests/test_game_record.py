@@ -0,0 +1,134 @@
+import os
+
+import numpy as np
+import pytest
+
+from game import Board, Game
+from game_record import GameArchive, GameRecordWriter, _fen_stones, convert_fen_csv, index_path
+
+FEN_CSV = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                       "src", "kaggle", "output", "fen.csv")
+
+
+def write_archive(path, games):
+    with GameRecordWriter(path, 6, 6, 4) as writer:
+        for moves, players, winner, probs in games:
+            writer.add_game(moves, players, winner, probs, {"n": len(moves)})
+
+
+GAMES = [([0, 1, 2], [1, 2, 2], -1, None),
+         ([5, 4, 3, 9], [1, 2, 2, 1], 2, np.full((4, 36), 1.0 / 36))]
+
+
+def test_games_round_trip(tmp_path):
+    path = str(tmp_path / "games.c6r")
+    write_archive(path, GAMES)
+    archive = GameArchive(path)
+    assert len(archive) == 2 and archive.n_positions == 7
+    for record, (moves, players, winner, probs) in zip(archive, GAMES):
+        assert list(record.moves) == moves
+        assert list(record.players) == players
+        assert record.winner == winner
+        assert record.metadata == {"n": len(moves)}
+        if probs is None:
+            assert record.mcts_probs is None
+        else:
+            np.testing.assert_allclose(record.mcts_probs, probs, rtol=1e-3)
+    assert archive.locate(3) == (1, 0)
+    with pytest.raises(IndexError):
+        archive.locate(7)
+    assert archive.board_at(1, 2).states == {5: 1, 4: 2}
+
+
+def test_index_is_rebuilt_after_a_crash(tmp_path):
+    path = str(tmp_path / "games.c6r")
+    write_archive(path, GAMES)
+    # a third record cut off in the middle, and a lost index
+    with open(path, "ab") as f:
+        f.write(b"\x05\x00\x00\x00\x01\x00\x00\x00\x07")
+    os.remove(index_path(path))
+    archive = GameArchive(path)
+    assert len(archive) == 2
+    assert list(archive[1].moves) == GAMES[1][0]
+
+
+def test_fen_csv_conversion_replays_every_line(tmp_path):
+    lines = []
+    with open(FEN_CSV) as f:
+        for i, line in enumerate(f):
+            if i > 300:
+                break
+            lines.append(line)
+    csv_path = str(tmp_path / "fen.csv")
+    with open(csv_path, "w") as f:
+        f.writelines(lines)
+    archive_path = str(tmp_path / "games.c6r")
+    n_games = convert_fen_csv(csv_path, archive_path)
+
+    games, fens = [], []
+    for line in lines[1:]:
+        if line.startswith("="):
+            games.append(fens)
+            fens = []
+        elif line.strip():
+            fens.append(line.strip())
+    if fens:
+        games.append(fens)
+    assert n_games == len(games)
+
+    archive = GameArchive(archive_path)
+    for game, fens in enumerate(games):
+        boards = [dict(board.states) for board, _, _ in archive.replay(game)]
+        # each FEN line shows the board before the move it names
+        for i, fen in enumerate(fens):
+            assert boards[i + 1] == _fen_stones(fen)
+
+
+class RandomPlayer(object):
+    """Plays uniformly random moves with uniform search probabilities."""
+
+    def __init__(self, seed=0):
+        self.rng = np.random.RandomState(seed)
+
+    def get_action(self, board, temp=1e-3, return_prob=0):
+        probs = np.zeros(board.width * board.height)
+        probs[board.availables] = 1.0 / len(board.availables)
+        return int(self.rng.choice(board.availables)), probs
+
+    def reset_player(self):
+        pass
+
+
+def test_self_play_games_are_recorded(tmp_path, monkeypatch):
+    # without a feature sink start_self_play appends to ./fen.csv
+    monkeypatch.chdir(tmp_path)
+    game = Game(Board(width=10, height=10, n_in_row=6))
+    player = RandomPlayer()
+    path = str(tmp_path / "games.c6r")
+    results = []
+    with GameRecordWriter(path, 10, 10, 6) as recorder:
+        for _ in range(3):
+            winner, play_data = game.start_self_play(player, recorder=recorder)
+            results.append((winner, list(play_data)))
+
+    archive = GameArchive(path)
+    assert len(archive) == 3
+    assert archive.n_positions == sum(len(data) for _, data in results)
+    for game_index, (winner, play_data) in enumerate(results):
+        record = archive[game_index]
+        assert record.winner == winner
+        assert record.metadata == {"temp": 1e-3}
+        for (state, probs, winner_z), (r_state, r_probs, r_winner_z) in zip(
+                play_data, archive.training_data(game_index)):
+            if game_index == 0:
+                np.testing.assert_array_equal(state, r_state)
+            else:
+                # Board.init_board keeps the turn planes of the previous game
+                # at the start of the next one; the replay starts them empty
+                np.testing.assert_array_equal(state[:2], r_state[:2])
+            np.testing.assert_allclose(probs, r_probs, rtol=1e-3)
+            assert winner_z == r_winner_z
+        # the replayed game ends where the recorded one did
+        end_board = archive.board_at(game_index, len(record.moves))
+        assert end_board.game_end() == (True, winner)
+        assert archive.locate(archive._first_position[game_index] + 1) == (game_index, 1)
@@ -0,0 +1,71 @@
+import os
+import sys
+
+import pytest
+
+chess = pytest.importorskip("chess")
+import pandas as pd  # noqa: E402
+
+from explain_chess.engine_pool import make_limit  # noqa: E402
+from explain_chess.fen_to_features import extract_features, extract_features_batch  # noqa: E402
+from explain_chess.init_data import process_fen_file  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+sys.path.insert(0, FIXTURES)
+from stub_uci import stub_score  # noqa: E402
+
+STUB_ENGINE = [sys.executable, os.path.join(FIXTURES, "stub_uci.py")]
+
+
+def checkmates():
+    fens = []
+    for moves in (["f2f3", "e7e5", "g2g4", "d8h4"], ["g2g4", "e7e5", "f2f3", "d8h4"]):
+        board = chess.Board()
+        for move in moves:
+            board.push_uci(move)
+        fens.append(board.fen())
+    return fens
+
+
+def positions(n):
+    board = chess.Board()
+    fens = []
+    for i in range(n):
+        board.push(list(board.legal_moves)[i % 5])
+        fens.append(board.fen())
+    return fens
+
+
+def test_batch_extraction_matches_extract_features():
+    fens = positions(6) + checkmates()
+    kept, columns = extract_features_batch(fens)
+    assert kept == fens[:6]
+    for i, fen in enumerate(kept):
+        assert {name: values[i] for name, values in columns.items()} == extract_features(fen)
+    kept, _ = extract_features_batch(fens, skip_checkmate=False)
+    assert kept == fens
+
+
+@pytest.mark.parametrize("n_workers", [0, 1])
+def test_header_is_written_once_after_empty_chunks(tmp_path, n_workers):
+    fens = checkmates() + positions(7)
+    csv_path = str(tmp_path / "fen.csv")
+    pd.DataFrame({"fen": fens}).to_csv(csv_path, index=False)
+    output_path = process_fen_file(csv_path, str(tmp_path / "labels.csv"), chunk_size=2,
+                                   n_workers=n_workers, limit=make_limit(depth=1),
+                                   engine_path=STUB_ENGINE)
+    with open(output_path) as f:
+        lines = f.read().splitlines()
+    assert sum(line.startswith(",material_score_white") for line in lines) == 1
+    labels = pd.read_csv(output_path, index_col=0)
+    assert list(labels.index) == list(range(7))
+    expected = [1 if stub_score(fen) > 0 else 0 for fen in fens[2:]]
+    assert list(labels["advantage"]) == expected
+
+
+def test_max_rows_limits_the_rows_read(tmp_path):
+    csv_path = str(tmp_path / "fen.csv")
+    pd.DataFrame({"fen": positions(5)}).to_csv(csv_path, index=False)
+    output_path = process_fen_file(csv_path, str(tmp_path / "labels.csv"), max_rows=3, chunk_size=2,
+                                   limit=make_limit(depth=1), engine_path=STUB_ENGINE)
+    assert len(pd.read_csv(output_path, index_col=0)) == 3
@@ -0,0 +1,67 @@
+import numpy as np
+import pytest
+import torch
+
+from game import Board
+from mcts_alphaZero import MCTSPlayer, RootParallelMCTS
+from policy_value_engine import export_model, load_policy
+from policy_value_net_pytorch import PolicyValueNet
+
+
+def uniform_policy(board):
+    probs = np.ones(len(board.availables)) / len(board.availables)
+    return zip(board.availables, probs), 0
+
+
+def new_board(width=6, height=6, n_in_row=4):
+    board = Board(width=width, height=height, n_in_row=n_in_row)
+    board.init_board()
+    return board
+
+
+def test_root_parallel_merges_worker_visits():
+    mcts = RootParallelMCTS(uniform_policy, n_playout=30, n_workers=2)
+    try:
+        merged = dict(mcts.search(new_board()))
+    finally:
+        mcts.close()
+    assert len(mcts.last_searches) == 2
+    expected = {}
+    for _, act_visits in mcts.last_searches:
+        assert sum(v for _, v in act_visits) == 30 - 1
+        for act, visits in act_visits:
+            expected[act] = expected.get(act, 0) + visits
+    assert merged == expected
+
+
+def test_root_parallel_report_is_quiet_by_default(capsys):
+    for verbose in (False, True):
+        player = MCTSPlayer(uniform_policy, n_playout=10,
+                            n_search_workers=2, verbose=verbose)
+        try:
+            move = player.get_action(new_board())
+        finally:
+            player.close()
+        assert 0 <= move < 36
+        out = capsys.readouterr().out
+        assert ("merged:" in out) == verbose
+
+
+def test_root_parallel_search_with_spawned_workers(tmp_path):
+    torch.manual_seed(0)
+    model_file = str(tmp_path / "net.model")
+    PolicyValueNet(6, 6, cpu_config=None).save_model(model_file)
+    engine = load_policy(export_model(model_file, str(tmp_path / "net.pt"), 6, 6), 6, 6)
+    mcts = RootParallelMCTS(engine.policy_value_fn, n_playout=20, n_workers=2,
+                            start_method="spawn")
+    try:
+        merged = dict(mcts.search(new_board()))
+    finally:
+        mcts.close()
+    assert sum(merged.values()) == 2 * (20 - 1)
+
+
+def test_root_parallel_rejects_tree_size_limits():
+    for limits in ({"max_nodes": 1000}, {"max_memory": 2**20}):
+        with pytest.raises(ValueError):
+            MCTSPlayer(uniform_policy, n_search_workers=2, **limits)
@@ -0,0 +1,72 @@
+import copy
+
+from game import Board
+from mcts_pure import MCTS, policy_value_fn
+
+
+def new_board(width=6, height=6, n_in_row=4):
+    board = Board(width=width, height=height, n_in_row=n_in_row)
+    board.init_board()
+    return board
+
+
+def flipping_rollout(state, limit=1000):
+    """A rollout that wins for the player to move and, like the move by move
+    rollout, leaves the state at another turn.
+    """
+    state.chesses = 3 - state.chesses
+    return 1
+
+
+def test_playout_reads_turn_before_rollout():
+    board = new_board()
+    mcts = MCTS(policy_value_fn, n_playout=2)
+    mcts._evaluate_rollout = flipping_rollout
+    # expand the root, then back up through one child
+    for _ in range(2):
+        mcts._playout(copy.deepcopy(board))
+    visited = [node for node in mcts._root._children.values()
+               if node._n_visits]
+    assert len(visited) == 1
+    # the first stone ends the turn, so the leaf is the opponent's win
+    assert visited[0]._Q == -1
+
+
+class FlippingWorkers(object):
+    """Stands in for the rollout pool and moves the states on, as an
+    in-process rollout would.
+    """
+
+    def map(self, func, args):
+        values = []
+        for state, _ in args:
+            values.append(flipping_rollout(state))
+        return values
+
+
+def test_playout_batch_reads_turn_before_rollout():
+    board = new_board()
+    mcts = MCTS(policy_value_fn, n_playout=8, n_workers=1, leaf_batch=1)
+    mcts._workers = FlippingWorkers()
+    mcts._playout_batch(board, 1)
+    mcts._playout_batch(board, 1)
+    visited = [node for node in mcts._root._children.values()
+               if node._n_visits]
+    assert len(visited) == 1
+    assert visited[0]._Q == -1
+
+
+def test_leaf_parallel_search_backs_up_every_leaf():
+    board = new_board()
+    mcts = MCTS(policy_value_fn, n_playout=16, n_rollout=2, n_workers=1, leaf_batch=4)
+    try:
+        move = mcts.get_move(board)
+    finally:
+        mcts.close()
+    assert move in board.availables
+    # one backup per playout, and no pending visits left behind
+    assert mcts._root._n_visits == 16
+    children = mcts._root._children.values()
+    assert sum(child._n_visits for child in children) <= 16
+    for child in children:
+        assert child._n_visits == 0 or -1 <= child._Q <= 1
@@ -0,0 +1,69 @@
+import numpy as np
+
+from game import Board
+from mcts_pure import evaluate_rollout
+from mcts_rollout import OFF_BOARD, RolloutEngine
+
+
+def new_board(size=6, n_in_row=4):
+    board = Board(width=size, height=size, n_in_row=n_in_row)
+    board.init_board()
+    return board
+
+
+def test_win_detection_matches_game_end():
+    rng = np.random.RandomState(0)
+    engine = RolloutEngine(6, 6, 4)
+    size = 36
+    for _ in range(30):
+        board = new_board()
+        boards = np.zeros((1, size + 1), dtype=np.int8)
+        boards[:, size] = OFF_BOARD
+        alive = np.arange(1)
+        for move in rng.permutation(size):
+            player = board.get_current_player()
+            won = engine._place(boards, alive, int(move), player)[0]
+            board.do_move(int(move))
+            end, winner = board.game_end()
+            assert won == (end and winner == player)
+            if end:
+                break
+
+
+def test_turn_order_matches_the_board():
+    engine = RolloutEngine(6, 6, 4)
+    board = new_board()
+    for move in (0, 7, 8):
+        board.do_move(move)
+    owners = engine._owners(board, 10)
+    for owner in owners:
+        assert owner == board.get_current_player()
+        board.do_move(board.availables[0])
+
+
+def test_simulated_games_end_like_the_board_says():
+    np.random.seed(0)
+    engine = RolloutEngine(6, 6, 4)
+    board = new_board()
+    for move in (0, 6, 7, 1):
+        board.do_move(move)
+    np.random.seed(1)
+    winners = engine.simulate(board, 200)
+    assert set(winners) <= {-1, 1, 2}
+    # on a 6x6 board with 4 in a row a random game is hardly ever a tie
+    assert np.mean(winners == -1) < 0.1
+    np.random.seed(1)
+    player = board.get_current_player()
+    expected = np.mean(np.where(winners == player, 1.0, np.where(winners == -1, 0.0, -1.0)))
+    assert engine.evaluate(board, 200) == expected
+
+
+def test_finished_board_is_scored_directly():
+    board = new_board()
+    for move in (0, 30, 31, 6, 12, 32, 35, 18, 24):
+        board.do_move(move)
+    end, winner = board.game_end()
+    assert end and winner == 1
+    assert board.get_current_player() == 2
+    assert RolloutEngine(6, 6, 4).evaluate(board, 10) == -1.0
+    assert evaluate_rollout(board) == -1
@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+import torch
+
+from game import Board
+from net_attribution import attribute, summarize
+from policy_value_net_pytorch import PolicyValueNet
+
+WIDTH = HEIGHT = 6
+
+
+@pytest.fixture(scope="module")
+def net():
+    torch.manual_seed(0)
+    return PolicyValueNet(WIDTH, HEIGHT, cpu_config=None)
+
+
+def sample_states(n, n_moves=7, seed=0):
+    rng = np.random.RandomState(seed)
+    states = []
+    for _ in range(n):
+        board = Board(width=WIDTH, height=HEIGHT, n_in_row=4)
+        board.init_board()
+        for move in rng.permutation(board.availables)[:n_moves]:
+            board.do_move(int(move))
+        states.append(board.current_state().copy())
+    return np.array(states, dtype=np.float32)
+
+
+def outputs(net, states, top_moves):
+    with torch.no_grad():
+        log_act_probs, value = net.policy_value_net(torch.from_numpy(states))
+    policy = log_act_probs[torch.arange(len(states)), torch.from_numpy(top_moves).long()]
+    return policy.numpy(), value[:, 0].numpy()
+
+
+def test_top_moves_are_empty_cells(net):
+    states = sample_states(8, n_moves=20)
+    top_moves = attribute(net, states, "gradient")["top_moves"]
+    for state, move in zip(states, top_moves):
+        h, w = move // WIDTH, move % WIDTH
+        # the planes are flipped vertically against the move numbering
+        assert state[0, HEIGHT - 1 - h, w] == 0 and state[1, HEIGHT - 1 - h, w] == 0
+
+
+def test_occlusion_matches_clearing_each_entry(net):
+    states = sample_states(3)
+    # a small max_rows splits the positions over several forward passes
+    result = attribute(net, states, "occlusion", batch_size=2, max_rows=10)
+    top_moves = result["top_moves"]
+    base_policy, base_value = outputs(net, states, top_moves)
+    policy_ref = np.zeros_like(states)
+    value_ref = np.zeros_like(states)
+    for i, state in enumerate(states):
+        for index in zip(*np.nonzero(state)):
+            perturbed = state.copy()
+            perturbed[index] = 0.0
+            policy, value = outputs(net, perturbed[None], top_moves[i:i + 1])
+            policy_ref[(i,) + index] = base_policy[i] - policy[0]
+            value_ref[(i,) + index] = base_value[i] - value[0]
+    np.testing.assert_allclose(result["policy"], policy_ref, rtol=1e-2, atol=1e-3)
+    np.testing.assert_allclose(result["value"], value_ref, rtol=1e-2, atol=1e-3)
+
+
+def test_gradient_shapes_and_signs(net):
+    states = sample_states(4)
+    gradient = attribute(net, states, "gradient", batch_size=3)
+    grad_x_input = attribute(net, states, "grad_x_input", batch_size=3)
+    for head in ("policy", "value"):
+        assert gradient[head].shape == states.shape
+        assert gradient[head].dtype == np.float16
+        np.testing.assert_allclose(grad_x_input[head],
+                                   gradient[head].astype(np.float32) * states,
+                                   rtol=1e-2, atol=1e-4)
+        assert not np.any(grad_x_input[head][states == 0])
+    np.testing.assert_array_equal(gradient["top_moves"], grad_x_input["top_moves"])
+
+    # the sign of the gradient is the direction in which the output moves
+    top_moves = gradient["top_moves"]
+    eps = 1e-2
+    for head, column in (("policy", 0), ("value", 1)):
+        grad = gradient[head].astype(np.float32)
+        for i in range(len(states)):
+            index = np.unravel_index(np.abs(grad[i]).argmax(), grad[i].shape)
+            up, down = states[i].copy(), states[i].copy()
+            up[index] += eps
+            down[index] -= eps
+            diff = (outputs(net, up[None], top_moves[i:i + 1])[column] -
+                    outputs(net, down[None], top_moves[i:i + 1])[column])[0]
+            assert np.sign(diff) == np.sign(grad[i][index])
+
+
+def test_summary_has_every_plane(net):
+    summary = summarize(attribute(net, sample_states(2), "grad_x_input"))
+    assert [len(planes) for planes in summary.values()] == [4, 4]
+    for planes in summary.values():
+        for _, mean_abs, mean in planes:
+            assert mean_abs >= abs(mean)
@@ -0,0 +1,64 @@
+import copy
+
+from game import Board
+from mcts_pure import MCTS, TreeNode, policy_value_fn
+from node_pool import NodePool
+
+
+def new_board(size=6):
+    board = Board(width=size, height=size, n_in_row=4)
+    board.init_board()
+    return board
+
+
+def tree_size(node):
+    return 1 + sum(tree_size(child) for child in node._children.values())
+
+
+def test_released_nodes_are_reused():
+    pool = NodePool(TreeNode)
+    root = pool.acquire(None, 1.0)
+    root.expand([(move, 0.25) for move in range(4)], pool)
+    children = list(root._children.values())
+    assert len(pool) == 5
+
+    root._children.clear()
+    for child in children:
+        pool.release(child)
+    assert len(pool) == 1
+    reused = [pool.acquire(root, 0.5) for _ in range(4)]
+    assert set(map(id, reused)) == set(map(id, children))
+    # a recycled node starts over as a fresh leaf
+    for node in reused:
+        assert node._parent is root and node._n_visits == 0 and node._P == 0.5
+        assert node.is_leaf()
+
+
+def test_ceiling_keeps_the_tree_small():
+    mcts = MCTS(policy_value_fn, n_playout=300, max_nodes=150)
+    mcts.get_move(new_board())
+    pool = mcts._pool
+    assert pool.n_pruned > 0
+    assert len(pool) <= pool.max_nodes
+    assert tree_size(mcts._root) == len(pool)
+
+    unbounded = MCTS(policy_value_fn, n_playout=300)
+    unbounded.get_move(new_board())
+    assert len(unbounded._pool) > pool.max_nodes
+
+
+def test_update_with_move_recycles_the_rest_of_the_tree():
+    board = new_board()
+    mcts = MCTS(policy_value_fn, n_playout=100)
+    move = mcts.get_move(board)
+    kept = tree_size(mcts._root._children[move])
+    mcts.update_with_move(move)
+    assert len(mcts._pool) == kept == tree_size(mcts._root)
+    assert mcts._root._parent is None
+    free = len(mcts._pool._free)
+    assert free > 0
+    board.do_move(move)
+    for _ in range(10):
+        mcts._playout(copy.deepcopy(board))
+    # new nodes come from the free list first
+    assert len(mcts._pool._free) < free
@@ -0,0 +1,121 @@
+import numpy as np
+import pytest
+
+from game import Board
+from game_record import GameRecordWriter
+from mcts_alphaZero import MCTSPlayer
+from opening_book import OpeningBook, build_opening_book, save_opening_book
+
+SIZE = 6
+# the first stone is on no symmetry axis of the board, so the position after
+# it has a single book orientation
+OPENING = [8, 22, 23, 14]
+
+
+def board_after(moves):
+    board = Board(width=SIZE, height=SIZE, n_in_row=4)
+    board.init_board()
+    for move in moves:
+        board.do_move(move)
+    return board
+
+
+def write_games(path, games):
+    with GameRecordWriter(path, SIZE, SIZE, 4) as writer:
+        for moves in games:
+            board = board_after([])
+            players = []
+            for move in moves:
+                players.append(board.get_current_player())
+                board.do_move(move)
+            writer.add_game(moves, players, -1)
+
+
+def mirror(move):
+    h, w = divmod(move, SIZE)
+    return h * SIZE + SIZE - 1 - w
+
+
+def transpose(move):
+    h, w = divmod(move, SIZE)
+    return w * SIZE + h
+
+
+@pytest.fixture
+def book_path(tmp_path):
+    archive = str(tmp_path / "games.c6r")
+    # the opening twice, and a game that leaves it after the first stone
+    write_games(archive, [OPENING, OPENING, [8, 0, 1, 2]])
+    path = str(tmp_path / "book.npz")
+    save_opening_book(path, *build_opening_book([archive], depth=3, min_count=2), depth=3)
+    return path
+
+
+def test_min_count_drops_rare_positions(book_path):
+    book = OpeningBook(book_path)
+    # the empty board and the boards after 8 and after 8, 22, but not the
+    # board after 8, 0 seen once
+    assert len(book) == 3
+    assert sorted(book.counts) == [2, 3, 3]
+    assert book.lookup(board_after([8, 0])) is None
+    probs = book.lookup(board_after([8]))
+    assert probs.dtype == np.float64
+    np.testing.assert_allclose(probs[[22, 0]], [2.0 / 3, 1.0 / 3], atol=1e-3)
+
+
+@pytest.mark.parametrize("symmetry", [lambda move: move, mirror, transpose,
+                                      lambda move: mirror(transpose(move))])
+def test_lookup_in_any_orientation(book_path, symmetry):
+    book = OpeningBook(book_path)
+    probs = book.lookup(board_after([symmetry(move) for move in OPENING[:2]]))
+    assert probs is not None
+    assert np.argmax(probs) == symmetry(OPENING[2])
+    assert probs.sum() == pytest.approx(1.0, abs=1e-3)
+
+
+def test_depth_cut_off(book_path):
+    assert OpeningBook(book_path).lookup(board_after(OPENING[:3])) is None
+    shallow = OpeningBook(book_path, depth=1)
+    assert shallow.lookup(board_after([])) is not None
+    assert shallow.lookup(board_after([8])) is None
+    assert shallow.hits == 1 and shallow.misses == 0
+
+
+class CountingPolicy(object):
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, board):
+        self.calls += 1
+        probs = np.ones(len(board.availables)) / len(board.availables)
+        return zip(board.availables, probs), 0
+
+
+def test_play_mode_answers_from_the_book(book_path):
+    policy = CountingPolicy()
+    player = MCTSPlayer(policy, n_playout=20, opening_book=OpeningBook(book_path))
+    board = board_after(OPENING[:2])
+    assert player.get_action(board) == OPENING[2]
+    assert policy.calls == 0
+    # out of the book the player searches
+    player.get_action(board_after(OPENING))
+    assert policy.calls == 20
+
+
+def test_prior_mode_searches_with_the_book_priors(book_path):
+    policy = CountingPolicy()
+    book = OpeningBook(book_path)
+    player = MCTSPlayer(policy, n_playout=30, opening_book=book, book_mode="prior")
+    seen = []
+    get_move_probs = player.mcts.get_move_probs
+
+    def spy(state, temp=1e-3, root_priors=None):
+        seen.append(root_priors)
+        return get_move_probs(state, temp, root_priors)
+
+    player.mcts.get_move_probs = spy
+    board = board_after(OPENING[:2])
+    assert player.get_action(board) == OPENING[2]
+    assert policy.calls == 30
+    np.testing.assert_array_equal(seen[0], book.lookup(board))
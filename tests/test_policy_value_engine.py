@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+import torch
+
+from game import Board
+from policy_value_engine import (InferenceEngine, agreement, export_model, load_net, load_policy,
+                                 reduce_precision)
+from policy_value_net_pytorch import PolicyValueNet
+
+SIZE = 6
+
+
+@pytest.fixture(scope="module")
+def model_file(tmp_path_factory):
+    torch.manual_seed(0)
+    path = str(tmp_path_factory.mktemp("model") / "net.model")
+    PolicyValueNet(SIZE, SIZE, cpu_config=None).save_model(path)
+    return path
+
+
+def sample_boards(n, n_moves=9, seed=0):
+    rng = np.random.RandomState(seed)
+    boards = []
+    for _ in range(n):
+        board = Board(width=SIZE, height=SIZE, n_in_row=4)
+        board.init_board()
+        for move in rng.permutation(board.availables)[:n_moves]:
+            board.do_move(int(move))
+        boards.append(board)
+    return boards
+
+
+def test_torchscript_export_matches_the_net(tmp_path, model_file):
+    net = PolicyValueNet(SIZE, SIZE, model_file=model_file, inference=True, cpu_config=None)
+    exported = export_model(model_file, str(tmp_path / "net.pt"), SIZE, SIZE)
+    engine = load_policy(exported, SIZE, SIZE)
+    assert isinstance(engine, InferenceEngine)
+    boards = sample_boards(8)
+    states = np.array([board.current_state() for board in boards], dtype=np.float32)
+    probs, values = engine.policy_value(states)
+    ref_probs, ref_values = net.policy_value(states)
+    np.testing.assert_allclose(probs, ref_probs, rtol=1e-4, atol=1e-6)
+    np.testing.assert_allclose(values, ref_values, rtol=1e-4, atol=1e-6)
+    for board in boards:
+        (act, value), (ref_act, ref_value) = engine.policy_value_fn(board), net.policy_value_fn(board)
+        act, ref_act = dict(act), dict(ref_act)
+        assert act.keys() == ref_act.keys()
+        np.testing.assert_allclose([act[m] for m in act], [ref_act[m] for m in act], rtol=1e-4, atol=1e-6)
+        assert value == pytest.approx(ref_value, abs=1e-5)
+
+
+def test_shared_weights_export_loads_the_same_net(tmp_path, model_file):
+    weights = export_model(model_file, str(tmp_path / "net.weights"), SIZE, SIZE)
+    shared = PolicyValueNet(SIZE, SIZE, model_file=weights, inference=True, cpu_config=None)
+    net = PolicyValueNet(SIZE, SIZE, model_file=model_file, inference=True, cpu_config=None)
+    states = np.array([board.current_state() for board in sample_boards(4)], dtype=np.float32)
+    for got, expected in zip(shared.policy_value(states), net.policy_value(states)):
+        np.testing.assert_array_equal(got, expected)
+
+
+def test_reduced_precision_stays_close_to_fp32(tmp_path, model_file):
+    net = load_net(model_file, SIZE, SIZE)
+    states = [board.current_state().copy() for board in sample_boards(32)]
+    fp32 = reduce_precision(net, "fp32")
+    assert agreement(net, fp32, states) == (1.0, 0.0, 0.0)
+    for precision in ("int8-dynamic", "int8"):
+        candidate = reduce_precision(net, precision, states)
+        top1, value_mean, value_max = agreement(net, candidate, states)
+        assert top1 >= 0.75
+        assert value_max < 0.05
+    with pytest.raises(ValueError):
+        reduce_precision(net, "int8")
+    with pytest.raises(ValueError):
+        reduce_precision(net, "fp8")
+    # the dynamic int8 net can be exported and played as well
+    exported = export_model(model_file, str(tmp_path / "int8.pt"), SIZE, SIZE,
+                            precision="int8-dynamic")
+    act_probs, value = InferenceEngine(exported, SIZE, SIZE).policy_value_fn(sample_boards(1)[0])
+    assert sum(p for _, p in act_probs) <= 1.0 + 1e-5
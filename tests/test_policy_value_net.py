@@ -0,0 +1,16 @@
+import numpy as np
+
+from game import Board
+from policy_value_net_pytorch import fill_state
+
+SIZE = 6
+
+
+def test_fill_state_matches_current_state():
+    board = Board(width=SIZE, height=SIZE, n_in_row=4)
+    board.init_board()
+    for move in (0, 7, 8, 20, 33):
+        board.do_move(move)
+    out = np.empty((4, SIZE, SIZE), dtype=np.float32)
+    fill_state(board, out)
+    np.testing.assert_array_equal(out, board.current_state())
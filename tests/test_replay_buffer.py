@@ -0,0 +1,44 @@
+import numpy as np
+
+from game import Board
+from replay_buffer import DedupReplayBuffer
+
+
+def position(moves, width=6):
+    board = Board(width=width, height=width, n_in_row=4)
+    board.init_board()
+    for move in moves:
+        board.do_move(move)
+    prob = np.zeros(width * width)
+    prob[board.availables[0]] = 1.0
+    return board.current_state(), prob
+
+
+def test_symmetric_positions_are_stored_once():
+    buffer = DedupReplayBuffer(6, 6)
+    # a stone in a corner and in the mirrored corner
+    state, prob = position([0])
+    mirror_state, mirror_prob = position([5])
+    buffer.extend([(state, prob, 1.0), (mirror_state, mirror_prob, -1.0)])
+    assert len(buffer) == 1
+    assert buffer.n_added == 2
+    (_, _, winner, count), = buffer._entries.values()
+    assert count == 2
+    assert winner == 0.0
+
+
+def test_sample_is_proportional_to_counts():
+    np.random.seed(0)
+    buffer = DedupReplayBuffer(6, 6)
+    rare = position([0])
+    common = position([14])
+    buffer.extend([rare + (1.0,)] + [common + (-1.0,)] * 3)
+    assert len(buffer) == 2
+    # more draws than stored positions, with replacement
+    batch = buffer.sample(4000)
+    assert len(batch) == 4000
+    winners = np.array([winner for _, _, winner in batch])
+    assert abs(np.mean(winners == 1.0) - 0.25) < 0.03
+    for state, prob, _ in batch:
+        assert state.shape == (4, 6, 6)
+        assert prob.sum() == 1.0
@@ -0,0 +1,95 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+pytest.importorskip("shap")
+pytest.importorskip("sklearn")
+pytest.importorskip("imblearn")
+
+from explain_chess import shap_explain
+from explain_chess.feature_store import CONNECT6_SCHEMA, save_features
+
+
+def random_columns(n_rows=200, seed=0):
+    rng = np.random.RandomState(seed)
+    columns = {name: rng.randint(0, 4, n_rows) for name, _ in CONNECT6_SCHEMA}
+    columns["next_move"] = rng.randint(0, 3, n_rows)
+    return columns
+
+
+def test_default_features_path_falls_back_to_csv(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert shap_explain.default_features_path() == shap_explain.FEATURES_CSV_PATH
+    save_features(shap_explain.FEATURE_STORE_PATH, random_columns())
+    assert shap_explain.default_features_path() == shap_explain.FEATURE_STORE_PATH
+
+
+def test_store_and_csv_load_the_same_features(tmp_path):
+    import pandas as pd
+    columns = random_columns()
+    store = save_features(str(tmp_path / "store"), columns)
+    csv_path = str(tmp_path / "features.csv")
+    pd.DataFrame(columns).to_csv(csv_path)
+    X_store, y_store = shap_explain.split_features_and_labels(store)
+    X_csv, y_csv = shap_explain.split_features_and_labels(csv_path)
+    assert list(X_store.columns) == list(X_csv.columns)
+    np.testing.assert_array_equal(X_store.values, X_csv.values)
+    np.testing.assert_array_equal(y_store.values, y_csv.values)
+
+
+
+def small_forest(n_rows=120, seed=0):
+    import pandas as pd
+    from sklearn.ensemble import RandomForestClassifier
+    columns = random_columns(n_rows, seed)
+    y = np.asarray(columns.pop("next_move"))
+    X = pd.DataFrame(columns)
+    model = RandomForestClassifier(n_estimators=5, max_depth=4, random_state=0)
+    model.fit(X, y)
+    return model, X, y
+
+
+@pytest.mark.parametrize("path_dependent", [True, False])
+@pytest.mark.parametrize("n_workers", [0, 2])
+def test_chunked_explanation_matches_unchunked(tmp_path, path_dependent, n_workers):
+    import pandas as pd
+    import shap
+    model, X, y = small_forest()
+    X_test, y_test = X.iloc[:37], y[:37]
+    background = None if path_dependent else shap_explain.summarize_background(
+        X, 20, method="sample")
+
+    # giải thích cả X_test một lần
+    explainer = shap_explain.tree_explainer(model, background)
+    full = explainer(X_test)
+    values = full.values.mean(axis=2)
+    base_values = np.asarray(full.base_values).mean(axis=1)
+    expected = shap_explain.shap_explanation_frame(
+        model, X_test, y_test, explainer, shap.Explanation(values, base_values=base_values))
+
+    output_path = str(tmp_path / "shap.csv")
+    plot_values, X_plot = shap_explain.explain_in_chunks(
+        model, X_test, y_test, background, chunk_size=10, n_workers=n_workers,
+        output_path=output_path, max_plot_rows=15)
+
+    written = pd.read_csv(output_path)
+    assert list(written.columns) == list(expected.columns)
+    assert len(written) == len(X_test)
+    np.testing.assert_allclose(written.values.astype(float), expected.values.astype(float),
+                               rtol=1e-6, atol=1e-9)
+    # chỉ giữ max_plot_rows dòng đầu để vẽ
+    assert plot_values.shape == (15, X.shape[1])
+    np.testing.assert_allclose(plot_values.values, values[:15], rtol=1e-6, atol=1e-9)
+    np.testing.assert_array_equal(X_plot.values, X_test.values[:15])
+
+
+def test_kmeans_background_repeats_centroids_by_cluster_size():
+    rng = np.random.RandomState(0)
+    # one cluster three times the size of the other
+    X = pd.DataFrame(np.concatenate([rng.normal(0, 0.01, (300, 2)), rng.normal(10, 0.01, (100, 2))]),
+                     columns=["a", "b"])
+    background = shap_explain.summarize_background(X, background_size=8, method="kmeans")
+    assert len(background) == 8
+    assert (background["a"] < 5).sum() == 6